@@ -0,0 +1,181 @@
+"""
+计数器写缓冲（write-behind）
+
+浏览量等高频计数不在请求中同步 UPDATE，而是先在进程内累加，
+由后台线程定期（或某个计数累积到上限时）合并为批量 UPDATE：
+
+    UPDATE products SET view_count = view_count + CASE id WHEN 1 THEN 3 ... END
+    WHERE id IN (...)
+
+使用 F() 表达式在数据库端累加，多个进程（worker）各自刷新也不会丢失计数。
+后台刷新线程和进程退出前的刷新由 COUNTER_BACKGROUND_FLUSH 开启（运行测试时关闭，
+否则残留的增量会在测试数据库销毁后写入，或写入 settings 中配置的真实数据库）；关闭时需自行调用 flush()。
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, F, IntegerField, Value, When
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """
+    单个计数字段的写缓冲
+
+    model/field 指定要累加的模型字段，例如 CounterBuffer(Product, 'view_count')。
+    flush_interval：后台刷新间隔（秒）；max_delta：单个对象累积到该值时立即触发刷新；
+    on_flush：写入数据库后以本次写入的主键列表调用（如删除缓存了旧计数的详情缓存）。
+    """
+    batch_size = 500
+
+    def __init__(self, model, field, flush_interval=None, max_delta=None, on_flush=None):
+        self.model = model
+        self.field = field
+        self._flush_interval = flush_interval
+        self._max_delta = max_delta
+        self._on_flush = on_flush
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flushing = {}
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'COUNTER_FLUSH_INTERVAL', 10)
+
+    @property
+    def max_delta(self):
+        if self._max_delta is not None:
+            return self._max_delta
+        return getattr(settings, 'COUNTER_MAX_DELTA', 1000)
+
+    def incr(self, pk, delta=1):
+        """累加计数（不访问数据库）"""
+        self._ensure_thread()
+        with self._lock:
+            value = self._pending.get(pk, 0) + delta
+            self._pending[pk] = value
+        if abs(value) >= self.max_delta:
+            self._wakeup.set()
+
+    def discard(self):
+        """丢弃尚未写入数据库的增量（测试之间重置进程全局的缓冲）"""
+        with self._lock:
+            self._pending = {}
+            self._flushing = {}
+
+    def pending(self, pk):
+        """尚未写入数据库的增量（含正在写入、on_flush 尚未完成的部分）"""
+        return self._pending.get(pk, 0) + self._flushing.get(pk, 0)
+
+    def flush(self):
+        """把累积的增量批量写入数据库，返回写入的对象数"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushing = pending
+        if not pending:
+            return 0
+
+        items = list(pending.items())
+        try:
+            for start in range(0, len(items), self.batch_size):
+                self._apply(items[start:start + self.batch_size])
+        except Exception:
+            # 写入失败时把增量放回缓冲区，下次重试
+            with self._lock:
+                for pk, delta in items:
+                    self._pending[pk] = self._pending.get(pk, 0) + delta
+                self._flushing = {}
+            raise
+        try:
+            if self._on_flush is not None:
+                self._on_flush([pk for pk, _ in items])
+        finally:
+            # on_flush 完成前 pending() 仍计入这部分增量，读取方看到的计数不会回退
+            self._flushing = {}
+        return len(items)
+
+    def _apply(self, items):
+        whens = [When(pk=pk, then=Value(delta)) for pk, delta in items]
+        increment = Case(*whens, default=Value(0), output_field=IntegerField())
+        self.model.objects.filter(pk__in=[pk for pk, _ in items]).update(
+            **{self.field: F(self.field) + increment}
+        )
+
+    # 后台刷新线程
+
+    def _ensure_thread(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # fork 之后子进程不继承父进程的线程和未刷新的计数
+            self._pid = pid
+            self._pending = {}
+            self._flushing = {}
+            self._wakeup = threading.Event()
+            if not background_flush_enabled():
+                return
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f'counter-flush-{self.model._meta.db_table}.{self.field}',
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._safe_flush()
+
+    def _safe_flush(self):
+        close_old_connections()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('计数器刷新失败：%s.%s', self.model._meta.db_table, self.field)
+
+
+_buffers = []
+
+
+def background_flush_enabled():
+    return getattr(settings, 'COUNTER_BACKGROUND_FLUSH', True)
+
+
+def register(buffer):
+    """登记计数缓冲，进程退出前统一刷新"""
+    _buffers.append(buffer)
+    return buffer
+
+
+def flush_all():
+    """刷新所有已登记的计数缓冲"""
+    for buffer in _buffers:
+        buffer._safe_flush()
+
+
+def discard_all():
+    """丢弃所有已登记的计数缓冲中尚未写入的增量"""
+    for buffer in _buffers:
+        buffer.discard()
+
+
+def _flush_at_exit():
+    if background_flush_enabled():
+        flush_all()
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,175 @@
+"""
+媒体文件服务（MEDIA_ROOT）
+
+生产环境下图片不经过 Python 逐块读写：
+- MEDIA_SERVE_OFFLOAD = 'x-accel-redirect'：返回 X-Accel-Redirect，由 Nginx 内部 location 发送文件
+- MEDIA_SERVE_OFFLOAD = 'x-sendfile'：返回 X-Sendfile（Apache mod_xsendfile / lighttpd）
+- 未配置时返回 FileResponse，由 WSGI 服务器的 wsgi.file_wrapper（如 gunicorn）用 os.sendfile 零拷贝发送
+支持 ETag / Last-Modified 条件请求（304）和单段 Range 请求（206 / 416）；
+内容寻址文件使用一年的强缓存，其他文件使用 MEDIA_CACHE_MAX_AGE。
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from products.storage import IMMUTABLE_CACHE_CONTROL, is_content_addressed, is_immutable
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """
+    只读取文件 [start, start + length) 区间的文件对象
+
+    底层文件已定位到 start，并保留 fileno()：gunicorn 的 sendfile 从当前偏移量发送
+    Content-Length 个字节；不支持 sendfile 的服务器通过 read() 读取，同样只返回该区间。
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _resolve(path):
+    """URL 路径 -> 文件绝对路径，不允许访问隐藏目录和上传临时目录"""
+    path = posixpath.normpath(path).lstrip('/')
+    parts = path.split('/')
+    if any(part.startswith('.') for part in parts) or path.startswith('cas/tmp/'):
+        raise Http404
+    try:
+        return path, safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+
+
+def _etag(path, file_stat):
+    if is_content_addressed(path):
+        # 内容寻址文件名即内容哈希
+        return '"%s"' % os.path.splitext(posixpath.basename(path))[0]
+    return '"%x-%x"' % (file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def _parse_range(header, size):
+    """
+    解析单段 Range 头，返回 (start, end)（含 end）
+
+    未提供或格式不支持（如多段）时返回 None，按完整文件响应；
+    无法满足时返回 False（416）。
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N：最后 N 个字节
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    """If-Range 与当前文件一致时才返回部分内容"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+@require_safe
+def serve_media(request, path):
+    """媒体文件服务视图"""
+    path, full_path = _resolve(path)
+    try:
+        file_stat = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404
+
+    size = file_stat.st_size
+    last_modified = int(file_stat.st_mtime)
+    etag = _etag(path, file_stat)
+    cache_control = (
+        IMMUTABLE_CACHE_CONTROL if is_immutable(path)
+        else f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    )
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = cache_control
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return finish(conditional)
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    # 交给前端代理发送（代理自行处理 Range）
+    offload = settings.MEDIA_SERVE_OFFLOAD
+    if offload:
+        response = HttpResponse(content_type=content_type)
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + path
+        else:
+            response['X-Sendfile'] = full_path
+        return finish(response)
+
+    byte_range = None
+    if _if_range_matches(request, etag, last_modified):
+        byte_range = _parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return finish(response)
+
+    file = open(full_path, 'rb')
+    if byte_range:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(file, content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return finish(response)
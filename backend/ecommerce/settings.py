@@ -5,6 +5,7 @@ Django settings for ecommerce project.
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 # 加载环境变量
@@ -88,6 +89,36 @@ DATABASES = {
     }
 }
 
+# 缓存（默认进程内缓存；多进程部署时可通过环境变量切换为 Redis/Memcached 等共享缓存）
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# 商品详情缓存有效期（秒）
+PRODUCT_DETAIL_CACHE_TTL = int(os.getenv('PRODUCT_DETAIL_CACHE_TTL', '300'))
+
+# 商品分面：价格区间边界（元，逗号分隔）和全量刷新间隔（秒）
+PRODUCT_FACET_PRICE_BUCKETS = [int(edge) for edge in os.getenv('PRODUCT_FACET_PRICE_BUCKETS', '0,100,500,1000,5000').split(',')]
+PRODUCT_FACET_REFRESH_INTERVAL = int(os.getenv('PRODUCT_FACET_REFRESH_INTERVAL', '300'))
+
+# 订单待付款时限（秒）：下单时预留库存，超时未支付由 release_expired_holds 释放库存并取消订单
+ORDER_PAYMENT_TIMEOUT = int(os.getenv('ORDER_PAYMENT_TIMEOUT', '1800'))
+
+# 下单、加购请求的 Idempotency-Key 响应保存时间（秒），过期后由 purge_idempotency_keys 命令删除
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+
+# 未登录用户订单查询结果缓存有效期（秒），0 表示不缓存
+GUEST_ORDER_QUERY_CACHE_TTL = int(os.getenv('GUEST_ORDER_QUERY_CACHE_TTL', '30'))
+
+# 订单号生成：多主机部署时为每台主机设置不同的 ORDER_NO_HOST_ID（0-31），本机进程通过文件锁分配槽位；
+# 也可通过 ORDER_NO_WORKER_ID（0-1023）为每个进程直接指定全局唯一的工作进程 ID
+ORDER_NO_HOST_ID = int(os.getenv('ORDER_NO_HOST_ID', '0'))
+ORDER_NO_WORKER_ID = int(os.environ['ORDER_NO_WORKER_ID']) if os.getenv('ORDER_NO_WORKER_ID') else None
+ORDER_NO_LOCK_DIR = os.getenv('ORDER_NO_LOCK_DIR', '')
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -120,6 +151,10 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # Media files (用户上传的文件)
 MEDIA_URL = '/uploads/'
 MEDIA_ROOT = BASE_DIR / 'uploads'
+# 媒体文件发送方式：''（WSGI 服务器 sendfile）、'x-accel-redirect'（Nginx）、'x-sendfile'（Apache / lighttpd）
+MEDIA_SERVE_OFFLOAD = os.getenv('MEDIA_SERVE_OFFLOAD', '')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-uploads/')  # Nginx internal location
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', '3600'))  # 非内容寻址文件的缓存时间（秒）
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
@@ -161,3 +196,36 @@ JWT_EXPIRE_DAYS = int(os.getenv('JWT_EXPIRE_DAYS', '7'))
 # 文件上传配置
 FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('MAX_FILE_SIZE', '5242880'))  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = FILE_UPLOAD_MAX_MEMORY_SIZE
+# 图片字段流式写入内容寻址存储（校验格式、尺寸、大小），其他文件使用默认处理器
+FILE_UPLOAD_HANDLERS = [
+    'products.uploadhandlers.ImageUploadHandler',
+    'products.uploadhandlers.MemoryFileUploadHandler',
+    'products.uploadhandlers.TemporaryFileUploadHandler',
+]
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('IMAGE_UPLOAD_MAX_SIZE', str(FILE_UPLOAD_MAX_MEMORY_SIZE)))  # 单张图片上限
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', '40000000'))  # 单张图片像素上限（防解压炸弹）
+IMAGE_UPLOAD_WORKERS = int(os.getenv('IMAGE_UPLOAD_WORKERS', '4'))  # 多图上传并发校验、保存的线程数
+
+# 断点续传上传配置
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', '86400'))  # 会话无新分片后的过期时间（秒）
+UPLOAD_SESSION_MAX_SIZE = int(os.getenv('UPLOAD_SESSION_MAX_SIZE', str(20 * 1024 * 1024)))  # 单个文件大小上限
+UPLOAD_CHUNK_MAX_SIZE = int(os.getenv('UPLOAD_CHUNK_MAX_SIZE', str(2 * 1024 * 1024)))  # 单个分片大小上限
+
+# 计数器写缓冲配置（浏览量等）
+COUNTER_FLUSH_INTERVAL = float(os.getenv('COUNTER_FLUSH_INTERVAL', '10'))  # 刷新间隔（秒）
+COUNTER_MAX_DELTA = int(os.getenv('COUNTER_MAX_DELTA', '1000'))  # 单个对象累积到该值立即刷新
+# 后台刷新线程和进程退出前刷新（运行测试时默认关闭）
+COUNTER_BACKGROUND_FLUSH = os.getenv(
+    'COUNTER_BACKGROUND_FLUSH', 'False' if sys.argv[1:2] == ['test'] else 'True'
+) == 'True'
+
+# 商品图片衍生图（缩略图等）配置
+IMAGE_DERIVATIVE_SIZES = {  # 名称 -> 最长边像素
+    'thumbnail': 200,
+    'medium': 600,
+    'large': 1200,
+}
+IMAGE_DERIVATIVE_FORMATS = ['webp', 'jpeg']  # WebP + JPEG 兼容格式
+IMAGE_DERIVATIVE_QUALITY = int(os.getenv('IMAGE_DERIVATIVE_QUALITY', '82'))
+IMAGE_DERIVATIVE_WORKERS = int(os.getenv('IMAGE_DERIVATIVE_WORKERS', '2'))  # 进程池大小，0 表示同步生成
+IMAGE_DERIVATIVE_MAX_PENDING = int(os.getenv('IMAGE_DERIVATIVE_MAX_PENDING', '100'))  # 排队任务上限
@@ -1,12 +1,14 @@
 """
 URL configuration for ecommerce project.
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
+from .media import serve_media
 
 # 设置 Django Admin 站点名称
 admin.site.site_header = '黄石小店管理后台'
@@ -40,8 +42,6 @@ urlpatterns = [
     path('api/v1/', include('products.urls')),
     path('api/v1/', include('orders.urls')),
     # path('api/v1/admin/', include('admins.urls')),  # 管理后台 API 后续添加
+    # 媒体文件服务（生产环境可配置由 Nginx 等前端代理发送）
+    re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.+)$', serve_media, name='media'),
 ]
-
-# 开发环境：提供媒体文件服务
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Order, OrderItem, CartItem
+from . import inventory
+from .models import Order, OrderItem, CartItem, InventoryHold, IdempotencyKey, UserOrderStats
 
 
 class OrderItemInline(admin.TabularInline):
@@ -13,9 +14,15 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'order_no', 'user', 'status', 'pay_amount', 'receiver_name', 'receiver_phone', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['order_no', 'receiver_name', 'receiver_phone']
-    readonly_fields = ['order_no', 'created_at', 'updated_at']
+    readonly_fields = ['order_no', 'item_count', 'items_preview', 'created_at', 'updated_at']
     inlines = [OrderItemInline]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # 直接修改订单状态时，按新状态确认或释放库存预留
+        if change and 'status' in form.changed_data:
+            inventory.settle_holds([obj.id])
+
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -29,3 +36,22 @@ class CartItemAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'product', 'quantity', 'created_at']
     list_filter = ['created_at']
     search_fields = ['user__username', 'product__name']
+
+
+@admin.register(InventoryHold)
+class InventoryHoldAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order', 'product', 'quantity', 'status', 'expires_at', 'created_at']
+    list_filter = ['status']
+    raw_id_fields = ['order', 'product']
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'status_code', 'expires_at', 'created_at']
+    list_filter = ['status_code']
+
+
+@admin.register(UserOrderStats)
+class UserOrderStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'pending_payment', 'pending_shipment', 'pending_receipt', 'completed', 'cancelled', 'updated_at']
+    raw_id_fields = ['user']
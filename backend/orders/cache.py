@@ -0,0 +1,67 @@
+"""
+订单相关缓存
+
+未登录用户订单查询缓存：按规范化后的查询条件（订单号、手机号）和分页参数缓存响应数据，
+有效期很短（GUEST_ORDER_QUERY_CACHE_TTL）；只缓存查询成功的结果。
+每个订单号、手机号在共享缓存中有一个版本号，缓存键包含查询条件对应的版本号；
+下单、订单状态变化（支付、取消、修改状态）提交后递增版本号，该订单号 / 手机号的所有查询缓存随之失效。
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+# 版本号最后一次递增后的保留时间（秒），远大于查询缓存有效期
+GUEST_QUERY_VERSION_TIMEOUT = 86400
+
+
+def _version_keys(order_no, receiver_phone):
+    keys = []
+    if order_no:
+        keys.append(f'orders:guest_query:version:order_no:{order_no}')
+    if receiver_phone:
+        keys.append(f'orders:guest_query:version:phone:{receiver_phone}')
+    return keys
+
+
+def guest_query_key(order_no, receiver_phone, params):
+    """
+    未登录用户订单查询的缓存键（含当前版本号）
+
+    需在查询数据库之前取得，查询结果用同一个键写入：查询期间订单发生变化时版本号已递增，
+    写入的结果不会被之后的请求读到。
+    """
+    versions = cache.get_many(_version_keys(order_no, receiver_phone))
+    raw = json.dumps(
+        [order_no, receiver_phone, sorted(params.items()), sorted(versions.items())], ensure_ascii=False
+    )
+    return f'orders:guest_query:{hashlib.sha1(raw.encode("utf-8")).hexdigest()}'
+
+
+def get_guest_query(key):
+    """读取未登录用户订单查询缓存，未命中返回 None"""
+    return cache.get(key)
+
+
+def set_guest_query(key, data):
+    """写入未登录用户订单查询缓存"""
+    timeout = getattr(settings, 'GUEST_ORDER_QUERY_CACHE_TTL', 30)
+    if timeout > 0:
+        cache.set(key, data, timeout=timeout)
+
+
+def invalidate_guest_queries(orders):
+    """递增订单号、手机号的版本号，orders 为 (订单号, 手机号) 列表；应在事务提交后调用"""
+    keys = set()
+    for order_no, receiver_phone in orders:
+        keys.update(_version_keys(order_no, receiver_phone))
+    for key in keys:
+        cache.add(key, 0, timeout=GUEST_QUERY_VERSION_TIMEOUT)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # 在 add 与 incr 之间被淘汰
+            cache.set(key, 1, timeout=GUEST_QUERY_VERSION_TIMEOUT)
+        else:
+            cache.touch(key, GUEST_QUERY_VERSION_TIMEOUT)
@@ -0,0 +1,226 @@
+"""
+下单扣库存、取消回补库存
+
+商品的 stock 为可售库存（已扣除未支付订单的预留），列表、详情、分面直接使用，无需关联预留表。
+下单时同时写入库存预留（InventoryHold），超时未支付由 orders.inventory 释放并回补库存。
+
+整个下单过程的查询数与商品行数无关：
+1. SELECT ... FOR UPDATE 一次锁定所有商品（按 id 排序加锁，并发下单不会互相死锁）
+2. 插入订单，bulk_create 一次插入所有订单商品
+3. 一条 UPDATE 按商品扣减库存、增加销量：
+       UPDATE products SET stock = stock - CASE id WHEN 1 THEN 2 ... END, ...
+       WHERE (id = 1 AND stock >= 2) OR ...
+   条件扣减兜底：即使数据库不支持行锁，也不会把库存扣成负数（更新行数不足时整单回滚）
+4. 同样一条 UPDATE 同步商品列表投影的库存和销量
+5. bulk_create 一次写入所有库存预留
+登录用户下单时另外更新其订单状态计数（见 orders.stats）。
+秒杀等热点商品（stock_stripes > 0）不锁商品行，最后在库存分桶上扣减（见 products.stock）。
+"""
+from functools import partial
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from products import stock
+from products.cache import invalidate_product_details
+from products.counters import add_sales
+from products.facets import facet_index
+from products.models import Product, ProductListing
+from . import cache as order_cache, stats
+from .models import InventoryHold, Order, OrderItem
+
+# 订单列表摘要中预览的商品数
+ITEMS_PREVIEW_LENGTH = 3
+
+
+class CheckoutError(Exception):
+    """下单失败（商品不存在、已下架或库存不足），message 可直接返回给客户端"""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def merge_items(items):
+    """合并同一商品的多行，返回 {商品ID: 数量}（保持提交顺序）"""
+    quantities = {}
+    for item in items:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    return quantities
+
+
+def _per_product(quantities):
+    """按商品取数量的 CASE 表达式"""
+    return Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def decrement_stock(quantities):
+    """
+    扣减库存、增加销量（库存不足的商品不更新），返回实际更新的商品数
+
+    调用方需在事务中执行，更新数小于商品数时应回滚。
+    """
+    enough_stock = Q()
+    for product_id, quantity in quantities.items():
+        enough_stock |= Q(id=product_id, stock__gte=quantity)
+    delta = _per_product(quantities)
+    updated = Product.objects.filter(enough_stock).update(
+        stock=F('stock') - delta,
+        sales_count=F('sales_count') + delta,
+    )
+    # 批量 UPDATE 不触发信号，列表投影在此同步
+    ProductListing.objects.filter(id__in=list(quantities)).update(
+        stock=F('stock') - delta,
+        sales_count=F('sales_count') + delta,
+    )
+    return updated
+
+
+def restock(quantities, striped=None):
+    """
+    回补库存、扣回销量（取消订单、释放预留时调用）
+
+    striped 为其中分桶商品的 {商品ID: 分桶数}，未提供时查询。
+    """
+    if not quantities:
+        return
+    quantities = dict(quantities)
+    # 分桶商品回补到各桶
+    if striped is None:
+        striped = dict(
+            Product.objects.filter(id__in=list(quantities), stock_stripes__gt=0).values_list('id', 'stock_stripes')
+        )
+    for product_id, stripes in striped.items():
+        quantity = quantities.pop(product_id)
+        stock.give_back(product_id, quantity, stripes)
+        transaction.on_commit(partial(add_sales, product_id, -quantity))
+    if not quantities:
+        return
+
+    delta = _per_product(quantities)
+    Product.objects.filter(id__in=list(quantities)).update(
+        stock=F('stock') + delta,
+        sales_count=F('sales_count') - delta,
+    )
+    ProductListing.objects.filter(id__in=list(quantities)).update(
+        stock=F('stock') + delta,
+        sales_count=F('sales_count') - delta,
+    )
+    transaction.on_commit(partial(invalidate_product_details, list(quantities)))
+    # 无货 -> 有货需要调整分面计数，此处不再查询原库存，下次查询时全量重建
+    transaction.on_commit(facet_index.invalidate)
+
+
+def _refresh_derived(products, quantities):
+    """事务提交后删除详情缓存、更新分面计数（有货 -> 无货）"""
+    transaction.on_commit(partial(invalidate_product_details, list(quantities)))
+    for product in products:
+        old_state = facet_index.state_of(product.status, product.category_id, product.price, product.stock)
+        new_state = facet_index.state_of(
+            product.status, product.category_id, product.price, product.stock - quantities[product.id]
+        )
+        if old_state != new_state:
+            transaction.on_commit(partial(facet_index.apply, old_state, new_state))
+
+
+@transaction.atomic
+def place_order(order_no, items, user_id=None, **order_fields):
+    """
+    创建订单并扣减库存，返回订单
+
+    items 为 [{'product_id', 'quantity'}]，order_fields 为收货信息等订单字段；
+    失败时抛出 CheckoutError，订单和库存均不写入。
+    """
+    quantities = merge_items(items)
+    fields = ('id', 'name', 'main_image_url', 'price', 'stock', 'stock_stripes', 'status', 'category_id')
+    # 普通商品加行锁；分桶商品不锁商品行，库存在各桶上条件扣减
+    products = list(
+        Product.objects.select_for_update()
+        .filter(id__in=list(quantities), status=1, stock_stripes=0)
+        .only(*fields)
+        .order_by('id')
+    )
+    products_by_id = {product.id: product for product in products}
+    if len(products_by_id) < len(quantities):
+        striped = Product.objects.filter(
+            id__in=[product_id for product_id in quantities if product_id not in products_by_id],
+            status=1,
+            stock_stripes__gt=0,
+        ).only(*fields)
+        products_by_id.update((product.id, product) for product in striped)
+
+    for product_id, quantity in quantities.items():
+        product = products_by_id.get(product_id)
+        if product is None:
+            raise CheckoutError(f'商品 {product_id} 不存在或已下架')
+        if not product.stock_stripes and product.stock < quantity:
+            raise CheckoutError(f'商品 {product.name} 库存不足')
+
+    # 计算订单金额（运费暂为 0）
+    total_amount = sum(products_by_id[product_id].price * quantity for product_id, quantity in quantities.items())
+    freight_amount = 0
+    preview = [
+        {
+            'product_id': product_id,
+            'product_name': products_by_id[product_id].name,
+            'product_image': products_by_id[product_id].main_image_url,
+            'price': str(products_by_id[product_id].price),
+            'quantity': quantity,
+        }
+        for product_id, quantity in list(quantities.items())[:ITEMS_PREVIEW_LENGTH]
+    ]
+    order = Order.objects.create(
+        order_no=order_no,
+        user_id=user_id,
+        status=1,  # 待付款
+        total_amount=total_amount,
+        freight_amount=freight_amount,
+        pay_amount=total_amount + freight_amount,
+        item_count=len(quantities),
+        items_preview=preview,
+        **order_fields,
+    )
+    stats.record([(user_id, None, order.status)])
+    # 按手机号查询的缓存结果中没有新订单
+    transaction.on_commit(partial(order_cache.invalidate_guest_queries, [(None, order.receiver_phone)]))
+
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product=products_by_id[product_id],
+            product_name=products_by_id[product_id].name,
+            product_image=products_by_id[product_id].main_image_url,
+            price=products_by_id[product_id].price,
+            quantity=quantity,
+            total_amount=products_by_id[product_id].price * quantity,
+        )
+        for product_id, quantity in quantities.items()
+    ])
+
+    # 预留库存，超时未支付时释放
+    expires_at = timezone.now() + timedelta(seconds=settings.ORDER_PAYMENT_TIMEOUT)
+    InventoryHold.objects.bulk_create([
+        InventoryHold(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+
+    normal = {product.id: quantities[product.id] for product in products}
+    if normal and decrement_stock(normal) != len(normal):
+        # 行锁下不会发生；不支持行锁的数据库上由条件扣减兜底
+        raise CheckoutError('商品库存不足')
+    _refresh_derived(products, normal)
+
+    # 分桶商品最后扣减，缩短桶的行锁持有时间；按商品 ID 顺序加锁
+    for product_id in sorted(set(quantities) - set(normal)):
+        if not stock.take(product_id, quantities[product_id]):
+            raise CheckoutError(f'商品 {products_by_id[product_id].name} 库存不足')
+        transaction.on_commit(partial(add_sales, product_id, quantities[product_id]))
+    return order
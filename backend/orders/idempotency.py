@@ -0,0 +1,141 @@
+"""
+幂等键（Idempotency-Key）
+
+移动端超时后会重试 POST /orders/、/cart/add/。请求头带 Idempotency-Key 时：
+- 首次请求在同一个事务内先插入幂等键、再执行业务写入、最后保存响应，一起提交；
+  响应在 IDEMPOTENCY_KEY_TTL 秒内有效
+- 重试请求直接返回保存的响应（响应头 Idempotency-Replayed: true），不再经过下单 / 加购的写入路径
+- 并发的重复请求插入同一个主键时，数据库会阻塞到首次请求的事务结束（唯一索引冲突等待），
+  提交后返回其响应；首次请求失败回滚（异常或 5xx）时重复请求接着正常执行
+- 同一个键用于不同的请求参数时返回 422
+- 过期的键由 purge_idempotency_keys 命令分批删除
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+
+def _digest(*parts):
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _record_key(scope, request, key):
+    """幂等键按接口和用户隔离"""
+    user = getattr(request, 'user', None)
+    owner = f'user:{user.id}' if user is not None and user.is_authenticated else 'anonymous'
+    return _digest(scope, owner, key)
+
+
+def _request_hash(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    return _digest(request.method, request.path, json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder))
+
+
+def _error(code, message):
+    return Response({
+        'code': code,
+        'message': message,
+        'data': None,
+        'timestamp': None
+    }, status=code)
+
+
+def _claim(record_key, request_hash):
+    """插入幂等键（需在事务中调用），已存在时返回 False"""
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                key=record_key,
+                request_hash=request_hash,
+                status_code=0,
+                expires_at=timezone.now() + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400)),
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def _replay(record, request_hash):
+    if record.request_hash != request_hash:
+        return _error(status.HTTP_422_UNPROCESSABLE_ENTITY, 'Idempotency-Key 已用于不同的请求')
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotency-Replayed'] = 'true'
+    return response
+
+
+def idempotent(scope):
+    """
+    视图方法装饰器：支持 Idempotency-Key 请求头
+
+    scope 区分不同接口；放在 transaction.atomic 等装饰器外层。
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.META.get(HEADER)
+            if not key:
+                return view_method(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return _error(status.HTTP_400_BAD_REQUEST, f'Idempotency-Key 不能超过 {MAX_KEY_LENGTH} 个字符')
+
+            record_key = _record_key(scope, request, key)
+            request_hash = _request_hash(request)
+            # 第二次循环：已有的键刚过期被删除，或首次请求已回滚
+            for _ in range(2):
+                with transaction.atomic():
+                    if _claim(record_key, request_hash):
+                        response = view_method(self, request, *args, **kwargs)
+                        if response.status_code >= 500:
+                            # 服务端错误不保存，回滚后允许客户端重试
+                            transaction.set_rollback(True)
+                            return response
+                        IdempotencyKey.objects.filter(key=record_key).update(
+                            status_code=response.status_code, response_body=response.data
+                        )
+                        return response
+
+                # 插入冲突时数据库已等待首次请求的事务结束，这里读到的是已提交的响应
+                record = IdempotencyKey.objects.filter(key=record_key).first()
+                if record is None:
+                    continue
+                if record.expires_at <= timezone.now():
+                    IdempotencyKey.objects.filter(key=record_key, expires_at__lte=timezone.now()).delete()
+                    continue
+                return _replay(record, request_hash)
+            return _error(status.HTTP_409_CONFLICT, '相同 Idempotency-Key 的请求正在处理，请稍后重试')
+        return wrapper
+    return decorator
+
+
+def purge_expired(batch_size=1000, progress=None):
+    """分批删除过期的幂等键，返回删除数量（每批一个短事务，按主键删除）"""
+    now = timezone.now()
+    deleted = 0
+    while True:
+        keys = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now).order_by('expires_at')
+            .values_list('key', flat=True)[:batch_size]
+        )
+        if not keys:
+            break
+        deleted += IdempotencyKey.objects.filter(key__in=keys, expires_at__lte=now).delete()[0]
+        if progress:
+            progress(deleted)
+        if len(keys) < batch_size:
+            break
+    return deleted
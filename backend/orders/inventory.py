@@ -0,0 +1,156 @@
+"""
+库存预留（待付款订单）
+
+- 下单：扣减可售库存并写入预留（见 orders.checkout.place_order），预留在 ORDER_PAYMENT_TIMEOUT 后过期
+- 支付：订单 待付款 -> 其他状态 时确认预留，库存不再回补
+- 取消：释放预留并回补库存（已确认的预留同样回补）
+- 回收：release_expired 按批处理过期预留，每批固定几条 SQL（与订单数无关）：
+  查找过期预留、锁定并取消仍待付款的订单、按商品汇总释放数量、一条 UPDATE 回补库存
+- 订单经其他途径（如后台管理修改状态）离开待付款状态时，settle_holds 按订单当前状态确认或释放预留；
+  release_expired 对过期预留所属的非待付款订单同样调用，避免预留一直计入 reserved_quantities
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import cache as order_cache, stats
+from .checkout import restock
+from .models import InventoryHold, Order
+
+STATUS_PENDING_PAYMENT = 1
+STATUS_CANCELLED = 5
+# 可以取消（并回补库存）的订单状态：待付款、待发货
+CANCELLABLE_STATUSES = (1, 2)
+
+
+def reserved_quantities(product_ids):
+    """商品当前被未支付订单预留的数量 {商品ID: 数量}（实物库存 = stock + 预留数量）"""
+    rows = (
+        InventoryHold.objects.filter(product_id__in=list(product_ids), status=InventoryHold.STATUS_HELD)
+        .values('product_id')
+        .annotate(quantity=Sum('quantity'))
+        .order_by()
+    )
+    return {row['product_id']: row['quantity'] for row in rows}
+
+
+@transaction.atomic
+def confirm_payment(order_id, new_status):
+    """
+    待付款订单支付后确认预留，返回是否成功
+
+    条件更新：订单已被回收任务超时取消时返回 False。
+    """
+    updated = Order.objects.filter(id=order_id, status=STATUS_PENDING_PAYMENT).update(
+        status=new_status, updated_at=timezone.now()
+    )
+    if not updated:
+        return False
+    user_id, order_no, receiver_phone = (
+        Order.objects.filter(id=order_id).values_list('user_id', 'order_no', 'receiver_phone').first()
+    )
+    stats.record([(user_id, STATUS_PENDING_PAYMENT, new_status)])
+    transaction.on_commit(partial(order_cache.invalidate_guest_queries, [(order_no, receiver_phone)]))
+    InventoryHold.objects.filter(order_id=order_id, status=InventoryHold.STATUS_HELD).update(
+        status=InventoryHold.STATUS_CONFIRMED, updated_at=timezone.now()
+    )
+    return True
+
+
+def _release_holds(order_ids):
+    """释放订单的预留并回补库存"""
+    holds = InventoryHold.objects.filter(
+        order_id__in=order_ids, status__in=[InventoryHold.STATUS_HELD, InventoryHold.STATUS_CONFIRMED]
+    )
+    rows = list(holds.values('product_id', 'product__stock_stripes').annotate(quantity=Sum('quantity')).order_by())
+    holds.update(status=InventoryHold.STATUS_RELEASED, updated_at=timezone.now())
+    restock(
+        {row['product_id']: row['quantity'] for row in rows},
+        striped={row['product_id']: row['product__stock_stripes'] for row in rows if row['product__stock_stripes']},
+    )
+
+
+@transaction.atomic
+def cancel_orders(order_ids, statuses=CANCELLABLE_STATUSES):
+    """
+    取消订单并回补库存，返回实际取消的订单 ID 列表
+
+    只处理状态在 statuses 中的订单；正在被其他事务处理（如支付）的订单跳过，下次再处理。
+    """
+    rows = list(
+        Order.objects.select_for_update(skip_locked=True)
+        .filter(id__in=list(order_ids), status__in=statuses)
+        .order_by('id')
+        .values_list('id', 'user_id', 'status', 'order_no', 'receiver_phone')
+    )
+    if not rows:
+        return []
+    order_ids = [row[0] for row in rows]
+    Order.objects.filter(id__in=order_ids).update(status=STATUS_CANCELLED, updated_at=timezone.now())
+    stats.record([(user_id, status, STATUS_CANCELLED) for _, user_id, status, _, _ in rows])
+    _release_holds(order_ids)
+    transaction.on_commit(partial(
+        order_cache.invalidate_guest_queries, [(order_no, phone) for _, _, _, order_no, phone in rows]
+    ))
+    return order_ids
+
+
+@transaction.atomic
+def settle_holds(order_ids):
+    """
+    按订单当前状态结束其预留，返回处理的订单 ID 列表
+
+    已取消的订单释放预留并回补库存，其他状态视为已支付、确认预留；仍待付款的订单不处理。
+    """
+    rows = list(
+        Order.objects.select_for_update(skip_locked=True)
+        .filter(id__in=list(order_ids))
+        .exclude(status=STATUS_PENDING_PAYMENT)
+        .order_by('id')
+        .values_list('id', 'status')
+    )
+    cancelled = [order_id for order_id, status in rows if status == STATUS_CANCELLED]
+    paid = [order_id for order_id, status in rows if status != STATUS_CANCELLED]
+    if cancelled:
+        _release_holds(cancelled)
+    if paid:
+        InventoryHold.objects.filter(order_id__in=paid, status=InventoryHold.STATUS_HELD).update(
+            status=InventoryHold.STATUS_CONFIRMED, updated_at=timezone.now()
+        )
+    return [order_id for order_id, _ in rows]
+
+
+def release_expired(batch_size=1000, max_batches=None, progress=None):
+    """
+    释放过期预留并取消仍待付款的订单，返回 (取消订单数, 处理预留数)
+
+    过期预留所属订单已不是待付款时，按订单状态确认或释放预留（见 settle_holds）。
+
+    按预留 id 顺序分批处理，每批一个事务；max_batches 限制本次处理的批数。
+    """
+    now = timezone.now()
+    last_id = 0
+    cancelled = scanned = batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = list(
+            InventoryHold.objects.filter(status=InventoryHold.STATUS_HELD, expires_at__lte=now, id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'order_id')[:batch_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        order_ids = {order_id for _, order_id in rows}
+        cancelled_ids = cancel_orders(order_ids, statuses=[STATUS_PENDING_PAYMENT])
+        cancelled += len(cancelled_ids)
+        # 订单已不是待付款（经其他途径修改了状态），预留却仍未结束
+        remaining = order_ids.difference(cancelled_ids)
+        if remaining:
+            settle_holds(remaining)
+        scanned += len(rows)
+        batches += 1
+        if progress:
+            progress(cancelled, scanned)
+    return cancelled, scanned
@@ -0,0 +1,22 @@
+"""
+分批删除过期的幂等键（可定时执行，如每小时）
+
+用法：python manage.py purge_idempotency_keys [--batch-size 1000]
+"""
+from django.core.management.base import BaseCommand
+
+from orders import idempotency
+
+
+class Command(BaseCommand):
+    help = '分批删除过期的 Idempotency-Key 记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批删除的数量')
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge_expired(
+            batch_size=options['batch_size'],
+            progress=lambda deleted: self.stdout.write(f'已删除 {deleted} 条'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'删除过期幂等键 {deleted} 条'))
@@ -0,0 +1,19 @@
+"""
+按订单表重算用户各状态订单数（后台直接修改订单状态后校正"我的订单"角标）
+
+用法：python manage.py rebuild_order_stats [--user 用户ID ...]
+"""
+from django.core.management.base import BaseCommand
+
+from orders import stats
+
+
+class Command(BaseCommand):
+    help = '按订单表重算 user_order_stats 中的用户各状态订单数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, nargs='+', dest='user_ids', default=None, help='只重算这些用户')
+
+    def handle(self, *args, **options):
+        count = stats.rebuild(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'已重算 {count} 个用户的订单状态计数'))
@@ -0,0 +1,24 @@
+"""
+释放超时未支付订单的库存预留并取消订单（可定时执行，如每分钟）
+
+用法：python manage.py release_expired_holds [--batch-size 1000] [--max-batches N]
+"""
+from django.core.management.base import BaseCommand
+
+from orders import inventory
+
+
+class Command(BaseCommand):
+    help = '释放过期的库存预留，回补库存并取消超时未支付的订单'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批处理的预留数量')
+        parser.add_argument('--max-batches', type=int, default=None, help='本次最多处理的批数')
+
+    def handle(self, *args, **options):
+        cancelled, scanned = inventory.release_expired(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            progress=lambda cancelled, scanned: self.stdout.write(f'已处理 {scanned} 条预留，取消 {cancelled} 个订单'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'处理过期预留 {scanned} 条，取消超时订单 {cancelled} 个'))
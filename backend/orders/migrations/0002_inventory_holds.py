@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+        ('products', '0007_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='数量')),
+                ('status', models.IntegerField(choices=[(0, '预留中'), (1, '已确认'), (2, '已释放')], default=0, verbose_name='状态')),
+                ('expires_at', models.DateTimeField(verbose_name='过期时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='orders.order', verbose_name='订单')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='products.product', verbose_name='商品')),
+            ],
+            options={
+                'verbose_name': '库存预留',
+                'verbose_name_plural': '库存预留',
+                'db_table': 'inventory_holds',
+                'indexes': [models.Index(fields=['order'], name='inventory_h_order_i_401297_idx'), models.Index(fields=['status', 'expires_at'], name='inventory_h_status_882892_idx'), models.Index(fields=['product', 'status'], name='inventory_h_product_490277_idx')],
+            },
+        ),
+    ]
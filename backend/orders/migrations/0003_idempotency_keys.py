@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:56
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_inventory_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('key', models.CharField(help_text='SHA-256(接口 + 用户 + 客户端 Idempotency-Key)', max_length=64, primary_key=True, serialize=False, verbose_name='键')),
+                ('request_hash', models.CharField(help_text='同一个键只能用于相同的请求参数', max_length=64, verbose_name='请求摘要')),
+                ('status_code', models.IntegerField(verbose_name='响应状态码')),
+                ('response_body', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='响应内容')),
+                ('expires_at', models.DateTimeField(verbose_name='过期时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '幂等键',
+                'verbose_name_plural': '幂等键',
+                'db_table': 'idempotency_keys',
+                'indexes': [models.Index(fields=['expires_at'], name='idempotency_expires_6c9d28_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_idempotency_keys'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='orders_receive_3767b5_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['receiver_phone', 'created_at'], name='orders_receive_a9f541_idx'),
+        ),
+    ]
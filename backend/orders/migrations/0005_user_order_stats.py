@@ -0,0 +1,94 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:59
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+STATUS_FIELDS = {1: 'pending_payment', 2: 'pending_shipment', 3: 'pending_receipt', 4: 'completed', 5: 'cancelled'}
+ITEMS_PREVIEW_LENGTH = 3
+
+
+def populate(apps, schema_editor):
+    """按现有订单填充用户状态计数、订单商品预览"""
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    UserOrderStats = apps.get_model('orders', 'UserOrderStats')
+
+    rows = {}
+    counts = Order.objects.filter(user_id__isnull=False).values_list('user_id', 'status').annotate(count=Count('id')).order_by()
+    for user_id, status, count in counts:
+        rows.setdefault(user_id, UserOrderStats(user_id=user_id))
+        setattr(rows[user_id], STATUS_FIELDS[status], count)
+    UserOrderStats.objects.bulk_create(rows.values(), batch_size=1000)
+
+    last_id = 0
+    while True:
+        orders = list(Order.objects.filter(id__gt=last_id).order_by('id').only('id')[:1000])
+        if not orders:
+            break
+        last_id = orders[-1].id
+        items = {}
+        for item in OrderItem.objects.filter(order_id__in=[order.id for order in orders]).order_by('id'):
+            items.setdefault(item.order_id, []).append(item)
+        for order in orders:
+            order_items = items.get(order.id, [])
+            order.item_count = len(order_items)
+            order.items_preview = [
+                {
+                    'product_id': item.product_id,
+                    'product_name': item.product_name,
+                    'product_image': item.product_image,
+                    'price': str(item.price),
+                    'quantity': item.quantity,
+                }
+                for item in order_items[:ITEMS_PREVIEW_LENGTH]
+            ]
+        Order.objects.bulk_update(orders, ['item_count', 'items_preview'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_guest_lookup_index'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserOrderStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_stats', serialize=False, to='users.user', verbose_name='用户')),
+                ('pending_payment', models.IntegerField(default=0, verbose_name='待付款')),
+                ('pending_shipment', models.IntegerField(default=0, verbose_name='待发货')),
+                ('pending_receipt', models.IntegerField(default=0, verbose_name='待收货')),
+                ('completed', models.IntegerField(default=0, verbose_name='已完成')),
+                ('cancelled', models.IntegerField(default=0, verbose_name='已取消')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '用户订单统计',
+                'verbose_name_plural': '用户订单统计',
+                'db_table': 'user_order_stats',
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='orders_user_id_4e08b8_idx',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='商品种数'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items_preview',
+            field=models.JSONField(blank=True, default=list, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='前几个订单商品（商品ID、名称、图片、单价、数量），订单列表摘要使用', verbose_name='商品预览'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='orders_user_id_51663a_idx'),
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from users.models import User
 from products.models import Product
@@ -24,6 +25,8 @@ class Order(models.Model):
     receiver_phone = models.CharField(max_length=20, verbose_name='收货电话')
     receiver_address = models.CharField(max_length=500, verbose_name='收货地址')
     remark = models.CharField(max_length=500, null=True, blank=True, verbose_name='订单备注')
+    item_count = models.PositiveIntegerField(default=0, verbose_name='商品种数')
+    items_preview = models.JSONField(encoder=DjangoJSONEncoder, default=list, blank=True, verbose_name='商品预览', help_text='前几个订单商品（商品ID、名称、图片、单价、数量），订单列表摘要使用')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
 
@@ -32,11 +35,11 @@ class Order(models.Model):
         verbose_name = '订单'
         verbose_name_plural = '订单'
         indexes = [
-            models.Index(fields=['user']),
+            models.Index(fields=['user', 'created_at']),  # 用于"我的订单"按时间翻页
             models.Index(fields=['order_no']),
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
-            models.Index(fields=['receiver_phone']),  # 用于未登录用户查询订单
+            models.Index(fields=['receiver_phone', 'created_at']),  # 用于未登录用户按手机号查询订单（按时间翻页）
         ]
 
     def __str__(self):
@@ -85,3 +88,76 @@ class CartItem(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
+
+
+class InventoryHold(models.Model):
+    """库存预留表（下单时预留，支付后确认，超时未支付由回收任务释放并取消订单）"""
+    STATUS_HELD = 0
+    STATUS_CONFIRMED = 1
+    STATUS_RELEASED = 2
+    STATUS_CHOICES = [
+        (STATUS_HELD, '预留中'),
+        (STATUS_CONFIRMED, '已确认'),
+        (STATUS_RELEASED, '已释放'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='holds', verbose_name='订单')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds', verbose_name='商品')
+    quantity = models.IntegerField(verbose_name='数量')
+    status = models.IntegerField(default=STATUS_HELD, choices=STATUS_CHOICES, verbose_name='状态')
+    expires_at = models.DateTimeField(verbose_name='过期时间')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'inventory_holds'
+        verbose_name = '库存预留'
+        verbose_name_plural = '库存预留'
+        indexes = [
+            models.Index(fields=['order']),
+            models.Index(fields=['status', 'expires_at']),  # 回收任务查找过期预留
+            models.Index(fields=['product', 'status']),  # 统计商品预留数量
+        ]
+
+    def __str__(self):
+        return f"{self.order_id} - {self.product_id} x {self.quantity}"
+
+
+class IdempotencyKey(models.Model):
+    """幂等键（客户端带 Idempotency-Key 重试下单、加购时直接返回首次请求的响应）"""
+    key = models.CharField(max_length=64, primary_key=True, verbose_name='键', help_text='SHA-256(接口 + 用户 + 客户端 Idempotency-Key)')
+    request_hash = models.CharField(max_length=64, verbose_name='请求摘要', help_text='同一个键只能用于相同的请求参数')
+    status_code = models.IntegerField(verbose_name='响应状态码')
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True, verbose_name='响应内容')
+    expires_at = models.DateTimeField(verbose_name='过期时间')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        verbose_name = '幂等键'
+        verbose_name_plural = '幂等键'
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class UserOrderStats(models.Model):
+    """用户各状态订单数（"我的订单"角标，下单和修改订单状态时增量维护）"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='order_stats', verbose_name='用户')
+    pending_payment = models.IntegerField(default=0, verbose_name='待付款')
+    pending_shipment = models.IntegerField(default=0, verbose_name='待发货')
+    pending_receipt = models.IntegerField(default=0, verbose_name='待收货')
+    completed = models.IntegerField(default=0, verbose_name='已完成')
+    cancelled = models.IntegerField(default=0, verbose_name='已取消')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'user_order_stats'
+        verbose_name = '用户订单统计'
+        verbose_name_plural = '用户订单统计'
+
+    def __str__(self):
+        return f'{self.user_id}'
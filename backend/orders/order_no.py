@@ -0,0 +1,162 @@
+"""
+订单号生成（Snowflake 风格，不访问数据库）
+
+格式：ORD + UTC 日期（8 位）+ 15 位数字，共 26 位，例如 ORD20260118000123456789012
+15 位数字 = 当天毫秒数（27 位）<< 22 | 工作进程 ID（10 位）<< 12 | 毫秒内序号（12 位）
+- 同一进程生成的订单号严格递增，不同进程之间按毫秒有序，字符串比较即时间顺序
+- 工作进程 ID 在所有进程、主机之间唯一，订单号不会重复（每个进程每毫秒最多 4096 个）：
+  ORDER_NO_WORKER_ID 直接指定；否则为 主机 ID（ORDER_NO_HOST_ID，0-31）<< 5 | 本机槽位（0-31），
+  本机槽位通过文件锁（ORDER_NO_LOCK_DIR/order-no-<槽位>.lock）在本机存活的进程之间分配
+- 时钟回拨或序号用尽时沿用 / 借用下一毫秒，不会生成更小的订单号
+"""
+import os
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境
+    fcntl = None
+
+PREFIX = 'ORD'
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+HOST_BITS = 5
+SLOT_BITS = WORKER_BITS - HOST_BITS
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+MS_PER_DAY = 86_400_000
+EPOCH_DATE = date(1970, 1, 1)
+
+
+def _now_ms():
+    return time.time_ns() // 1_000_000
+
+
+class WorkerSlot:
+    """本机工作进程槽位（文件锁，进程退出后自动释放）"""
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        self.slot = None
+        self._file = None
+
+    def acquire(self):
+        if fcntl is None:
+            # 无文件锁时退化为按 PID 取槽位（仅用于单进程开发环境）
+            self.slot = os.getpid() & ((1 << SLOT_BITS) - 1)
+            return self.slot
+        os.makedirs(self.lock_dir, exist_ok=True)
+        for slot in range(1 << SLOT_BITS):
+            f = open(os.path.join(self.lock_dir, f'order-no-{slot}.lock'), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            self._file = f
+            self.slot = slot
+            return slot
+        raise RuntimeError(f'本机订单号工作进程槽位已用完（最多 {1 << SLOT_BITS} 个进程）')
+
+    def abandon(self):
+        """fork 后的子进程放弃继承的槽位（父进程仍持有锁）"""
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self.slot = None
+
+
+class OrderNoGenerator:
+    """
+    订单号生成器（线程安全、fork 安全）
+
+    worker_id 为空时按 ORDER_NO_WORKER_ID / ORDER_NO_HOST_ID + 本机槽位确定；clock 返回毫秒时间戳（测试用）。
+    """
+
+    def __init__(self, worker_id=None, clock=_now_ms):
+        self._configured_worker_id = worker_id
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker_id = None
+        self._slot = None
+        self._last_ms = -1
+        self._sequence = 0
+
+    @property
+    def worker_id(self):
+        with self._lock:
+            self._ensure_worker()
+            return self._worker_id
+
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        # 首次使用或 fork 后的子进程：重新分配工作进程 ID，序号状态不继承
+        if self._slot is not None:
+            self._slot.abandon()
+            self._slot = None
+        self._worker_id = self._resolve_worker_id()
+        self._last_ms = -1
+        self._sequence = 0
+        self._pid = pid
+
+    def _resolve_worker_id(self):
+        worker_id = self._configured_worker_id
+        if worker_id is None:
+            worker_id = getattr(settings, 'ORDER_NO_WORKER_ID', None)
+        if worker_id is None:
+            host_id = getattr(settings, 'ORDER_NO_HOST_ID', 0)
+            if not 0 <= host_id < (1 << HOST_BITS):
+                raise ValueError(f'ORDER_NO_HOST_ID 必须在 0-{(1 << HOST_BITS) - 1} 之间')
+            lock_dir = getattr(settings, 'ORDER_NO_LOCK_DIR', None) or tempfile.gettempdir()
+            self._slot = WorkerSlot(lock_dir)
+            worker_id = host_id << SLOT_BITS | self._slot.acquire()
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f'订单号工作进程 ID 必须在 0-{MAX_WORKER_ID} 之间')
+        return worker_id
+
+    def next(self):
+        """生成下一个订单号"""
+        with self._lock:
+            self._ensure_worker()
+            now = self._clock()
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = 0
+            else:
+                # 同一毫秒内或时钟回拨：沿用上一个时间戳，序号递增；序号用尽时借用下一毫秒
+                self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+                if self._sequence == 0:
+                    self._last_ms += 1
+            return self.format(self._last_ms, self._worker_id, self._sequence)
+
+    @staticmethod
+    def format(ms, worker_id, sequence):
+        days, ms_of_day = divmod(ms, MS_PER_DAY)
+        day = EPOCH_DATE + timedelta(days=days)
+        value = (ms_of_day << (WORKER_BITS + SEQUENCE_BITS)) | (worker_id << SEQUENCE_BITS) | sequence
+        return f'{PREFIX}{day:%Y%m%d}{value:015d}'
+
+    @staticmethod
+    def parse(order_no):
+        """解析订单号，返回 (毫秒时间戳, 工作进程 ID, 序号)"""
+        day = date(int(order_no[3:7]), int(order_no[7:9]), int(order_no[9:11]))
+        value = int(order_no[11:])
+        ms_of_day = value >> (WORKER_BITS + SEQUENCE_BITS)
+        worker_id = (value >> SEQUENCE_BITS) & MAX_WORKER_ID
+        return (day - EPOCH_DATE).days * MS_PER_DAY + ms_of_day, worker_id, value & SEQUENCE_MASK
+
+
+default_generator = OrderNoGenerator()
+
+
+def generate_order_no():
+    """生成订单号"""
+    return default_generator.next()
@@ -0,0 +1,18 @@
+"""
+订单分页（游标分页，不执行 COUNT，页大小有上限）
+"""
+from products.pagination import KeysetPagination
+
+
+class GuestOrderPagination(KeysetPagination):
+    """未登录用户按订单号 / 手机号查询订单：按 (receiver_phone, created_at) 索引顺序翻页"""
+    page_size = 10
+    max_page_size = 50
+    count_query_param = None  # 不提供总数，查询耗时与历史订单数无关
+
+
+class UserOrderPagination(KeysetPagination):
+    """登录用户的订单列表摘要：按 (user_id, created_at) 索引顺序翻页"""
+    page_size = 10
+    max_page_size = 50
+    count_query_param = None  # 各状态数量由 user_order_stats 提供
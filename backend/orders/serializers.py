@@ -27,6 +27,17 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['order_no', 'created_at', 'updated_at']
 
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """订单摘要序列化器（"我的订单"列表，商品只返回预览，不查询订单商品表）"""
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    
+    class Meta:
+        model = Order
+        fields = ['id', 'order_no', 'status', 'status_display', 'total_amount', 'pay_amount',
+                  'item_count', 'items_preview', 'created_at']
+        read_only_fields = fields
+
+
 class OrderCreateSerializer(serializers.Serializer):
     """订单创建序列化器（支持未登录用户）"""
     # 收货信息
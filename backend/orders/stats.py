@@ -0,0 +1,80 @@
+"""
+用户订单状态计数（"我的订单"各状态角标）
+
+user_order_stats 每个用户一行，各状态一列，随订单状态变化增量更新（F() + CASE，一条 UPDATE），
+读取角标时按主键取一行，不需要扫描订单表：
+- 下单：对应状态 +1（首单时插入计数行）
+- 修改状态 / 支付 / 取消 / 超时回收：原状态 -1，新状态 +1
+未登录用户的订单不计数。后台等直接修改订单的途径不经过这里，可用 rebuild_order_stats 命令重算。
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+
+from .models import Order, UserOrderStats
+
+# 订单状态 -> 计数列
+STATUS_FIELDS = {
+    1: 'pending_payment',
+    2: 'pending_shipment',
+    3: 'pending_receipt',
+    4: 'completed',
+    5: 'cancelled',
+}
+
+
+def record(changes):
+    """
+    按订单状态变化更新计数（需在修改订单的事务中调用）
+
+    changes 为 [(用户ID, 原状态, 新状态)]，新订单的原状态为 None；用户ID 为空的忽略。
+    """
+    deltas = {}  # 计数列 -> {用户ID: 增量}
+    new_users = set()
+    for user_id, old_status, new_status in changes:
+        if user_id is None or old_status == new_status:
+            continue
+        if old_status is None:
+            new_users.add(user_id)
+        else:
+            deltas.setdefault(STATUS_FIELDS[old_status], Counter())[user_id] -= 1
+        deltas.setdefault(STATUS_FIELDS[new_status], Counter())[user_id] += 1
+    if not deltas:
+        return
+
+    if new_users:
+        UserOrderStats.objects.bulk_create([UserOrderStats(user_id=user_id) for user_id in new_users], ignore_conflicts=True)
+    user_ids = set()
+    values = {}
+    for field, per_user in deltas.items():
+        user_ids.update(per_user)
+        values[field] = F(field) + Case(
+            *[When(user_id=user_id, then=Value(delta)) for user_id, delta in per_user.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    UserOrderStats.objects.filter(user_id__in=sorted(user_ids)).update(**values)
+
+
+def counts(user_id):
+    """用户各状态订单数 {计数列: 数量}（一次主键查询）"""
+    row = UserOrderStats.objects.filter(user_id=user_id).values(*STATUS_FIELDS.values()).first()
+    return row or dict.fromkeys(STATUS_FIELDS.values(), 0)
+
+
+@transaction.atomic
+def rebuild(user_ids=None):
+    """按订单表重算计数，user_ids 为空时重算全部用户，返回重算的用户数"""
+    orders = Order.objects.filter(user_id__isnull=False)
+    stats = UserOrderStats.objects.all()
+    if user_ids is not None:
+        orders = orders.filter(user_id__in=list(user_ids))
+        stats = stats.filter(user_id__in=list(user_ids))
+    rows = {}
+    for user_id, status, count in orders.values_list('user_id', 'status').annotate(count=Count('id')).order_by():
+        rows.setdefault(user_id, UserOrderStats(user_id=user_id))
+        setattr(rows[user_id], STATUS_FIELDS[status], count)
+    stats.delete()
+    UserOrderStats.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
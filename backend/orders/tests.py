@@ -1,3 +1,593 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User as AdminUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ecommerce.counters import discard_all
+from products import stock
+from products.models import Category, Product, ProductListing, StockBucket
+from users.models import User
+from . import cache as order_cache, idempotency, inventory, stats
+from .checkout import CheckoutError, place_order
+from .models import IdempotencyKey, InventoryHold, Order, OrderItem, UserOrderStats
+from .views import OrderViewSet
+from .order_no import MAX_WORKER_ID, SEQUENCE_MASK, OrderNoGenerator
+
+RECEIVER = {'receiver_name': '张三', 'receiver_phone': '13800000000', 'receiver_address': '北京市'}
+
+
+class CheckoutTests(TestCase):
+    """下单扣库存"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='分类')
+        cls.products = [
+            Product.objects.create(category=category, name=f'商品{i}', price=Decimal('10.00') + i, stock=10)
+            for i in range(10)
+        ]
+
+    def _checkout_queries(self, line_count):
+        items = [{'product_id': product.id, 'quantity': 1} for product in self.products[:line_count]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/v1/orders/', {'items': items, **RECEIVER}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['data']['items']), line_count)
+        return len(queries)
+
+    def test_query_count_independent_of_line_count(self):
+        self.assertEqual(self._checkout_queries(1), self._checkout_queries(10))
+
+    def test_decrements_stock_and_listing(self):
+        product = self.products[0]
+        order = place_order('T1', [{'product_id': product.id, 'quantity': 2}, {'product_id': product.id, 'quantity': 1}], **RECEIVER)
+        item = order.items.get()
+        self.assertEqual(item.quantity, 3)
+        self.assertEqual(order.total_amount, Decimal('30.00'))
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.sales_count), (7, 3))
+        listing = ProductListing.objects.get(id=product.id)
+        self.assertEqual((listing.stock, listing.sales_count), (7, 3))
+
+    def test_insufficient_stock_writes_nothing(self):
+        items = [{'product_id': self.products[0].id, 'quantity': 1}, {'product_id': self.products[1].id, 'quantity': 11}]
+        with self.assertRaises(CheckoutError):
+            place_order('T2', items, **RECEIVER)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 10)
+
+
+class InventoryHoldTests(TestCase):
+    """库存预留：支付确认、取消回补、超时回收"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='分类')
+        cls.products = [
+            Product.objects.create(category=category, name=f'商品{i}', price=Decimal('5.00'), stock=100)
+            for i in range(3)
+        ]
+
+    def _order(self, order_no, quantity=1):
+        items = [{'product_id': product.id, 'quantity': quantity} for product in self.products]
+        return place_order(order_no, items, **RECEIVER)
+
+    def _stocks(self):
+        return list(Product.objects.filter(id__in=[p.id for p in self.products]).order_by('id').values_list('stock', flat=True))
+
+    def test_checkout_places_holds(self):
+        order = self._order('H1', 2)
+        self.assertEqual(order.holds.filter(status=InventoryHold.STATUS_HELD).count(), 3)
+        self.assertEqual(inventory.reserved_quantities([self.products[0].id]), {self.products[0].id: 2})
+        self.assertEqual(self._stocks(), [98, 98, 98])
+
+    def test_cancel_returns_stock(self):
+        order = self._order('H2', 3)
+        self.assertEqual(inventory.cancel_orders([order.id]), [order.id])
+        self.assertEqual(inventory.cancel_orders([order.id]), [])
+        self.assertEqual(self._stocks(), [100, 100, 100])
+        self.assertFalse(order.holds.exclude(status=InventoryHold.STATUS_RELEASED).exists())
+        self.assertEqual(ProductListing.objects.get(id=self.products[0].id).stock, 100)
+
+    def test_release_expired_cancels_unpaid_orders_in_batches(self):
+        orders = [self._order(f'E{i}') for i in range(5)]
+        paid = orders[0]
+        self.assertTrue(inventory.confirm_payment(paid.id, 2))
+        InventoryHold.objects.update(expires_at=timezone.now())
+
+        # 每批查询数固定（含保存点），与订单数无关；最后一次查询确认没有剩余
+        with self.assertNumQueries(9 * 2 + 1):
+            cancelled, scanned = inventory.release_expired(batch_size=6)
+        self.assertEqual((cancelled, scanned), (4, 12))
+        self.assertEqual(self._stocks(), [99, 99, 99])
+        self.assertEqual(Order.objects.filter(status=5).count(), 4)
+        self.assertEqual(Order.objects.get(id=paid.id).status, 2)
+        # 已取消的订单不能再支付
+        self.assertFalse(inventory.confirm_payment(orders[1].id, 2))
+
+
+    def test_release_expired_settles_holds_of_orders_changed_elsewhere(self):
+        paid, cancelled = self._order('S1', 2), self._order('S2', 3)
+        # 绕过 confirm_payment / cancel_orders 直接修改订单状态
+        Order.objects.filter(id=paid.id).update(status=3)
+        Order.objects.filter(id=cancelled.id).update(status=5)
+        InventoryHold.objects.update(expires_at=timezone.now())
+
+        self.assertEqual(inventory.release_expired(), (0, 6))
+        self.assertEqual(set(paid.holds.values_list('status', flat=True)), {InventoryHold.STATUS_CONFIRMED})
+        self.assertEqual(set(cancelled.holds.values_list('status', flat=True)), {InventoryHold.STATUS_RELEASED})
+        self.assertEqual(inventory.reserved_quantities([p.id for p in self.products]), {})
+        self.assertEqual(self._stocks(), [98, 98, 98])
+
+    def test_admin_status_change_settles_holds(self):
+        order = self._order('S3', 4)
+        self.client.force_login(AdminUser.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        items = list(order.items.order_by('id'))
+        data = {
+            'user': '', 'status': 5, 'total_amount': order.total_amount, 'freight_amount': order.freight_amount,
+            'pay_amount': order.pay_amount, 'remark': '', **RECEIVER,
+            'items-TOTAL_FORMS': len(items), 'items-INITIAL_FORMS': len(items),
+            'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+        }
+        for index, item in enumerate(items):
+            data.update({
+                f'items-{index}-id': item.id, f'items-{index}-order': order.id,
+                f'items-{index}-product': item.product_id, f'items-{index}-quantity': item.quantity,
+            })
+        response = self.client.post(f'/admin/orders/order/{order.id}/change/', data)
+        self.assertEqual(response.status_code, 302, getattr(response, 'context', None) and response.context['adminform'].form.errors)
+        self.assertFalse(order.holds.exclude(status=InventoryHold.STATUS_RELEASED).exists())
+        self.assertEqual(self._stocks(), [100, 100, 100])
+
+
+class StripedStockTests(TestCase):
+    """热点商品库存分桶"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='分类')
+        cls.product = Product.objects.create(category=category, name='秒杀商品', price=Decimal('1.00'), stock=10)
+        stock.configure(cls.product.id, 4)
+
+    def setUp(self):
+        # 分桶商品的销量、详情浏览量写入进程全局的计数缓冲
+        self.addCleanup(discard_all)
+
+    def _buckets(self):
+        return list(StockBucket.objects.filter(product=self.product).order_by('slot').values_list('stock', flat=True))
+
+    def test_configure_spreads_stock(self):
+        self.assertEqual(self._buckets(), [3, 3, 2, 2])
+        self.assertEqual(ProductListing.objects.get(id=self.product.id).stock_stripes, 4)
+        self.assertEqual(stock.configure(self.product.id, 0), 10)
+        self.assertEqual(self._buckets(), [])
+
+    def test_checkout_takes_from_buckets(self):
+        place_order('S1', [{'product_id': self.product.id, 'quantity': 2}], **RECEIVER)
+        self.assertEqual(sum(self._buckets()), 8)
+        # 商品行不随下单更新，读取时按桶汇总
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 10)
+        response = self.client.get('/api/v1/products/')
+        self.assertEqual(response.json()['data']['results'][0]['stock'], 8)
+        response = self.client.get(f'/api/v1/products/{self.product.id}/')
+        self.assertEqual(response.json()['data']['stock'], 8)
+
+    def test_take_across_buckets_and_rebalance(self):
+        # 单个桶都不足 5 个时从多个桶扣减，剩余库存重新平均分配
+        place_order('S2', [{'product_id': self.product.id, 'quantity': 5}], **RECEIVER)
+        self.assertEqual(self._buckets(), [2, 1, 1, 1])
+        with self.assertRaises(CheckoutError):
+            place_order('S3', [{'product_id': self.product.id, 'quantity': 6}], **RECEIVER)
+        self.assertEqual(sum(self._buckets()), 5)
+
+    def test_cancel_returns_to_buckets(self):
+        order = place_order('S4', [{'product_id': self.product.id, 'quantity': 3}], **RECEIVER)
+        inventory.cancel_orders([order.id])
+        self.assertEqual(sum(self._buckets()), 10)
+
+    def test_admin_stock_edit_redistributes_buckets(self):
+        place_order('S5', [{'product_id': self.product.id, 'quantity': 2}], **RECEIVER)
+        self.client.force_login(AdminUser.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        url = f'/admin/products/product/{self.product.id}/change/'
+        # 编辑页显示各桶实时汇总
+        self.assertEqual(self.client.get(url).context['adminform'].form.initial['stock'], 8)
+
+        data = {
+            'category': self.product.category_id, 'name': '秒杀商品', 'subtitle': '', 'detail': '',
+            'price': '1.00', 'original_price': '', 'stock': 20, 'status': 1, 'sort_order': 0, 'main_image_url': '',
+            'images-TOTAL_FORMS': 0, 'images-INITIAL_FORMS': 0, 'images-MIN_NUM_FORMS': 0, 'images-MAX_NUM_FORMS': 1000,
+        }
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(self._buckets(), [5, 5, 5, 5])
+        self.assertEqual(ProductListing.objects.get(id=self.product.id).stock, 20)
+
+        # 未修改库存时不重新分配（保留下单后的各桶库存）
+        place_order('S6', [{'product_id': self.product.id, 'quantity': 1}], **RECEIVER)
+        buckets = self._buckets()
+        self.assertEqual(self.client.post(url, {**data, 'stock': 19, 'name': '秒杀商品2'}).status_code, 302)
+        self.assertEqual(self._buckets(), buckets)
+
+
+class IdempotencyKeyTests(TestCase):
+    """Idempotency-Key 重试"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='分类')
+        cls.product = Product.objects.create(category=category, name='商品', price=Decimal('10.00'), stock=10)
+
+    def _post(self, key, quantity=1):
+        data = {'items': [{'product_id': self.product.id, 'quantity': quantity}], **RECEIVER}
+        return self.client.post('/api/v1/orders/', data, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_stored_response_without_writing(self):
+        first = self._post('k1')
+        self.assertEqual(first.status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            second = self._post('k1')
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotency-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+        self.assertFalse([q for q in queries if q['sql'].startswith(('UPDATE', 'DELETE'))])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 9)
+
+        self.assertEqual(self._post('k2').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_key_reused_with_different_request(self):
+        self._post('k1')
+        self.assertEqual(self._post('k1', quantity=2).status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_failed_request_is_stored_and_expired_key_is_reusable(self):
+        self.assertEqual(self._post('k1', quantity=11).status_code, 400)
+        self.assertEqual(self._post('k1', quantity=11).status_code, 400)
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(self._post('k1', quantity=11).status_code, 400)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_purge_expired_in_batches(self):
+        for key in ('k1', 'k2', 'k3'):
+            self._post(key)
+        IdempotencyKey.objects.exclude(pk=IdempotencyKey.objects.latest('created_at').pk).update(expires_at=timezone.now())
+        self.assertEqual(idempotency.purge_expired(batch_size=1), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+
+class GuestOrderQueryTests(TestCase):
+    """未登录用户查询订单"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='分类')
+        product = Product.objects.create(category=category, name='商品', price=Decimal('10.00'), stock=100)
+        items = [{'product_id': product.id, 'quantity': 1}, {'product_id': product.id, 'quantity': 1}]
+        for i in range(30):
+            place_order(f'G{i:02d}', items, **{**RECEIVER, 'receiver_phone': '13900000030'})
+        place_order('G99', items, **{**RECEIVER, 'receiver_phone': '13900000001'})
+
+    def setUp(self):
+        cache.clear()
+
+    def _query(self, path='/api/v1/orders/query/', **data):
+        return self.client.post(path, data, content_type='application/json')
+
+    def test_query_count_independent_of_history(self):
+        with self.assertNumQueries(2):
+            single = self._query(receiver_phone=' 13900000001 ')
+        self.assertEqual(single.json()['data']['order_no'], 'G99')
+        with self.assertNumQueries(2):
+            many = self._query(receiver_phone='13900000030')
+        self.assertEqual(len(many.json()['data']), 10)
+        self.assertEqual(many.json()['data'][0]['order_no'], 'G29')
+        self.assertEqual(len(many.json()['data'][0]['items']), 1)
+
+    def test_result_is_cached(self):
+        self._query(order_no='g99')
+        with self.assertNumQueries(0):
+            response = self._query(order_no='G99 ')
+        self.assertEqual(response.json()['data']['order_no'], 'G99')
+
+    def test_cursor_pagination(self):
+        order_nos = []
+        path = '/api/v1/orders/query/?pagination=cursor&page_size=100'
+        while path:
+            with self.assertNumQueries(2):
+                data = self._query(path, receiver_phone='13900000030').json()['data']
+            self.assertIsNone(data['count'])
+            self.assertLessEqual(len(data['results']), 50)
+            order_nos += [order['order_no'] for order in data['results']]
+            path = data['next']
+        self.assertEqual(order_nos, [f'G{i:02d}' for i in range(29, -1, -1)])
+
+    def test_not_found(self):
+        self.assertEqual(self._query(receiver_phone='13900000099').status_code, 404)
+        self.assertEqual(self._query().status_code, 400)
+
+    def _status(self, **data):
+        return self._query(**data).json()['data']['status']
+
+    def test_status_changes_invalidate_cache(self):
+        order = Order.objects.get(order_no='G99')
+        self.assertEqual(self._status(order_no='G99'), 1)
+        self.assertEqual(self._status(receiver_phone='13900000001'), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.confirm_payment(order.id, 2)
+        self.assertEqual(self._status(order_no='G99'), 2)
+        self.assertEqual(self._status(receiver_phone='13900000001'), 2)
+
+        user = User.objects.create(username='buyer', password_hash='x')
+        user.is_authenticated = True  # users.User 不是 Django 认证模型，没有该属性
+        Order.objects.filter(id=order.id).update(user_id=user.id)
+        request = APIRequestFactory().patch(f'/api/v1/orders/{order.id}/update_status/', {'status': 3}, format='json')
+        force_authenticate(request, user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = OrderViewSet.as_view({'patch': 'update_status'})(request, pk=order.id)
+        self.assertEqual(response.data['data']['status'], 3)
+        self.assertEqual(self._status(order_no='G99', receiver_phone='13900000001'), 3)
+        self.assertEqual(self._status(receiver_phone='13900000001'), 3)
+
+    def test_cancel_and_new_order_invalidate_cache(self):
+        orders = self._query(receiver_phone='13900000030').json()['data']
+        self.assertEqual(orders[0]['order_no'], 'G29')
+        self._status(order_no='G29')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory.cancel_orders([Order.objects.get(order_no='G29').id])
+        self.assertEqual(self._status(order_no='G29'), inventory.STATUS_CANCELLED)
+        self.assertEqual(self._query(receiver_phone='13900000030').json()['data'][0]['status'], inventory.STATUS_CANCELLED)
+
+        product_id = OrderItem.objects.filter(order__order_no='G29').values_list('product_id', flat=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order('G30', [{'product_id': product_id, 'quantity': 1}], **{**RECEIVER, 'receiver_phone': '13900000030'})
+        self.assertEqual(self._query(receiver_phone='13900000030').json()['data'][0]['order_no'], 'G30')
+
+    def test_cache_key_taken_before_query(self):
+        # 查询数据库期间订单状态变化：结果写入旧版本的键，之后的请求读不到
+        key = order_cache.guest_query_key('G99', '', {})
+        order_cache.invalidate_guest_queries([('G99', '13900000001')])
+        self.assertNotEqual(order_cache.guest_query_key('G99', '', {}), key)
+        self.assertEqual(order_cache.guest_query_key('', '13900000030', {}), order_cache.guest_query_key('', '13900000030', {}))
+
+
+class UserOrderSummaryTests(TestCase):
+    """"我的订单"摘要：状态计数增量维护、游标分页"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='分类')
+        cls.products = [
+            Product.objects.create(category=category, name=f'商品{i}', price=Decimal('5.00'), stock=100)
+            for i in range(5)
+        ]
+        cls.user = User.objects.create(username='buyer', password_hash='x')
+
+    def _order(self, order_no, user=None):
+        items = [{'product_id': product.id, 'quantity': 1} for product in self.products]
+        return place_order(order_no, items, user_id=(user or self.user).id, **RECEIVER)
+
+    def _counts(self):
+        return stats.counts(self.user.id)
+
+    def test_counts_follow_status_changes(self):
+        orders = [self._order(f'U{i}') for i in range(4)]
+        self.assertEqual(self._counts()['pending_payment'], 4)
+        inventory.confirm_payment(orders[0].id, 2)
+        inventory.cancel_orders([orders[1].id])
+        InventoryHold.objects.filter(order_id=orders[2].id).update(expires_at=timezone.now())
+        inventory.release_expired()
+        self.assertEqual(self._counts(), {
+            'pending_payment': 1, 'pending_shipment': 1, 'pending_receipt': 0, 'completed': 0, 'cancelled': 2,
+        })
+        incremental = self._counts()
+        UserOrderStats.objects.all().delete()
+        self.assertEqual(stats.rebuild(), 1)
+        self.assertEqual(self._counts(), incremental)
+
+    def test_order_keeps_items_preview(self):
+        order = Order.objects.get(id=self._order('U1').id)
+        self.assertEqual(order.item_count, 5)
+        self.assertEqual([item['product_name'] for item in order.items_preview], ['商品0', '商品1', '商品2'])
+        self.assertEqual(order.items_preview[0]['price'], '5.00')
+
+    def test_summary_in_two_queries(self):
+        other = User.objects.create(username='other', password_hash='x')
+        self._order('X1', user=other)
+        for i in range(12):
+            self._order(f'U{i:02d}')
+        self.user.is_authenticated = True  # users.User 不是 Django 认证模型，没有该属性
+        view = OrderViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+
+        order_nos = []
+        url = '/api/v1/orders/?summary=1&page_size=5'
+        while url:
+            request = factory.get(url)
+            force_authenticate(request, user=self.user)
+            with self.assertNumQueries(2):
+                data = view(request).data['data']
+            self.assertEqual(data['counts']['pending_payment'], 12)
+            self.assertNotIn('items', data['results'][0])
+            order_nos += [order['order_no'] for order in data['results']]
+            url = data['next']
+        self.assertEqual(order_nos, [f'U{i:02d}' for i in range(11, -1, -1)])
+
+
+def _generate_order_nos(count, barrier, queue):
+    """子进程：生成 count 个订单号，等待所有进程生成完再退出（存活期间占用各自的槽位）"""
+    generator = OrderNoGenerator()
+    order_nos = [generator.next() for _ in range(count)]
+    queue.put((generator.worker_id, order_nos))
+    barrier.wait()
+
+
+class OrderNoTests(SimpleTestCase):
+    """订单号生成"""
+
+    def test_format_and_parse(self):
+        generator = OrderNoGenerator(worker_id=MAX_WORKER_ID, clock=lambda: 1_768_694_400_123)
+        order_no = generator.next()
+        self.assertEqual(len(order_no), 26)
+        self.assertTrue(order_no.startswith('ORD20260118'))
+        self.assertEqual(OrderNoGenerator.parse(order_no), (1_768_694_400_123, MAX_WORKER_ID, 0))
+
+    def test_monotonic_with_clock_rollback_and_sequence_overflow(self):
+        ticks = iter([1000] * (SEQUENCE_MASK + 3) + [990, 1003, 1003])
+        generator = OrderNoGenerator(worker_id=1, clock=lambda: next(ticks))
+        order_nos = [generator.next() for _ in range(SEQUENCE_MASK + 6)]
+        self.assertEqual(order_nos, sorted(set(order_nos)))
+        # 序号用尽后借用下一毫秒
+        self.assertEqual(OrderNoGenerator.parse(order_nos[SEQUENCE_MASK + 1])[:2], (1001, 1))
+
+    @skipUnless(hasattr(os, 'fork'), '需要 fork')
+    def test_unique_across_processes(self):
+        processes, per_process = 8, 20000
+        ctx = multiprocessing.get_context('fork')
+        barrier = ctx.Barrier(processes)
+        queue = ctx.Queue()
+        with tempfile.TemporaryDirectory() as lock_dir, override_settings(
+            ORDER_NO_LOCK_DIR=lock_dir, ORDER_NO_WORKER_ID=None, ORDER_NO_HOST_ID=3
+        ):
+            workers = [ctx.Process(target=_generate_order_nos, args=(per_process, barrier, queue)) for _ in range(processes)]
+            for worker in workers:
+                worker.start()
+            results = [queue.get(timeout=60) for _ in workers]
+            for worker in workers:
+                worker.join()
+
+        worker_ids = [worker_id for worker_id, _ in results]
+        self.assertEqual(len(set(worker_ids)), processes)
+        self.assertTrue(all(worker_id >> 5 == 3 for worker_id in worker_ids))
+        all_order_nos = []
+        for _, order_nos in results:
+            # 同一进程内严格递增
+            self.assertEqual(order_nos, sorted(set(order_nos)))
+            all_order_nos.extend(order_nos)
+        self.assertEqual(len(set(all_order_nos)), processes * per_process)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """并发下单不超卖（需要支持 SELECT ... FOR UPDATE 的数据库）"""
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_no_oversell(self):
+        category = Category.objects.create(name='分类')
+        product = Product.objects.create(category=category, name='秒杀商品', price=Decimal('1.00'), stock=5)
+        workers = 20
+        barrier = threading.Barrier(workers)
+        results = []
+
+        def buy(index):
+            try:
+                barrier.wait()
+                place_order(f'C{index}', [{'product_id': product.id, 'quantity': 1}], **RECEIVER)
+                results.append(True)
+            except CheckoutError:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(i,)) for i in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results.count(True), 5)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(product.sales_count, 5)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), 5)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_duplicate_requests_wait_for_first(self):
+        category = Category.objects.create(name='分类')
+        product = Product.objects.create(category=category, name='商品', price=Decimal('1.00'), stock=10)
+        data = {'items': [{'product_id': product.id, 'quantity': 1}], **RECEIVER}
+        workers = 5
+        barrier = threading.Barrier(workers)
+        responses = []
+
+        def post():
+            try:
+                barrier.wait()
+                responses.append(self.client_class().post(
+                    '/api/v1/orders/', data, content_type='application/json', HTTP_IDEMPOTENCY_KEY='retry'
+                ))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [201] * workers)
+        self.assertEqual(len({response.json()['data']['order_no'] for response in responses}), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Product.objects.get(id=product.id).stock, 9)
+
+
+@skipUnless(os.getenv('RUN_LOAD_TESTS'), '压测较慢，设置 RUN_LOAD_TESTS=1 时运行')
+class StripedStockLoadTests(TransactionTestCase):
+    """
+    热点商品下单吞吐量随分桶数增长（需要支持行锁的数据库，如 MySQL）
+
+    RUN_LOAD_TESTS=1 python manage.py test orders.tests.StripedStockLoadTests
+    """
+    workers = 16
+    orders_per_worker = 25
+
+    def setUp(self):
+        self.addCleanup(discard_all)
+
+    def _throughput(self, product, stripes):
+        stock.configure(product.id, stripes, stock=self.workers * self.orders_per_worker)
+        barrier = threading.Barrier(self.workers + 1)
+        errors = []
+
+        def buy(worker):
+            try:
+                barrier.wait()
+                for i in range(self.orders_per_worker):
+                    place_order(f'L{stripes}-{worker}-{i}', [{'product_id': product.id, 'quantity': 1}], **RECEIVER)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(i,)) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(errors, [])
+        self.assertEqual(stock.totals([product.id]).get(product.id, 0), 0)
+        return self.workers * self.orders_per_worker / elapsed
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_throughput_scales_with_stripes(self):
+        category = Category.objects.create(name='分类')
+        product = Product.objects.create(category=category, name='秒杀商品', price=Decimal('1.00'), stock=0)
+        results = {stripes: self._throughput(product, stripes) for stripes in (1, 4, 16)}
+        for stripes, throughput in results.items():
+            print(f'\n分桶数 {stripes:>2}：{throughput:.0f} 单/秒', end='')
+        self.assertGreater(results[16], results[1])
@@ -1,25 +1,32 @@
+from functools import partial
+
 from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django.db import transaction
-from django.utils import timezone
-import random
-import string
-from .models import Order, OrderItem, CartItem
-from .serializers import OrderSerializer, OrderCreateSerializer, CartItemSerializer
+from .models import Order, CartItem
+from .serializers import OrderSerializer, OrderSummarySerializer, OrderCreateSerializer, CartItemSerializer
+from .checkout import CheckoutError, place_order
+from .order_no import generate_order_no
+from .idempotency import idempotent
+from .pagination import GuestOrderPagination, UserOrderPagination
+from . import cache as order_cache
+from . import inventory, stats
 from products.models import Product
 
 
-def generate_order_no():
-    """生成订单号"""
-    return 'ORD' + timezone.now().strftime('%Y%m%d%H%M%S') + ''.join(random.choices(string.digits, k=4))
-
-
 class OrderViewSet(viewsets.ModelViewSet):
     """订单视图集"""
     serializer_class = OrderSerializer
     permission_classes = [AllowAny]  # 允许未登录用户访问
+
+    # 未登录用户查询订单的排序键（末位 id 保证唯一）
+    GUEST_QUERY_ORDERING = ('-created_at', '-id')
+    # 登录用户订单摘要的排序键
+    USER_LIST_ORDERING = ('-created_at', '-id')
+    SUMMARY_FIELDS = ('id', 'order_no', 'status', 'total_amount', 'pay_amount', 'item_count', 'items_preview', 'created_at')
     
     def get_queryset(self):
         """根据用户身份返回不同的查询集"""
@@ -27,11 +34,46 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         if user_id:
             # 登录用户：返回自己的订单
-            return Order.objects.filter(user_id=user_id).order_by('-created_at')
+            queryset = Order.objects.filter(user_id=user_id).order_by('-created_at')
+            if self.action == 'list':
+                # 完整列表预取订单商品，避免逐个订单查询
+                queryset = queryset.prefetch_related('items')
+            return queryset
         else:
             # 未登录用户：返回空查询集（只能通过订单号查询）
             return Order.objects.none()
     
+    def list(self, request, *args, **kwargs):
+        """
+        订单列表
+
+        ?summary=1 返回"我的订单"摘要（两条查询）：各状态订单数 + 一页订单摘要（游标分页，商品只含预览）
+        """
+        if request.query_params.get('summary') not in ('1', 'true'):
+            return super().list(request, *args, **kwargs)
+        
+        user_id = request.user.id if hasattr(request, 'user') and request.user.is_authenticated else None
+        if not user_id:
+            return Response({
+                'code': 401,
+                'message': '请先登录',
+                'data': None,
+                'timestamp': None
+            }, status=status.HTTP_401_UNAUTHORIZED)
+        
+        queryset = Order.objects.filter(user_id=user_id).only(*self.SUMMARY_FIELDS)
+        paginator = UserOrderPagination()
+        orders = paginator.paginate_queryset(queryset, request, view=self, ordering=self.USER_LIST_ORDERING)
+        data = paginator.get_paginated_response_data(OrderSummarySerializer(orders, many=True).data)
+        data['counts'] = stats.counts(user_id)
+        return Response({
+            'code': 200,
+            'message': 'success',
+            'data': data,
+            'timestamp': None
+        })
+    
+    @idempotent('orders.create')
     @transaction.atomic
     def create(self, request, *args, **kwargs):
         """创建订单（支持未登录用户）"""
@@ -44,76 +86,24 @@ class OrderViewSet(viewsets.ModelViewSet):
         # 获取用户ID（如果已登录）
         user_id = request.user.id if hasattr(request, 'user') and request.user.is_authenticated else None
         
-        # 计算订单金额
-        total_amount = 0
-        order_items_data = []
-        
-        for item in items_data:
-            try:
-                product = Product.objects.get(id=item['product_id'], status=1)
-            except Product.DoesNotExist:
-                return Response({
-                    'code': 400,
-                    'message': f'商品 {item["product_id"]} 不存在或已下架',
-                    'data': None,
-                    'timestamp': None
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # 检查库存
-            if product.stock < item['quantity']:
-                return Response({
-                    'code': 400,
-                    'message': f'商品 {product.name} 库存不足',
-                    'data': None,
-                    'timestamp': None
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            item_total = product.price * item['quantity']
-            total_amount += item_total
-            
-            order_items_data.append({
-                'product': product,
-                'product_name': product.name,
-                'product_image': product.main_image_url,
-                'price': product.price,
-                'quantity': item['quantity'],
-                'total_amount': item_total
-            })
-        
-        # 计算运费（简化版：固定运费或根据金额计算）
-        freight_amount = 0  # 可以后续实现运费计算逻辑
-        pay_amount = total_amount + freight_amount
-        
-        # 创建订单
-        order = Order.objects.create(
-            order_no=generate_order_no(),
-            user_id=user_id,
-            status=1,  # 待付款
-            total_amount=total_amount,
-            freight_amount=freight_amount,
-            pay_amount=pay_amount,
-            receiver_name=validated_data['receiver_name'],
-            receiver_phone=validated_data['receiver_phone'],
-            receiver_address=validated_data['receiver_address'],
-            remark=validated_data.get('remark', '')
-        )
-        
-        # 创建订单商品
-        for item_data in order_items_data:
-            OrderItem.objects.create(
-                order=order,
-                product=item_data['product'],
-                product_name=item_data['product_name'],
-                product_image=item_data['product_image'],
-                price=item_data['price'],
-                quantity=item_data['quantity'],
-                total_amount=item_data['total_amount']
+        # 锁定商品、创建订单和订单商品、条件扣减库存（查询数与商品行数无关）
+        try:
+            order = place_order(
+                generate_order_no(),
+                items_data,
+                user_id=user_id,
+                receiver_name=validated_data['receiver_name'],
+                receiver_phone=validated_data['receiver_phone'],
+                receiver_address=validated_data['receiver_address'],
+                remark=validated_data.get('remark', '')
             )
-            
-            # 减少库存
-            item_data['product'].stock -= item_data['quantity']
-            item_data['product'].sales_count += item_data['quantity']
-            item_data['product'].save(update_fields=['stock', 'sales_count'])
+        except CheckoutError as e:
+            return Response({
+                'code': 400,
+                'message': e.message,
+                'data': None,
+                'timestamp': None
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         # 如果用户已登录，清空购物车
         if user_id:
@@ -129,9 +119,14 @@ class OrderViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def query(self, request):
-        """订单查询（未登录用户通过订单号和/或手机号查询）"""
-        order_no = request.data.get('order_no', '').strip()
-        receiver_phone = request.data.get('receiver_phone', '').strip()
+        """
+        订单查询（未登录用户通过订单号和/或手机号查询）
+
+        按下单时间倒序返回一页订单（两条查询：订单、订单商品），不统计总数；
+        ?pagination=cursor 或携带 cursor 参数时返回游标分页结构，否则只返回最近一页。
+        """
+        order_no = str(request.data.get('order_no') or '').strip().upper()
+        receiver_phone = str(request.data.get('receiver_phone') or '').strip()
         
         # 至少填写一个
         if not order_no and not receiver_phone:
@@ -142,6 +137,11 @@ class OrderViewSet(viewsets.ModelViewSet):
                 'timestamp': None
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        cache_key = order_cache.guest_query_key(order_no, receiver_phone, request.query_params.dict())
+        cached = order_cache.get_guest_query(cache_key)
+        if cached is not None:
+            return Response(cached)
+        
         # 构建查询条件
         query_params = {}
         if order_no:
@@ -150,10 +150,12 @@ class OrderViewSet(viewsets.ModelViewSet):
             query_params['receiver_phone'] = receiver_phone
         
         try:
-            # 根据查询条件查询订单
-            orders = Order.objects.filter(**query_params).order_by('-created_at')
+            # 一次取一页订单并预取订单商品
+            queryset = Order.objects.filter(**query_params).prefetch_related('items')
+            paginator = GuestOrderPagination()
+            orders = paginator.paginate_queryset(queryset, request, view=self, ordering=self.GUEST_QUERY_ORDERING)
             
-            if not orders.exists():
+            if not orders:
                 return Response({
                     'code': 404,
                     'message': '未找到匹配的订单',
@@ -161,24 +163,31 @@ class OrderViewSet(viewsets.ModelViewSet):
                     'timestamp': None
                 }, status=status.HTTP_404_NOT_FOUND)
             
-            # 如果只查询到一个订单，返回单个订单
-            if orders.count() == 1:
-                serializer = OrderSerializer(orders.first())
-                return Response({
+            if request.query_params.get('pagination') == 'cursor' or request.query_params.get('cursor'):
+                data = {
+                    'code': 200,
+                    'message': 'success',
+                    'data': paginator.get_paginated_response_data(OrderSerializer(orders, many=True).data),
+                    'timestamp': None
+                }
+            elif len(orders) == 1:
+                # 如果只查询到一个订单，返回单个订单
+                data = {
                     'code': 200,
                     'message': 'success',
-                    'data': serializer.data,
+                    'data': OrderSerializer(orders[0]).data,
                     'timestamp': None
-                })
+                }
             else:
-                # 多个订单，返回列表
-                serializer = OrderSerializer(orders, many=True)
-                return Response({
+                # 多个订单，返回列表（最多一页）
+                data = {
                     'code': 200,
-                    'message': f'找到 {orders.count()} 个订单',
-                    'data': serializer.data,
+                    'message': f'找到最近 {len(orders)} 个订单' if paginator.has_next else f'找到 {len(orders)} 个订单',
+                    'data': OrderSerializer(orders, many=True).data,
                     'timestamp': None
-                })
+                }
+        except NotFound:
+            raise
         except Exception as e:
             return Response({
                 'code': 500,
@@ -186,6 +195,9 @@ class OrderViewSet(viewsets.ModelViewSet):
                 'data': None,
                 'timestamp': None
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        order_cache.set_guest_query(cache_key, data)
+        return Response(data)
     
     @action(detail=True, methods=['patch', 'put'])
     def update_status(self, request, pk=None):
@@ -212,9 +224,46 @@ class OrderViewSet(viewsets.ModelViewSet):
                     'timestamp': None
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # 更新订单状态
-            order.status = new_status
-            order.save(update_fields=['status', 'updated_at'])
+            # 已取消订单的库存已回补，不能恢复
+            if order.status == inventory.STATUS_CANCELLED and new_status != order.status:
+                return Response({
+                    'code': 400,
+                    'message': '订单已取消',
+                    'data': None,
+                    'timestamp': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            # 取消订单：释放预留并回补库存
+            if new_status == inventory.STATUS_CANCELLED and order.status != inventory.STATUS_CANCELLED:
+                if not inventory.cancel_orders([order.id]):
+                    return Response({
+                        'code': 400,
+                        'message': '订单当前状态不可取消',
+                        'data': None,
+                        'timestamp': None
+                    }, status=status.HTTP_400_BAD_REQUEST)
+            # 支付：确认库存预留（订单可能已超时取消）
+            elif order.status == inventory.STATUS_PENDING_PAYMENT and new_status != order.status:
+                if not inventory.confirm_payment(order.id, new_status):
+                    return Response({
+                        'code': 400,
+                        'message': '订单已超时取消',
+                        'data': None,
+                        'timestamp': None
+                    }, status=status.HTTP_400_BAD_REQUEST)
+            else:
+                # 更新订单状态，同步状态计数
+                with transaction.atomic():
+                    old_status = order.status
+                    order.status = new_status
+                    order.save(update_fields=['status', 'updated_at'])
+                    stats.record([(order.user_id, old_status, new_status)])
+                    # 确认仍未结束的库存预留（订单已不是待付款）
+                    inventory.settle_holds([order.id])
+                    transaction.on_commit(partial(
+                        order_cache.invalidate_guest_queries, [(order.order_no, order.receiver_phone)]
+                    ))
+            order.refresh_from_db()
             
             serializer = OrderSerializer(order)
             return Response({
@@ -259,6 +308,7 @@ class CartItemViewSet(viewsets.ModelViewSet):
         serializer.save(user_id=user_id)
     
     @action(detail=False, methods=['post'])
+    @idempotent('cart.add')
     def add(self, request):
         """添加商品到购物车"""
         product_id = request.data.get('product_id')
@@ -1,10 +1,10 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.html import format_html
 from django import forms
 from django.conf import settings
-import os
-from datetime import datetime
 from .models import Category, Product, ProductImage
+from . import media, stock, storage
+from .uploadhandlers import upload_errors
 
 
 @admin.register(Category)
@@ -14,6 +14,29 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
 
+class DiscardUploadsMixin:
+    """
+    表单提交后删除解析请求体时已写入存储、但没有被引用的上传文件
+
+    表单校验失败（重新渲染表单）或保存出错时，ImageUploadHandler 写入的图片不会被任何记录引用；
+    保存成功时文件已被引用，不会被删除。
+    """
+    def changeform_view(self, request, *args, **kwargs):
+        try:
+            return super().changeform_view(request, *args, **kwargs)
+        finally:
+            if request.method == 'POST':
+                media.discard_request_uploads(request)
+
+
+def _main_image_media(image_url):
+    """主图对应的衍生图和元数据：沿用已有同一图片（内容寻址，可能属于其他商品）的结果，没有时为空"""
+    image = ProductImage.objects.filter(image_url=image_url).exclude(derivatives={}).first() if image_url else None
+    if image is None:
+        return {}, {}
+    return image.derivatives, image.metadata()
+
+
 class ProductImageForm(forms.ModelForm):
     """商品图片表单（支持文件上传）"""
     image_file = forms.ImageField(
@@ -59,28 +82,16 @@ class ProductImageForm(forms.ModelForm):
             if image_file.size > 5 * 1024 * 1024:
                 raise forms.ValidationError('图片文件大小不能超过5MB')
             
-            # 创建上传目录
-            upload_dir = os.path.join(settings.MEDIA_ROOT, 'products', str(product.id))
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # 生成文件名
-            file_ext = os.path.splitext(image_file.name)[1].lower()
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"{timestamp}_{instance.sort_order or 0}{file_ext}"
-            file_path = os.path.join(upload_dir, filename)
-            
-            # 保存文件
-            with open(file_path, 'wb+') as destination:
-                for chunk in image_file.chunks():
-                    destination.write(chunk)
-            
-            # 生成URL
-            instance.image_url = f"{settings.MEDIA_URL}products/{product.id}/{filename}"
+            # 保存文件（按内容哈希命名，相同图片只存一份）
+            instance.image_url = storage.save_upload(image_file)
             
             # 如果是第一张图片，设置为商品主图
             if not product.main_image_url:
                 product.main_image_url = instance.image_url
                 product.save(update_fields=['main_image_url'])
+            
+            # 事务提交后在后台生成缩略图等衍生图
+            media.schedule_derivatives(instance.image_url)
         
         if commit:
             instance.save()
@@ -129,10 +140,15 @@ class ProductAdminForm(forms.ModelForm):
                 help_text='支持格式：jpg, jpeg, png, gif, webp，最大5MB。',
                 widget=forms.FileInput(attrs={'accept': 'image/*'})
             )
+        if self.instance.pk and self.instance.stock_stripes and 'stock' in self.fields:
+            self.fields['stock'].help_text = (
+                f'该商品已开启库存分桶（{self.instance.stock_stripes} 个桶），此处为各桶实时汇总；'
+                '修改后按新库存重新平均分配到各桶'
+            )
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(DiscardUploadsMixin, admin.ModelAdmin):
     form = ProductAdminForm
     list_display = ['id', 'name', 'category', 'price', 'stock', 'status', 'sales_count', 'main_image_preview']
     list_filter = ['status', 'category', 'created_at']
@@ -175,39 +191,42 @@ class ProductAdmin(admin.ModelAdmin):
         return "无主图"
     main_image_preview.short_description = '主图预览'
     
+    def get_object(self, request, object_id, from_field=None):
+        """分桶商品的 products.stock 不随下单更新，编辑页显示各桶实时汇总"""
+        obj = super().get_object(request, object_id, from_field)
+        if obj is not None and obj.stock_stripes:
+            obj.stock = stock.totals([obj.id]).get(obj.id, 0)
+        return obj
+    
     def save_model(self, request, obj, form, change):
         """保存商品时处理主图上传"""
         # 先保存商品以获取ID（如果是新建）
         super().save_model(request, obj, form, change)
         
+        # 分桶商品下单只扣减各桶，直接修改 products.stock 无效：按新库存重新分配到各桶
+        if change and obj.stock_stripes and 'stock' in form.changed_data:
+            stock.configure(obj.id, obj.stock_stripes, stock=obj.stock)
+        
+        # 上传时已被拒绝的图片（格式、尺寸或大小不符）
+        for message in upload_errors(request).values():
+            messages.error(request, message)
+        
         # 如果上传了主图文件，处理保存
         main_image_file = form.cleaned_data.get('main_image_file')
-        if main_image_file:
+        if main_image_file and main_image_file.size > 5 * 1024 * 1024:
             # 验证文件大小
-            if main_image_file.size > 5 * 1024 * 1024:
-                from django.contrib import messages
-                messages.error(request, '图片文件大小不能超过5MB')
-                return
-            
-            # 创建上传目录
-            upload_dir = os.path.join(settings.MEDIA_ROOT, 'products', str(obj.id))
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # 生成文件名
-            file_ext = os.path.splitext(main_image_file.name)[1].lower()
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"{timestamp}_main{file_ext}"
-            file_path = os.path.join(upload_dir, filename)
-            
-            # 保存文件
-            with open(file_path, 'wb+') as destination:
-                for chunk in main_image_file.chunks():
-                    destination.write(chunk)
-            
-            # 生成URL并更新
-            obj.main_image_url = f"{settings.MEDIA_URL}products/{obj.id}/{filename}"
-            obj.save(update_fields=['main_image_url'])
-            
+            messages.error(request, '图片文件大小不能超过5MB')
+            main_image_file = None
+        if main_image_file:
+            # 保存文件（按内容哈希命名，相同图片只存一份）
+            obj.main_image_url = storage.save_upload(main_image_file)
+        
+        if main_image_file or 'main_image_url' in form.changed_data:
+            # 更换主图时不能保留旧图的衍生图和元数据
+            obj.main_image_derivatives, obj.main_image_meta = _main_image_media(obj.main_image_url)
+            obj.save(update_fields=['main_image_url', 'main_image_derivatives', 'main_image_meta'])
+        
+        if main_image_file:
             # 创建ProductImage记录（如果不存在）
             if not ProductImage.objects.filter(product=obj, image_url=obj.main_image_url).exists():
                 ProductImage.objects.create(
@@ -215,10 +234,13 @@ class ProductAdmin(admin.ModelAdmin):
                     image_url=obj.main_image_url,
                     sort_order=0
                 )
+            
+            # 事务提交后在后台生成缩略图等衍生图
+            media.schedule_derivatives(obj.main_image_url)
 
 
 @admin.register(ProductImage)
-class ProductImageAdmin(admin.ModelAdmin):
+class ProductImageAdmin(DiscardUploadsMixin, admin.ModelAdmin):
     form = ProductImageForm
     list_display = ['id', 'product', 'image_preview', 'sort_order', 'created_at']
     list_filter = ['created_at']
@@ -0,0 +1,146 @@
+"""
+商品相关缓存
+
+分类树缓存：分类数据几乎不变，构建一次后保存在进程内存中。
+共享缓存中只保存一个版本号，分类或商品上下架变化时由信号递增版本号，
+各进程发现版本号变化后重新构建，稳定状态下读取无需访问数据库。
+
+商品详情缓存：按商品 ID 缓存序列化后的详情数据（含 updated_at），
+商品、所属分类或商品图片变化时由信号删除，浏览量、销量写缓冲刷新后同样删除。
+键中不含 updated_at：读缓存前不查询数据库，拿不到当前的 updated_at，改为变更时主动删除。
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Category, CategoryClosure, Product
+from .serializers import CategorySerializer
+
+
+class CategoryTreeCache:
+    """分类列表 / 分类树缓存（带版本号和 ETag）"""
+    version_key = 'products:category_tree:version'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _current_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, 1, timeout=None)
+            version = cache.get(self.version_key, 1)
+        return version
+
+    def get(self):
+        """返回当前版本的快照：{'version', 'list', 'tree', 'descendants', 'list_etag', 'tree_etag'}"""
+        version = self._current_version()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot['version'] == version:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot['version'] != version:
+                snapshot = self._build(version)
+                self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self):
+        """递增版本号，使所有进程的快照失效"""
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 2, timeout=None)
+        self._snapshot = None
+
+    def _build(self, version):
+        categories = list(Category.objects.filter(is_show=1).order_by('sort_order', 'id'))
+        product_counts = dict(
+            Product.objects.filter(status=1)
+            .values_list('category_id')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+
+        list_data = [dict(item) for item in CategorySerializer(categories, many=True).data]
+
+        # 分类 -> 自身及所有子分类 ID（来自闭包表）
+        descendants = {}
+        for ancestor_id, descendant_id in CategoryClosure.objects.values_list('ancestor_id', 'descendant_id'):
+            descendants.setdefault(ancestor_id, []).append(descendant_id)
+
+        # 构建分类树（最多二级），每个节点携带上架商品数（含子分类）
+        tree = []
+        node_map = {}
+        for cat in categories:
+            node_map[cat.id] = {
+                'id': cat.id,
+                'name': cat.name,
+                'image_url': cat.image_url,
+                'product_count': product_counts.get(cat.id, 0),
+                'children': []
+            }
+        for cat in categories:
+            if cat.parent_id == 0:
+                tree.append(node_map[cat.id])
+            elif cat.parent_id in node_map:
+                parent = node_map[cat.parent_id]
+                parent['children'].append(node_map[cat.id])
+                parent['product_count'] += node_map[cat.id]['product_count']
+
+        return {
+            'version': version,
+            'list': list_data,
+            'tree': tree,
+            'descendants': descendants,
+            'list_etag': self._etag(list_data),
+            'tree_etag': self._etag(tree),
+        }
+
+    @staticmethod
+    def _etag(data):
+        digest = hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+        return f'"{digest}"'
+
+
+category_tree_cache = CategoryTreeCache()
+
+
+# 商品详情缓存
+
+def _detail_key(product_id):
+    return f'products:detail:{product_id}'
+
+
+def get_product_detail(product_id):
+    """读取商品详情缓存，未命中返回 None"""
+    return cache.get(_detail_key(product_id))
+
+
+def get_product_details(product_ids):
+    """批量读取商品详情缓存，返回 {商品ID: 详情数据}"""
+    keys = {_detail_key(pk): pk for pk in product_ids}
+    found = cache.get_many(list(keys))
+    return {keys[key]: value for key, value in found.items()}
+
+
+def set_product_detail(data):
+    """写入商品详情缓存（data 为 ProductDetailSerializer 输出）"""
+    set_product_details([data])
+
+
+def set_product_details(items):
+    """批量写入商品详情缓存"""
+    timeout = getattr(settings, 'PRODUCT_DETAIL_CACHE_TTL', 300)
+    cache.set_many({_detail_key(data['id']): data for data in items}, timeout=timeout)
+
+
+def invalidate_product_details(product_ids):
+    """删除商品详情缓存"""
+    keys = [_detail_key(pk) for pk in product_ids]
+    if keys:
+        cache.delete_many(keys)
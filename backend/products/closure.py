@@ -0,0 +1,51 @@
+"""
+分类闭包表（category_closure）维护
+
+Category.parent_id 只记录直接父分类，闭包表展开为 (祖先, 后代, 距离) 的全部组合，
+"分类 X 及其所有子分类" 即 ancestor_id = X 的所有 descendant_id。
+分类数据量很小，父分类变化或删除时整体重建，新建分类时增量插入。
+"""
+from django.db import transaction
+
+from .models import Category, CategoryClosure
+
+
+def build_rows(parents):
+    """根据 {分类ID: 父分类ID} 计算闭包行"""
+    rows = []
+    for category_id in parents:
+        ancestor_id = category_id
+        depth = 0
+        seen = set()
+        while ancestor_id and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            rows.append(CategoryClosure(ancestor_id=ancestor_id, descendant_id=category_id, depth=depth))
+            ancestor_id = parents.get(ancestor_id)
+            depth += 1
+    return rows
+
+
+def rebuild():
+    """全量重建闭包表，返回行数"""
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    rows = build_rows(parents)
+    with transaction.atomic():
+        CategoryClosure.objects.all().delete()
+        CategoryClosure.objects.bulk_create(rows)
+    return len(rows)
+
+
+def add_category(category):
+    """新建分类：插入自身及其所有祖先的闭包行"""
+    rows = [CategoryClosure(ancestor_id=category.id, descendant_id=category.id, depth=0)]
+    if category.parent_id:
+        for ancestor_id, depth in CategoryClosure.objects.filter(
+            descendant_id=category.parent_id
+        ).values_list('ancestor_id', 'depth'):
+            rows.append(CategoryClosure(ancestor_id=ancestor_id, descendant_id=category.id, depth=depth + 1))
+    CategoryClosure.objects.bulk_create(rows)
+
+
+def descendant_ids(category_id):
+    """分类及其所有子分类 ID 的子查询（用于 category_id__in）"""
+    return CategoryClosure.objects.filter(ancestor_id=category_id).values('descendant_id')
@@ -0,0 +1,21 @@
+"""
+商品计数器写缓冲
+
+详情缓存中保存了序列化时的浏览量、销量，计数写入数据库后删除这些商品的详情缓存，
+读取方不会在刷新后看到回退的旧计数（详见 ProductViewSet.retrieve）。
+"""
+from ecommerce.counters import CounterBuffer, register
+
+from .cache import invalidate_product_details
+from .models import Product, ProductListing
+
+view_count_buffer = register(CounterBuffer(Product, 'view_count', on_flush=invalidate_product_details))
+
+# 分桶（热点）商品的销量：下单不更新商品行，写缓冲后批量累加到商品和列表投影
+sales_count_buffer = register(CounterBuffer(Product, 'sales_count', on_flush=invalidate_product_details))
+listing_sales_count_buffer = register(CounterBuffer(ProductListing, 'sales_count'))
+
+
+def add_sales(product_id, delta):
+    sales_count_buffer.incr(product_id, delta)
+    listing_sales_count_buffer.incr(product_id, delta)
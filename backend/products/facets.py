@@ -0,0 +1,156 @@
+"""
+商品筛选分面计数（上架商品）
+
+在内存中维护 (分类ID, 价格区间, 是否有货) -> 商品数 的计数表：
+- 首次使用时用一条 GROUP BY 查询从列表投影构建
+- 本进程内的商品写入通过信号增量更新
+- 每隔 PRODUCT_FACET_REFRESH_INTERVAL 秒全量刷新一次，
+  以纳入其他进程的写入和批量 UPDATE（如下单扣库存）
+查询时按分类树缓存中的后代列表汇总出各级父分类计数，不访问数据库。
+"""
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .cache import category_tree_cache
+from .models import ProductListing
+
+
+def price_bucket_edges():
+    """价格区间边界（升序），例如 [0, 100, 500] 表示 [0,100)、[100,500)、[500,+∞)"""
+    edges = getattr(settings, 'PRODUCT_FACET_PRICE_BUCKETS', [0, 100, 500, 1000, 5000])
+    return sorted(Decimal(str(edge)) for edge in edges)
+
+
+def facet_key(category_id, price, stock, edges):
+    """计算商品所在的分面键"""
+    bucket = 0
+    for index, edge in enumerate(edges):
+        if price >= edge:
+            bucket = index
+    return category_id, bucket, stock > 0
+
+
+class FacetIndex:
+    """分面计数表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = None
+        self._edges = None
+        self._built_at = 0
+
+    @property
+    def refresh_interval(self):
+        return getattr(settings, 'PRODUCT_FACET_REFRESH_INTERVAL', 300)
+
+    def _snapshot(self):
+        """返回 (计数项列表, 价格区间边界)，必要时先全量重建"""
+        with self._lock:
+            if self._counts is None or time.monotonic() - self._built_at >= self.refresh_interval:
+                self._edges = price_bucket_edges()
+                self._counts = self._build(self._edges)
+                self._built_at = time.monotonic()
+            return list(self._counts.items()), self._edges
+
+    @staticmethod
+    def _build(edges):
+        bucket = Case(
+            *[When(price__gte=edge, then=Value(index)) for index, edge in reversed(list(enumerate(edges)))],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        in_stock = Case(When(stock__gt=0, then=Value(1)), default=Value(0), output_field=IntegerField())
+        rows = (
+            ProductListing.objects.filter(status=1)
+            .annotate(bucket=bucket, in_stock=in_stock)
+            .values('category_id', 'bucket', 'in_stock')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        return Counter({
+            (row['category_id'], row['bucket'], bool(row['in_stock'])): row['count']
+            for row in rows
+        })
+
+    def invalidate(self):
+        """下次查询时全量重建"""
+        self._counts = None
+
+    def state_of(self, status, category_id, price, stock):
+        """商品对应的分面键（未上架返回 None）"""
+        if status != 1 or price is None:
+            return None
+        edges = self._edges or price_bucket_edges()
+        return facet_key(category_id, Decimal(str(price)), stock, edges)
+
+    def apply(self, old_key, new_key):
+        """增量更新：商品从 old_key 移到 new_key（None 表示不计入）"""
+        if old_key == new_key or self._counts is None:
+            return
+        with self._lock:
+            counts = self._counts
+            if counts is None:
+                return
+            if old_key is not None and counts[old_key] > 0:
+                counts[old_key] -= 1
+            if new_key is not None:
+                counts[new_key] += 1
+
+    def summary(self, category_ids=None):
+        """
+        返回分面计数
+
+        category_ids 为 None 时统计全部上架商品；否则价格区间、库存计数只统计这些分类。
+        """
+        items, edges = self._snapshot()
+        selected = set(category_ids) if category_ids is not None else None
+
+        by_category = Counter()
+        by_bucket = Counter()
+        by_stock = Counter()
+        for (category_id, bucket, in_stock), count in items:
+            if not count:
+                continue
+            by_category[category_id] += count
+            if selected is None or category_id in selected:
+                by_bucket[bucket] += count
+                by_stock[in_stock] += count
+
+        # 分类计数包含所有层级的子分类（按闭包表的后代列表汇总，后代列表含分类自身）
+        snapshot = category_tree_cache.get()
+        descendants = snapshot['descendants']
+        category_counts = {}
+        for item in snapshot['list']:
+            category_counts[item['id']] = sum(
+                by_category.get(descendant_id, 0) for descendant_id in descendants.get(item['id'], [item['id']])
+            )
+
+        price_ranges = []
+        for index, edge in enumerate(edges):
+            upper = edges[index + 1] if index + 1 < len(edges) else None
+            price_ranges.append({
+                'min': str(edge),
+                'max': str(upper) if upper is not None else None,
+                'count': by_bucket.get(index, 0),
+            })
+
+        return {
+            'total': by_stock[True] + by_stock[False],
+            'categories': [
+                {'category_id': item['id'], 'count': category_counts.get(item['id'], 0)}
+                for item in snapshot['list']
+            ],
+            'price_ranges': price_ranges,
+            'stock': {
+                'in_stock': by_stock[True],
+                'out_of_stock': by_stock[False],
+            },
+        }
+
+
+facet_index = FacetIndex()
@@ -0,0 +1,127 @@
+"""
+图片处理（纯 Pillow 实现，不依赖 Django）
+
+本模块中的函数会在图片处理进程池的子进程中执行，
+因此不能导入 Django 模型或读取 settings，所有参数由调用方传入。
+"""
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+# 输出格式 -> (Pillow 格式名, 文件扩展名)
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+
+def _flatten(image, background=(255, 255, 255)):
+    """去掉透明通道（JPEG 不支持透明，铺白底）"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        canvas = Image.new('RGB', image.size, background)
+        canvas.paste(image, mask=image.getchannel('A'))
+        return canvas
+    return image.convert('RGB')
+
+
+# EXIF 方向值为 5-8 时图片显示时宽高互换
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def extract_metadata(source_path, strict=True):
+    """
+    提取图片元数据：显示宽高（已考虑 EXIF 方向）、字节数、格式、主色（#rrggbb，用作占位色）
+
+    strict 为 False 时无法解析的图片返回 None（供批量回填时使用）。
+    """
+    try:
+        with Image.open(source_path) as image:
+            width, height = image.size
+            if image.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            image_format = (image.format or '').lower()
+            # JPEG 可按缩小比例直接解码，避免解码整张大图
+            image.draft('RGB', (64, 64))
+            small = _flatten(image)
+            small.thumbnail((64, 64))
+    except Exception:
+        if strict:
+            raise
+        return None
+    return {
+        'width': width,
+        'height': height,
+        'file_size': os.path.getsize(source_path),
+        'image_format': image_format,
+        'dominant_color': dominant_color(small),
+    }
+
+
+def dominant_color(image):
+    """图片主色：量化为 5 种颜色后取像素最多的一种"""
+    quantized = image.quantize(colors=5)
+    palette = quantized.getpalette()
+    _, index = max(quantized.getcolors())
+    r, g, b = palette[index * 3:index * 3 + 3]
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+def process_image(source_path, output_dir, sizes, formats, quality=82, render=True):
+    """
+    图片后台处理任务：生成衍生图（render 为 False 时衍生图已存在，只返回文件名）并提取元数据
+
+    返回 {'derivatives': {...}, 'meta': {...}}
+    """
+    if render:
+        derivatives = generate_derivatives(source_path, output_dir, sizes, formats, quality)
+    else:
+        derivatives = derivative_filenames(sizes, formats)
+    return {'derivatives': derivatives, 'meta': extract_metadata(source_path)}
+
+
+def derivative_filenames(sizes, formats):
+    """衍生图文件名：{'thumbnail': {'webp': 'thumbnail.webp', ...}, ...}"""
+    return {name: {fmt: f'{name}.{FORMATS[fmt][1]}' for fmt in formats} for name in sizes}
+
+
+def _save_atomic(image, path, pil_format, **options):
+    """先写同目录临时文件再重命名，读取方（或并发生成同一图片的进程）不会看到写了一半的文件"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, pil_format, **options)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def generate_derivatives(source_path, output_dir, sizes, formats, quality=82):
+    """
+    生成缩略图等衍生图
+
+    sizes: {'thumbnail': 200, ...}，按最长边等比缩小（不放大）
+    formats: ['webp', 'jpeg']
+    返回 {'thumbnail': {'webp': 文件名, 'jpeg': 文件名}, ...}（文件名相对 output_dir）
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    result = derivative_filenames(sizes, formats)
+    with Image.open(source_path) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'P', 'PA') else 'RGB')
+
+        for name, max_side in sizes.items():
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            for fmt, filename in result[name].items():
+                pil_format = FORMATS[fmt][0]
+                path = os.path.join(output_dir, filename)
+                if fmt == 'jpeg':
+                    _save_atomic(_flatten(resized), path, pil_format, quality=quality, optimize=True)
+                else:
+                    _save_atomic(resized, path, pil_format, quality=quality)
+    return result
@@ -0,0 +1,52 @@
+"""
+商品列表读模型（product_listing）维护
+"""
+from django.db import connection
+
+from .models import Product, ProductListing
+
+_UPDATE_FIELDS = ['category_id', 'category_name'] + ProductListing.PRODUCT_FIELDS
+
+
+def upsert_listings(products, batch_size=1000):
+    """写入或更新商品的列表投影（商品需已 select_related('category')）"""
+    rows = [ProductListing.from_product(product, product.category.name) for product in products]
+    if not rows:
+        return 0
+    options = {'update_conflicts': True, 'update_fields': _UPDATE_FIELDS}
+    if connection.features.supports_update_conflicts_with_target:
+        options['unique_fields'] = ['id']
+    ProductListing.objects.bulk_create(rows, batch_size=batch_size, **options)
+    return len(rows)
+
+
+def sync_product(product):
+    """同步单个商品的列表投影"""
+    upsert_listings([product])
+
+
+def delete_product(product_id):
+    ProductListing.objects.filter(id=product_id).delete()
+
+
+def sync_category_name(category_id, name):
+    """分类改名后更新冗余的分类名称"""
+    ProductListing.objects.filter(category_id=category_id).exclude(category_name=name).update(category_name=name)
+
+
+def rebuild(batch_size=1000, progress=None):
+    """从商品表全量重建列表投影，返回重建的商品数"""
+    queryset = Product.objects.select_related('category').order_by('id')
+    last_id = 0
+    total = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        total += upsert_listings(batch, batch_size=batch_size)
+        last_id = batch[-1].id
+        if progress:
+            progress(total)
+    # 清理已删除商品的投影
+    ProductListing.objects.exclude(id__in=Product.objects.values('id')).delete()
+    return total
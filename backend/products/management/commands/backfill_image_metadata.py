@@ -0,0 +1,26 @@
+"""
+回填已有商品图片的元数据（宽高、字节数、格式、主色）
+
+用法：python manage.py backfill_image_metadata [--batch-size 200] [--workers N] [--force]
+"""
+from django.core.management.base import BaseCommand
+
+from products import media
+
+
+class Command(BaseCommand):
+    help = '为已有商品图片和商品主图回填元数据（多进程并行解析）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='每批处理的图片数量')
+        parser.add_argument('--workers', type=int, default=None, help='并行进程数（默认 CPU 核数）')
+        parser.add_argument('--force', action='store_true', help='重新提取已有元数据的图片')
+
+    def handle(self, *args, **options):
+        processed, failed = media.backfill_metadata(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            force=options['force'],
+            progress=lambda count, errors: self.stdout.write(f'已处理 {count} 张图片（无法解析 {errors} 张）'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'元数据回填完成：{processed} 张图片，无法解析 {failed} 张'))
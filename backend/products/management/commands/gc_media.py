@@ -0,0 +1,47 @@
+"""
+媒体文件垃圾回收（增量、可续跑）
+
+用法：python manage.py gc_media [--batch-size 1000] [--max-files N] [--grace-hours 24] [--dry-run]
+"""
+from django.core.management.base import BaseCommand
+
+from products import media_gc
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f'{size:.0f}{unit}' if unit == 'B' else f'{size:.1f}{unit}'
+        size /= 1024
+    return f'{size:.1f}GB'
+
+
+class Command(BaseCommand):
+    help = '清理 MEDIA_ROOT 中无引用的文件（先隔离，超过宽限期后删除）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批检查的文件数量')
+        parser.add_argument('--max-files', type=int, default=None, help='本次最多扫描的文件数，下次从断点继续')
+        parser.add_argument('--grace-hours', type=float, default=24, help='宽限期（小时）：新文件不处理，隔离文件超过该时间后删除')
+        parser.add_argument('--dry-run', action='store_true', help='只统计，不移动或删除文件')
+
+    def handle(self, *args, **options):
+        stats = media_gc.collect(
+            batch_size=options['batch_size'],
+            max_files=options['max_files'],
+            grace_hours=options['grace_hours'],
+            dry_run=options['dry_run'],
+            progress=lambda stats: self.stdout.write(
+                f"已扫描 {stats['scanned']} 个文件，隔离 {stats['quarantined']} 个"
+            ),
+        )
+        prefix = '[dry-run] ' if options['dry_run'] else ''
+        self.stdout.write(
+            f"{prefix}删除隔离文件 {stats['purged']} 个，释放 {_format_bytes(stats['reclaimed_bytes'])}；"
+            f"恢复仍被引用的文件 {stats['restored']} 个"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}本轮扫描 {stats['scanned']} 个文件，隔离 {stats['quarantined']} 个"
+            f"（{_format_bytes(stats['quarantined_bytes'])}，宽限期后删除）"
+            + ('，已扫描完一轮' if stats['finished'] else '，下次从断点继续')
+        ))
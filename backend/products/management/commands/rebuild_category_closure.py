@@ -0,0 +1,16 @@
+"""
+重建分类闭包表
+
+用法：python manage.py rebuild_category_closure
+"""
+from django.core.management.base import BaseCommand
+
+from products import closure
+
+
+class Command(BaseCommand):
+    help = '根据分类的 parent_id 全量重建分类闭包表'
+
+    def handle(self, *args, **options):
+        total = closure.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'分类闭包表重建完成：{total} 行'))
@@ -0,0 +1,22 @@
+"""
+重建商品列表投影（product_listing）
+
+用法：python manage.py rebuild_product_listing [--batch-size 1000]
+"""
+from django.core.management.base import BaseCommand
+
+from products import listing
+
+
+class Command(BaseCommand):
+    help = '从商品表全量重建商品列表投影'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批处理的商品数量')
+
+    def handle(self, *args, **options):
+        total = listing.rebuild(
+            batch_size=options['batch_size'],
+            progress=lambda count: self.stdout.write(f'已同步 {count} 个商品'),
+        )
+        self.stdout.write(self.style.SUCCESS(f'列表投影重建完成：{total} 个商品'))
@@ -0,0 +1,37 @@
+"""
+重建商品搜索索引
+
+用法：python manage.py rebuild_search_index [--batch-size 500]
+"""
+from django.core.management.base import BaseCommand
+
+from products.models import Product, ProductSearchTerm
+from products import search
+
+
+class Command(BaseCommand):
+    help = '从零重建商品搜索倒排索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的商品数量')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        deleted, _ = ProductSearchTerm.objects.all().delete()
+        self.stdout.write(f'已清空旧索引（{deleted} 条）')
+
+        queryset = Product.objects.select_related('category').order_by('id')
+        last_id = 0
+        product_total = 0
+        term_total = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            term_total += search.index_products(batch)
+            product_total += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f'已索引 {product_total} 个商品')
+
+        self.stdout.write(self.style.SUCCESS(f'索引重建完成：{product_total} 个商品，{term_total} 个词项'))
@@ -0,0 +1,30 @@
+"""
+设置热点商品的库存分桶
+
+用法：python manage.py stripe_stock <商品ID> --stripes 16 [--stock 10000]
+      python manage.py stripe_stock <商品ID> --stripes 0   # 关闭分桶，各桶库存合并回商品
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from products import stock
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = '设置商品的库存分桶数（秒杀等热点商品），已有库存平均分配到各桶'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int, help='商品ID')
+        parser.add_argument('--stripes', type=int, required=True, help='分桶数，0 表示关闭分桶')
+        parser.add_argument('--stock', type=int, default=None, help='同时修改库存（分桶商品只能通过此参数修改库存）')
+
+    def handle(self, *args, **options):
+        if options['stripes'] < 0:
+            raise CommandError('分桶数不能为负数')
+        try:
+            total = stock.configure(options['product_id'], options['stripes'], stock=options['stock'])
+        except Product.DoesNotExist:
+            raise CommandError(f"商品 {options['product_id']} 不存在")
+        self.stdout.write(self.style.SUCCESS(
+            f"商品 {options['product_id']} 分桶数 {options['stripes']}，库存 {total}"
+        ))
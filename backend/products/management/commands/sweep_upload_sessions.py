@@ -0,0 +1,21 @@
+"""
+清理过期的断点续传上传会话
+
+用法：python manage.py sweep_upload_sessions [--batch-size 500]
+"""
+from django.core.management.base import BaseCommand
+
+from products import uploads
+
+
+class Command(BaseCommand):
+    help = '删除过期的断点续传上传会话及其暂存文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批删除的会话数量')
+
+    def handle(self, *args, **options):
+        sessions, reclaimed = uploads.sweep(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'已清理 {sessions} 个过期上传会话，释放 {reclaimed / 1024 / 1024:.1f}MB'
+        ))
@@ -0,0 +1,16 @@
+"""
+把分桶商品的汇总库存回写到商品和列表投影（供分面计数、后台使用，可定时执行）
+
+用法：python manage.py sync_stock_buckets
+"""
+from django.core.management.base import BaseCommand
+
+from products import stock
+
+
+class Command(BaseCommand):
+    help = '把分桶商品各桶库存之和回写到商品表和商品列表投影'
+
+    def handle(self, *args, **options):
+        count = stock.sync_totals()
+        self.stdout.write(self.style.SUCCESS(f'已同步 {count} 个分桶商品的库存'))
@@ -0,0 +1,339 @@
+"""
+商品图片媒体处理
+
+多图上传：store_uploads 在有界线程池中并发校验、保存图片，失败时删除本批新写入的文件；
+上传视图用 discard_uploads_on_failure 装饰，出错时删除解析请求体时已写入存储的文件。
+
+衍生图（缩略图 / WebP）和图片元数据（宽高、字节数、格式、主色）在有界进程池中生成，不占用请求处理时间：
+- 上传代码在事务提交后调用 schedule_derivatives(image_url)
+- 子进程处理完成后，回调把衍生图 URL 和元数据写入所有使用该图片的 ProductImage / Product
+- 进程池任务数达到上限时丢弃新任务并记录日志（不阻塞请求）
+IMAGE_DERIVATIVE_WORKERS 为 0 时在当前进程同步生成（开发、测试环境）。
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import imaging, storage
+from .cache import invalidate_product_details
+from .media_gc import referenced_urls
+from .models import Product, ProductImage, ProductListing
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+_upload_executor = None
+
+
+def url_to_path(url):
+    """媒体 URL -> 本地文件路径（非本站媒体 URL 返回 None）"""
+    media_url = settings.MEDIA_URL
+    if not url or not url.startswith(media_url):
+        return None
+    return os.path.join(settings.MEDIA_ROOT, url[len(media_url):])
+
+
+def path_to_url(path):
+    relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+    return f"{settings.MEDIA_URL}{relative}"
+
+
+def derivative_dir(image_url):
+    """衍生图目录：uploads/derivatives/<原图相对路径去掉扩展名>/"""
+    relative = os.path.splitext(image_url[len(settings.MEDIA_URL):])[0]
+    return os.path.join(settings.MEDIA_ROOT, 'derivatives', relative)
+
+
+def _get_upload_executor():
+    global _upload_executor
+    with _executor_lock:
+        if _upload_executor is None:
+            _upload_executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_UPLOAD_WORKERS, thread_name_prefix='image-upload'
+            )
+        return _upload_executor
+
+
+def store_uploads(uploaded_files, validate=None):
+    """
+    并发校验并保存多张上传图片，按输入顺序返回 StoredContent 列表
+
+    validate(uploaded_file) 校验失败时抛出异常；任一图片失败时等待其余图片完成，
+    删除本批新写入且无引用的文件后抛出第一个异常。
+    """
+    def attempt(uploaded_file):
+        try:
+            if validate is not None:
+                validate(uploaded_file)
+            return storage.store_upload(uploaded_file), None
+        except Exception as exc:
+            return None, exc
+
+    if len(uploaded_files) > 1:
+        outcomes = list(_get_upload_executor().map(attempt, uploaded_files))
+    else:
+        outcomes = [attempt(uploaded_file) for uploaded_file in uploaded_files]
+
+    errors = [error for _, error in outcomes if error is not None]
+    if errors:
+        discard_unreferenced(stored.url for stored, _ in outcomes if stored is not None and stored.created)
+        # 接收时已写入存储但未通过校验的文件
+        discard_uploads(uploaded_files)
+        raise errors[0]
+    return [stored for stored, _ in outcomes]
+
+
+def discard_uploads(uploaded_files):
+    """删除接收时新写入存储（ImageUploadHandler）且无引用的上传文件；可传入 request.FILES"""
+    if hasattr(uploaded_files, 'lists'):
+        uploaded_files = [f for _, files in uploaded_files.lists() for f in files]
+    return discard_unreferenced(f.url for f in uploaded_files if getattr(f, 'created', False))
+
+
+def discard_request_uploads(request):
+    """删除请求中接收时新写入存储且无引用的上传文件；请求体尚未解析时不做任何事（不为此触发解析）"""
+    # DRF Request 与 Django HttpRequest 解析请求体后都把文件保存在 _files 中
+    uploaded_files = getattr(request, '_files', None)
+    if not hasattr(uploaded_files, 'lists'):
+        return 0
+    return discard_uploads(uploaded_files)
+
+
+def discard_uploads_on_failure(view_method):
+    """
+    视图方法装饰器：抛出异常或返回错误响应（状态码 >= 400）时删除请求中已写入存储且无引用的上传文件
+
+    ImageUploadHandler 在解析请求体时就把图片写入了内容寻址存储，任何提前返回都需要回收这些文件。
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except BaseException:
+            discard_request_uploads(request)
+            raise
+        if response.status_code >= 400:
+            discard_request_uploads(request)
+        return response
+    return wrapper
+
+
+def discard_unreferenced(urls):
+    """删除没有被引用的内容寻址文件（用于上传失败回滚）"""
+    urls = set(url for url in urls if storage.is_content_addressed(url))
+    if not urls:
+        return 0
+    return sum(storage.delete(url) for url in urls - referenced_urls(urls))
+
+
+def _get_executor():
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            workers = settings.IMAGE_DERIVATIVE_WORKERS
+            # spawn：子进程不继承 Django 进程的线程和数据库连接
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _slots = threading.BoundedSemaphore(settings.IMAGE_DERIVATIVE_MAX_PENDING)
+        return _executor
+
+
+def schedule_derivatives(image_url):
+    """在当前事务提交后为图片安排生成衍生图"""
+    if url_to_path(image_url) is None:
+        return
+    transaction.on_commit(partial(_submit, image_url))
+
+
+def _derivatives_exist(image_url):
+    """内容寻址图片的衍生图已存在（同一图片被重复上传）时无需重新生成"""
+    if not storage.is_content_addressed(image_url):
+        return False
+    base_dir = derivative_dir(image_url)
+    filenames = imaging.derivative_filenames(settings.IMAGE_DERIVATIVE_SIZES, settings.IMAGE_DERIVATIVE_FORMATS)
+    return all(
+        os.path.exists(os.path.join(base_dir, filename))
+        for files in filenames.values() for filename in files.values()
+    )
+
+
+def _submit(image_url):
+    source_path = url_to_path(image_url)
+    if not os.path.exists(source_path):
+        return
+    args = (
+        source_path,
+        derivative_dir(image_url),
+        settings.IMAGE_DERIVATIVE_SIZES,
+        settings.IMAGE_DERIVATIVE_FORMATS,
+        settings.IMAGE_DERIVATIVE_QUALITY,
+        not _derivatives_exist(image_url),
+    )
+
+    if settings.IMAGE_DERIVATIVE_WORKERS <= 0:
+        try:
+            record_processed(image_url, imaging.process_image(*args))
+        except Exception:
+            logger.exception('图片处理失败：%s', image_url)
+        return
+
+    executor = _get_executor()
+    if not _slots.acquire(blocking=False):
+        logger.warning('图片处理任务队列已满，跳过：%s', image_url)
+        return
+    try:
+        future = executor.submit(imaging.process_image, *args)
+    except Exception:
+        # 进程池异常（如子进程崩溃）不影响上传请求，下次重新创建进程池
+        _slots.release()
+        _reset_executor(executor)
+        logger.exception('图片处理任务提交失败：%s', image_url)
+        return
+    future.add_done_callback(partial(_on_done, image_url))
+
+
+def _reset_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _on_done(image_url, future):
+    _slots.release()
+    try:
+        result = future.result()
+    except BrokenProcessPool:
+        logger.exception('图片处理进程池异常：%s', image_url)
+        return
+    except Exception:
+        logger.exception('图片处理失败：%s', image_url)
+        return
+    # 回调在进程池的管理线程中执行，不经过请求周期：写入前后自行关闭失效 / 超时的数据库连接
+    close_old_connections()
+    try:
+        record_processed(image_url, result)
+    except Exception:
+        logger.exception('图片处理结果记录失败：%s', image_url)
+    finally:
+        close_old_connections()
+
+
+def record_processed(image_url, result):
+    """写入后台处理结果（衍生图 + 元数据），返回受影响的商品ID集合"""
+    with transaction.atomic():
+        product_ids = record_derivatives(image_url, result['derivatives'])
+        product_ids |= record_metadata({image_url: result['meta']})
+    if not product_ids:
+        # 处理期间图片已被删除或替换，衍生图留给媒体垃圾回收清理
+        logger.info('图片已不再被引用，跳过记录处理结果：%s', image_url)
+        return product_ids
+    invalidate_product_details(product_ids)
+    return product_ids
+
+
+def record_derivatives(image_url, result):
+    """把衍生图文件名转换为 URL，写入使用该图片的商品图片和商品主图，返回受影响的商品ID集合"""
+    base_dir = derivative_dir(image_url)
+    derivatives = {
+        name: {fmt: path_to_url(os.path.join(base_dir, filename)) for fmt, filename in files.items()}
+        for name, files in result.items()
+    }
+
+    with transaction.atomic():
+        image_product_ids = set(
+            ProductImage.objects.filter(image_url=image_url).values_list('product_id', flat=True)
+        )
+        ProductImage.objects.filter(image_url=image_url).update(derivatives=derivatives)
+
+        main_product_ids = set(Product.objects.filter(main_image_url=image_url).values_list('id', flat=True))
+        if main_product_ids:
+            Product.objects.filter(id__in=main_product_ids).update(main_image_derivatives=derivatives)
+            ProductListing.objects.filter(id__in=main_product_ids).update(main_image_derivatives=derivatives)
+
+    return image_product_ids | main_product_ids
+
+
+def record_metadata(metas):
+    """
+    批量写入图片元数据 {图片URL: 元数据}（商品图片各字段、商品及列表投影的 main_image_meta），
+    返回受影响的商品ID集合
+    """
+    metas = {url: meta for url, meta in metas.items() if meta}
+    if not metas:
+        return set()
+
+    with transaction.atomic():
+        images = list(ProductImage.objects.filter(image_url__in=list(metas)).only('id', 'product_id', 'image_url'))
+        for image in images:
+            for field, value in metas[image.image_url].items():
+                setattr(image, field, value)
+        ProductImage.objects.bulk_update(images, ProductImage.META_FIELDS, batch_size=500)
+
+        mains = list(Product.objects.filter(main_image_url__in=list(metas)).values_list('id', 'main_image_url'))
+        Product.objects.bulk_update(
+            [Product(id=pk, main_image_meta=metas[url]) for pk, url in mains], ['main_image_meta'], batch_size=500
+        )
+        ProductListing.objects.bulk_update(
+            [ProductListing(id=pk, main_image_meta=metas[url]) for pk, url in mains], ['main_image_meta'], batch_size=500
+        )
+
+    return {image.product_id for image in images} | {pk for pk, _ in mains}
+
+
+def _metadata_pending_urls(force=False):
+    """需要回填元数据的本站图片 URL（去重）"""
+    seen = set()
+    images = ProductImage.objects.order_by('id')
+    products = Product.objects.exclude(main_image_url__isnull=True).exclude(main_image_url='').order_by('id')
+    if not force:
+        images = images.filter(width__isnull=True)
+        products = products.filter(main_image_meta={})
+    for queryset, field in ((images, 'image_url'), (products, 'main_image_url')):
+        for url in queryset.values_list(field, flat=True).iterator(chunk_size=2000):
+            if url not in seen and url_to_path(url) is not None:
+                seen.add(url)
+                yield url
+
+
+def backfill_metadata(batch_size=200, workers=None, force=False, progress=None):
+    """
+    为已有图片回填元数据，返回 (处理的图片数, 失败数)
+
+    每批图片在进程池中并行解析，结果用批量 UPDATE 写入；force 为 True 时重新提取全部图片。
+    """
+    processed = failed = 0
+    batch = []
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def flush():
+        nonlocal processed, failed
+        paths = [url_to_path(url) for url in batch]
+        metas = dict(zip(batch, executor.map(imaging.extract_metadata, paths, repeat(False), chunksize=8)))
+        failed += sum(1 for meta in metas.values() if meta is None)
+        invalidate_product_details(record_metadata(metas))
+        processed += len(batch)
+        batch.clear()
+        if progress:
+            progress(processed, failed)
+
+    try:
+        for url in _metadata_pending_urls(force):
+            batch.append(url)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        executor.shutdown()
+    return processed, failed
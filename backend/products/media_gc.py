@@ -0,0 +1,248 @@
+"""
+媒体文件垃圾回收（MEDIA_ROOT）
+
+商品删除、主图替换后，旧图片文件不会被自动删除。本模块增量清理无引用的文件：
+- 按路径顺序分批扫描，每批对各引用字段做一次 IN 查询（不按文件逐个查询）
+- 扫描进度保存在 MEDIA_ROOT/.gc_state.json，中断或设置 max_files 后下次从断点继续
+- 无引用的文件先移入 MEDIA_ROOT/.quarantine/<批次时间>/，超过宽限期后再删除；
+  删除前重新检查引用，期间又被引用的文件移回原位置
+- 修改时间在宽限期内的文件（可能属于尚未提交的上传）不处理；移入隔离目录前后再次检查修改时间
+衍生图 derivatives/<原图路径去掉扩展名>/... 在原图仍被引用时保留。
+"""
+import json
+import os
+import shutil
+import time
+
+from django.apps import apps
+from django.conf import settings
+
+QUARANTINE_DIR = '.quarantine'
+STATE_FILE = '.gc_state.json'
+DERIVATIVES_DIR = 'derivatives'
+TMP_DIR = 'cas/tmp'
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
+
+# 保存媒体 URL 的字段：(应用, 模型, 字段)；订单商品图片快照、用户头像同样需要保留
+REFERENCE_FIELDS = [
+    ('products', 'ProductImage', 'image_url'),
+    ('products', 'Product', 'main_image_url'),
+    ('products', 'Category', 'image_url'),
+    ('orders', 'OrderItem', 'product_image'),
+    ('users', 'User', 'avatar_url'),
+]
+
+
+def referenced_urls(urls):
+    """返回 urls 中仍被数据库引用的 URL 集合（每个引用字段一次查询）"""
+    urls = list(set(urls))
+    referenced = set()
+    if not urls:
+        return referenced
+    for app_label, model_name, field in REFERENCE_FIELDS:
+        model = apps.get_model(app_label, model_name)
+        referenced.update(
+            model.objects.filter(**{f'{field}__in': urls}).values_list(field, flat=True).distinct()
+        )
+    return referenced
+
+
+def _candidate_urls(relative):
+    """文件被引用时数据库中可能出现的 URL（衍生图对应其原图的各种扩展名）"""
+    if relative.startswith(f'{DERIVATIVES_DIR}/'):
+        stem = relative[len(DERIVATIVES_DIR) + 1:].rsplit('/', 1)[0]
+        return [f'{settings.MEDIA_URL}{stem}{ext}' for ext in IMAGE_EXTENSIONS]
+    return [f'{settings.MEDIA_URL}{relative}']
+
+
+def unreferenced(relatives):
+    """批量判断文件（相对 MEDIA_ROOT 的路径）是否无引用，返回无引用的路径列表"""
+    candidates = {relative: _candidate_urls(relative) for relative in relatives}
+    referenced = referenced_urls(url for urls in candidates.values() for url in urls)
+    return [relative for relative, urls in candidates.items() if not referenced.intersection(urls)]
+
+
+def iter_files(root, after=None):
+    """
+    按路径顺序遍历 root 下的文件，返回相对路径（跳过隐藏文件/目录和上传临时目录）
+
+    after 为上次处理到的相对路径时，跳过不大于它的路径（整个目录可直接跳过）。
+    """
+    after_parts = tuple(after.split('/')) if after else None
+
+    def walk(parts):
+        try:
+            entries = sorted(os.scandir(os.path.join(root, *parts)), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            entry_parts = parts + (entry.name,)
+            if entry.is_dir(follow_symlinks=False):
+                if '/'.join(entry_parts) == TMP_DIR:
+                    continue
+                if after_parts and entry_parts < after_parts[:len(entry_parts)]:
+                    continue
+                yield from walk(entry_parts)
+            elif entry.is_file(follow_symlinks=False):
+                if after_parts and entry_parts <= after_parts:
+                    continue
+                yield '/'.join(entry_parts)
+
+    yield from walk(())
+
+
+def _load_state(root):
+    try:
+        with open(os.path.join(root, STATE_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_state(root, state):
+    path = os.path.join(root, STATE_FILE)
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _stale_size(path, grace_seconds):
+    """文件超过宽限期未修改时返回其大小，否则（或文件已不存在）返回 None"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if time.time() - stat.st_mtime < grace_seconds:
+        return None
+    return stat.st_size
+
+
+def _remove_empty_dirs(path, stop):
+    """删除 path 及其上层的空目录，直到 stop 为止"""
+    while path != stop and path.startswith(stop):
+        try:
+            os.rmdir(path)
+        except OSError:
+            return
+        path = os.path.dirname(path)
+
+
+def purge_quarantine(root, grace_seconds, dry_run=False, batch_size=1000):
+    """删除超过宽限期的隔离批次，返回 (删除文件数, 释放字节数, 恢复文件数)"""
+    quarantine_root = os.path.join(root, QUARANTINE_DIR)
+    purged = reclaimed = restored = 0
+    if not os.path.isdir(quarantine_root):
+        return purged, reclaimed, restored
+
+    for batch_name in sorted(os.listdir(quarantine_root)):
+        batch_root = os.path.join(quarantine_root, batch_name)
+        if not batch_name.isdigit() or time.time() - int(batch_name) < grace_seconds:
+            continue
+        relatives = list(iter_files(batch_root))
+        for start in range(0, len(relatives), batch_size):
+            chunk = relatives[start:start + batch_size]
+            orphans = set(unreferenced(chunk))
+            for relative in chunk:
+                source = os.path.join(batch_root, relative)
+                if relative not in orphans:
+                    # 隔离期间又被引用（如重新上传了相同内容），移回原位置
+                    target = os.path.join(root, relative)
+                    if not dry_run and not os.path.exists(target):
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        os.replace(source, target)
+                    restored += 1
+                    continue
+                reclaimed += os.path.getsize(source)
+                purged += 1
+                if not dry_run:
+                    os.unlink(source)
+        if not dry_run:
+            shutil.rmtree(batch_root, ignore_errors=True)
+    return purged, reclaimed, restored
+
+
+def purge_stale_uploads(root, grace_seconds, dry_run=False):
+    """删除进程异常退出后残留的上传临时文件，返回 (删除文件数, 释放字节数)"""
+    tmp_root = os.path.join(root, TMP_DIR)
+    purged = reclaimed = 0
+    if not os.path.isdir(tmp_root):
+        return purged, reclaimed
+    for entry in os.scandir(tmp_root):
+        if entry.is_file() and time.time() - entry.stat().st_mtime >= grace_seconds:
+            reclaimed += entry.stat().st_size
+            purged += 1
+            if not dry_run:
+                os.unlink(entry.path)
+    return purged, reclaimed
+
+
+def collect(batch_size=1000, max_files=None, grace_hours=24, dry_run=False, progress=None):
+    """
+    执行一轮垃圾回收，返回统计信息
+
+    max_files 限制本轮扫描的文件数，未扫描完时下次从断点继续。
+    """
+    root = str(settings.MEDIA_ROOT)
+    grace_seconds = grace_hours * 3600
+    stats = {
+        'scanned': 0, 'quarantined': 0, 'quarantined_bytes': 0,
+        'purged': 0, 'reclaimed_bytes': 0, 'restored': 0, 'finished': False,
+    }
+
+    purged, reclaimed, stats['restored'] = purge_quarantine(root, grace_seconds, dry_run, batch_size)
+    stale, stale_bytes = purge_stale_uploads(root, grace_seconds, dry_run)
+    stats['purged'] = purged + stale
+    stats['reclaimed_bytes'] = reclaimed + stale_bytes
+
+    state = _load_state(root)
+    quarantine_batch = os.path.join(root, QUARANTINE_DIR, str(int(time.time())))
+    files = iter_files(root, after=state.get('cursor'))
+    now = time.time()
+
+    while max_files is None or stats['scanned'] < max_files:
+        limit = batch_size if max_files is None else min(batch_size, max_files - stats['scanned'])
+        batch = []
+        for relative in files:
+            batch.append(relative)
+            if len(batch) >= limit:
+                break
+        if not batch:
+            stats['finished'] = True
+            break
+
+        # 宽限期内修改过的文件可能属于尚未提交的上传，本轮不处理
+        candidates = [
+            relative for relative in batch
+            if now - os.path.getmtime(os.path.join(root, relative)) >= grace_seconds
+        ]
+        for relative in unreferenced(candidates):
+            source = os.path.join(root, relative)
+            # 引用检查期间可能有相同内容的上传（存储会更新已有文件的修改时间），移动前重新检查
+            size = _stale_size(source, grace_seconds)
+            if size is None:
+                continue
+            if not dry_run:
+                target = os.path.join(quarantine_batch, relative)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(source, target)
+                # 重新检查与移动之间被更新（移动不改变修改时间），移回原位置
+                if _stale_size(target, grace_seconds) is None:
+                    if not os.path.exists(source):
+                        os.replace(target, source)
+                    continue
+                _remove_empty_dirs(os.path.dirname(source), root)
+            stats['quarantined'] += 1
+            stats['quarantined_bytes'] += size
+
+        stats['scanned'] += len(batch)
+        if not dry_run:
+            _save_state(root, {'cursor': batch[-1]})
+        if progress:
+            progress(stats)
+
+    if stats['finished'] and not dry_run:
+        # 扫描完一轮，下次从头开始
+        _save_state(root, {'cursor': None})
+    return stats
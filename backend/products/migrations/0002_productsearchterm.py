@@ -0,0 +1,99 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:26
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# 迁移编写时 products.search 的切分规则副本：迁移不引用应用代码，
+# 之后切分规则变化时由 rebuild_search_index 命令重建索引
+FIELD_WEIGHTS = (
+    ('name', 3),
+    ('category_name', 2),
+    ('subtitle', 1),
+)
+MAX_TERM_LENGTH = 32
+MIN_PREFIX_LENGTH = 3
+
+_CJK = (
+    '\u3040-\u30ff'
+    '\u3400-\u4dbf'
+    '\u4e00-\u9fff'
+    '\uac00-\ud7af'
+    '\uf900-\ufaff'
+)
+_TOKEN_RE = re.compile(f'[0-9a-z]+|[{_CJK}]+')
+_CJK_RE = re.compile(f'[{_CJK}]')
+
+
+def index_terms(text):
+    terms = set()
+    if not text:
+        return terms
+    for run in _TOKEN_RE.findall(unicodedata.normalize('NFKC', text).lower()):
+        if _CJK_RE.match(run):
+            terms.update(run)
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            word = run[:MAX_TERM_LENGTH]
+            terms.add(word)
+            terms.update(word[:i] for i in range(MIN_PREFIX_LENGTH, len(word)))
+    return terms
+
+
+def build_product_terms(product, category_name):
+    values = {
+        'name': product.name,
+        'subtitle': product.subtitle,
+        'category_name': category_name,
+    }
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        for term in index_terms(values[field]):
+            weights[term] = weights.get(term, 0) + weight
+    return weights
+
+
+def populate_search_terms(apps, schema_editor):
+    """为现有商品建立搜索索引（只使用历史模型）"""
+    Product = apps.get_model('products', 'Product')
+    ProductSearchTerm = apps.get_model('products', 'ProductSearchTerm')
+    queryset = Product.objects.select_related('category').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:500])
+        if not batch:
+            break
+        ProductSearchTerm.objects.bulk_create([
+            ProductSearchTerm(term=term, product_id=product.id, weight=weight)
+            for product in batch
+            for term, weight in build_product_terms(product, category_name=product.category.name).items()
+        ], batch_size=1000)
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=32, verbose_name='词项')),
+                ('weight', models.IntegerField(default=1, help_text='命中字段权重之和', verbose_name='权重')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='products.product', verbose_name='商品')),
+            ],
+            options={
+                'verbose_name': '商品搜索索引',
+                'verbose_name_plural': '商品搜索索引',
+                'db_table': 'product_search_terms',
+                'unique_together': {('term', 'product')},
+            },
+        ),
+        migrations.RunPython(populate_search_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:30
+
+from django.db import migrations, models
+
+LISTING_FIELDS = [
+    'name', 'subtitle', 'main_image_url', 'price', 'original_price',
+    'stock', 'sales_count', 'status', 'sort_order', 'created_at',
+]
+
+
+def populate_listing(apps, schema_editor):
+    """根据现有商品填充列表投影（商品列表接口直接读取投影，迁移后即可用）"""
+    Product = apps.get_model('products', 'Product')
+    ProductListing = apps.get_model('products', 'ProductListing')
+    queryset = Product.objects.select_related('category').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:1000])
+        if not batch:
+            break
+        ProductListing.objects.bulk_create([
+            ProductListing(
+                id=product.id,
+                category_id=product.category_id,
+                category_name=product.category.name,
+                **{field: getattr(product, field) for field in LISTING_FIELDS},
+            )
+            for product in batch
+        ])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_productsearchterm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='商品ID')),
+                ('category_id', models.BigIntegerField(verbose_name='分类ID')),
+                ('category_name', models.CharField(max_length=100, verbose_name='分类名称')),
+                ('name', models.CharField(max_length=200, verbose_name='商品名称')),
+                ('subtitle', models.CharField(blank=True, max_length=255, null=True, verbose_name='商品副标题')),
+                ('main_image_url', models.CharField(blank=True, max_length=255, null=True, verbose_name='主图URL')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='商品价格')),
+                ('original_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='原价')),
+                ('stock', models.IntegerField(default=0, verbose_name='库存')),
+                ('sales_count', models.IntegerField(default=0, verbose_name='销量')),
+                ('status', models.IntegerField(default=1, verbose_name='状态')),
+                ('sort_order', models.IntegerField(default=0, verbose_name='排序')),
+                ('created_at', models.DateTimeField(verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '商品列表投影',
+                'verbose_name_plural': '商品列表投影',
+                'db_table': 'product_listing',
+                'indexes': [models.Index(fields=['status', 'sort_order', 'created_at'], name='listing_status_sort_idx'), models.Index(fields=['status', 'price'], name='listing_status_price_idx'), models.Index(fields=['status', 'category_id', 'sort_order', 'created_at'], name='listing_cat_sort_idx'), models.Index(fields=['status', 'category_id', 'price'], name='listing_cat_price_idx')],
+            },
+        ),
+        migrations.RunPython(populate_listing, migrations.RunPython.noop),
+    ]
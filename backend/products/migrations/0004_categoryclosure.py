@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+def populate_closure(apps, schema_editor):
+    """根据现有分类的 parent_id 填充闭包表"""
+    Category = apps.get_model('products', 'Category')
+    CategoryClosure = apps.get_model('products', 'CategoryClosure')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    rows = []
+    for category_id in parents:
+        ancestor_id = category_id
+        depth = 0
+        seen = set()
+        while ancestor_id and ancestor_id not in seen:
+            seen.add(ancestor_id)
+            rows.append(CategoryClosure(ancestor_id=ancestor_id, descendant_id=category_id, depth=depth))
+            ancestor_id = parents.get(ancestor_id)
+            depth += 1
+    CategoryClosure.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_productlisting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ancestor_id', models.BigIntegerField(verbose_name='祖先分类ID')),
+                ('descendant_id', models.BigIntegerField(verbose_name='后代分类ID')),
+                ('depth', models.IntegerField(default=0, help_text='0表示自身', verbose_name='层级距离')),
+            ],
+            options={
+                'verbose_name': '分类闭包',
+                'verbose_name_plural': '分类闭包',
+                'db_table': 'category_closure',
+                'indexes': [models.Index(fields=['descendant_id'], name='category_cl_descend_2dcefb_idx')],
+                'unique_together': {('ancestor_id', 'descendant_id')},
+            },
+        ),
+        migrations.RunPython(populate_closure, migrations.RunPython.noop),
+    ]
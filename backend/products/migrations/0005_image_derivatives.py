@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_categoryclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='main_image_derivatives',
+            field=models.JSONField(blank=True, default=dict, help_text='缩略图等衍生图URL', verbose_name='主图衍生图'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, help_text='缩略图等衍生图URL', verbose_name='衍生图'),
+        ),
+        migrations.AddField(
+            model_name='productlisting',
+            name='main_image_derivatives',
+            field=models.JSONField(blank=True, default=dict, verbose_name='主图衍生图'),
+        ),
+    ]
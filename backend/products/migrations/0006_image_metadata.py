@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='main_image_meta',
+            field=models.JSONField(blank=True, default=dict, help_text='宽高、字节数、格式、主色', verbose_name='主图元数据'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='dominant_color',
+            field=models.CharField(blank=True, default='', help_text='#rrggbb，图片加载前的占位色', max_length=7, verbose_name='主色'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='file_size',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='高度'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_format',
+            field=models.CharField(blank=True, default='', max_length=10, verbose_name='图片格式'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='宽度'),
+        ),
+        migrations.AddField(
+            model_name='productlisting',
+            name='main_image_meta',
+            field=models.JSONField(blank=True, default=dict, verbose_name='主图元数据'),
+        ),
+    ]
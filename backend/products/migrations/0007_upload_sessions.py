@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_image_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.CharField(max_length=32, primary_key=True, serialize=False, verbose_name='上传ID')),
+                ('filename', models.CharField(max_length=255, verbose_name='原文件名')),
+                ('total_size', models.BigIntegerField(verbose_name='文件大小（字节）')),
+                ('received', models.BigIntegerField(default=0, verbose_name='已接收字节数')),
+                ('sort_order', models.IntegerField(default=0, verbose_name='图片排序')),
+                ('status', models.IntegerField(default=0, help_text='0-上传中, 1-已完成', verbose_name='状态')),
+                ('expires_at', models.DateTimeField(verbose_name='过期时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.productimage', verbose_name='商品图片')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='products.product', verbose_name='商品')),
+            ],
+            options={
+                'verbose_name': '上传会话',
+                'verbose_name_plural': '上传会话',
+                'db_table': 'upload_sessions',
+                'indexes': [models.Index(fields=['expires_at'], name='upload_sess_expires_aebd1e_idx')],
+            },
+        ),
+    ]
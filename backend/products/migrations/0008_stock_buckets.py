@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-18 04:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_stripes',
+            field=models.PositiveSmallIntegerField(default=0, help_text='0-不分桶；大于0时库存分散到多个桶（秒杀等热点商品）', verbose_name='库存分桶数'),
+        ),
+        migrations.AddField(
+            model_name='productlisting',
+            name='stock_stripes',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='库存分桶数'),
+        ),
+        migrations.CreateModel(
+            name='StockBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='桶序号')),
+                ('stock', models.IntegerField(default=0, verbose_name='库存')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_buckets', to='products.product', verbose_name='商品')),
+            ],
+            options={
+                'verbose_name': '库存分桶',
+                'verbose_name_plural': '库存分桶',
+                'db_table': 'stock_buckets',
+                'unique_together': {('product', 'slot')},
+            },
+        ),
+    ]
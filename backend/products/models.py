@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from decimal import Decimal
 
 
@@ -21,20 +21,47 @@ class Category(models.Model):
             models.Index(fields=['is_show']),
         ]
 
+    def save(self, *args, **kwargs):
+        # 分类改名时需同步更新商品的派生数据，放在同一事务中提交
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
 
+class CategoryClosure(models.Model):
+    """分类闭包表（祖先 -> 后代，含自身），用于一次查询取出分类及其所有子分类"""
+    ancestor_id = models.BigIntegerField(verbose_name='祖先分类ID')
+    descendant_id = models.BigIntegerField(verbose_name='后代分类ID')
+    depth = models.IntegerField(default=0, verbose_name='层级距离', help_text='0表示自身')
+
+    class Meta:
+        db_table = 'category_closure'
+        verbose_name = '分类闭包'
+        verbose_name_plural = '分类闭包'
+        unique_together = [['ancestor_id', 'descendant_id']]
+        indexes = [
+            models.Index(fields=['descendant_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id}"
+
+
 class Product(models.Model):
     """商品表"""
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='products', verbose_name='分类')
     name = models.CharField(max_length=200, verbose_name='商品名称')
     subtitle = models.CharField(max_length=255, null=True, blank=True, verbose_name='商品副标题')
     main_image_url = models.CharField(max_length=255, null=True, blank=True, verbose_name='主图URL')
+    main_image_derivatives = models.JSONField(default=dict, blank=True, verbose_name='主图衍生图', help_text='缩略图等衍生图URL')
+    main_image_meta = models.JSONField(default=dict, blank=True, verbose_name='主图元数据', help_text='宽高、字节数、格式、主色')
     detail = models.TextField(null=True, blank=True, verbose_name='商品详情')
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='商品价格')
     original_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='原价')
     stock = models.IntegerField(default=0, verbose_name='库存')
+    stock_stripes = models.PositiveSmallIntegerField(default=0, verbose_name='库存分桶数', help_text='0-不分桶；大于0时库存分散到多个桶（秒杀等热点商品）')
     sales_count = models.IntegerField(default=0, verbose_name='销量')
     view_count = models.IntegerField(default=0, verbose_name='浏览量')
     status = models.IntegerField(default=1, verbose_name='状态', help_text='1-上架, 0-下架')
@@ -52,6 +79,11 @@ class Product(models.Model):
             models.Index(fields=['name']),
         ]
 
+    def save(self, *args, **kwargs):
+        # 在同一事务中保存，post_save 信号维护的派生数据（列表投影等）与商品一起提交
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -60,9 +92,18 @@ class ProductImage(models.Model):
     """商品图片表"""
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images', verbose_name='商品')
     image_url = models.CharField(max_length=255, verbose_name='图片URL')
+    derivatives = models.JSONField(default=dict, blank=True, verbose_name='衍生图', help_text='缩略图等衍生图URL')
+    width = models.PositiveIntegerField(null=True, blank=True, verbose_name='宽度')
+    height = models.PositiveIntegerField(null=True, blank=True, verbose_name='高度')
+    file_size = models.PositiveIntegerField(null=True, blank=True, verbose_name='文件大小（字节）')
+    image_format = models.CharField(max_length=10, blank=True, default='', verbose_name='图片格式')
+    dominant_color = models.CharField(max_length=7, blank=True, default='', verbose_name='主色', help_text='#rrggbb，图片加载前的占位色')
     sort_order = models.IntegerField(default=0, verbose_name='排序')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
 
+    # 上传后由后台任务提取的元数据字段
+    META_FIELDS = ['width', 'height', 'file_size', 'image_format', 'dominant_color']
+
     class Meta:
         db_table = 'product_images'
         verbose_name = '商品图片'
@@ -73,3 +114,118 @@ class ProductImage(models.Model):
 
     def __str__(self):
         return f"{self.product.name} - 图片"
+
+    def metadata(self):
+        """元数据字典（与 Product.main_image_meta 格式一致），尚未提取时返回空字典"""
+        if self.width is None:
+            return {}
+        return {field: getattr(self, field) for field in self.META_FIELDS}
+
+
+class ProductSearchTerm(models.Model):
+    """商品搜索倒排索引表（词项 -> 商品）"""
+    term = models.CharField(max_length=32, verbose_name='词项')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_terms', verbose_name='商品')
+    weight = models.IntegerField(default=1, verbose_name='权重', help_text='命中字段权重之和')
+
+    class Meta:
+        db_table = 'product_search_terms'
+        verbose_name = '商品搜索索引'
+        verbose_name_plural = '商品搜索索引'
+        unique_together = [['term', 'product']]
+
+    def __str__(self):
+        return f"{self.term} - {self.product_id}"
+
+
+class ProductListing(models.Model):
+    """商品列表读模型（只含列表字段和冗余的分类名称，由商品/分类写入时同步维护）"""
+    id = models.BigIntegerField(primary_key=True, verbose_name='商品ID')
+    category_id = models.BigIntegerField(verbose_name='分类ID')
+    category_name = models.CharField(max_length=100, verbose_name='分类名称')
+    name = models.CharField(max_length=200, verbose_name='商品名称')
+    subtitle = models.CharField(max_length=255, null=True, blank=True, verbose_name='商品副标题')
+    main_image_url = models.CharField(max_length=255, null=True, blank=True, verbose_name='主图URL')
+    main_image_derivatives = models.JSONField(default=dict, blank=True, verbose_name='主图衍生图')
+    main_image_meta = models.JSONField(default=dict, blank=True, verbose_name='主图元数据')
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='商品价格')
+    original_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='原价')
+    stock = models.IntegerField(default=0, verbose_name='库存')
+    stock_stripes = models.PositiveSmallIntegerField(default=0, verbose_name='库存分桶数')
+    sales_count = models.IntegerField(default=0, verbose_name='销量')
+    status = models.IntegerField(default=1, verbose_name='状态')
+    sort_order = models.IntegerField(default=0, verbose_name='排序')
+    created_at = models.DateTimeField(verbose_name='创建时间')
+
+    # 从商品同步的字段
+    PRODUCT_FIELDS = [
+        'name', 'subtitle', 'main_image_url', 'main_image_derivatives', 'main_image_meta', 'price', 'original_price',
+        'stock', 'stock_stripes', 'sales_count', 'status', 'sort_order', 'created_at',
+    ]
+
+    class Meta:
+        db_table = 'product_listing'
+        verbose_name = '商品列表投影'
+        verbose_name_plural = '商品列表投影'
+        # 与商品列表的 筛选 + 排序 组合一一对应（InnoDB 二级索引隐含主键 id，可用于游标分页）
+        indexes = [
+            models.Index(fields=['status', 'sort_order', 'created_at'], name='listing_status_sort_idx'),
+            models.Index(fields=['status', 'price'], name='listing_status_price_idx'),
+            models.Index(fields=['status', 'category_id', 'sort_order', 'created_at'], name='listing_cat_sort_idx'),
+            models.Index(fields=['status', 'category_id', 'price'], name='listing_cat_price_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_product(cls, product, category_name):
+        listing = cls(id=product.id, category_id=product.category_id, category_name=category_name)
+        for field in cls.PRODUCT_FIELDS:
+            setattr(listing, field, getattr(product, field))
+        return listing
+
+
+class StockBucket(models.Model):
+    """热点商品库存分桶（商品 stock_stripes > 0 时库存分散在各桶中，下单随机扣减一个桶）"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_buckets', verbose_name='商品')
+    slot = models.PositiveSmallIntegerField(verbose_name='桶序号')
+    stock = models.IntegerField(default=0, verbose_name='库存')
+
+    class Meta:
+        db_table = 'stock_buckets'
+        verbose_name = '库存分桶'
+        verbose_name_plural = '库存分桶'
+        unique_together = [['product', 'slot']]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.slot}"
+
+
+class UploadSession(models.Model):
+    """断点续传上传会话（分片追加到暂存文件，完成后保存为商品图片）"""
+    STATUS_UPLOADING = 0
+    STATUS_COMPLETED = 1
+
+    id = models.CharField(max_length=32, primary_key=True, verbose_name='上传ID')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='upload_sessions', verbose_name='商品')
+    filename = models.CharField(max_length=255, verbose_name='原文件名')
+    total_size = models.BigIntegerField(verbose_name='文件大小（字节）')
+    received = models.BigIntegerField(default=0, verbose_name='已接收字节数')
+    sort_order = models.IntegerField(default=0, verbose_name='图片排序')
+    status = models.IntegerField(default=STATUS_UPLOADING, verbose_name='状态', help_text='0-上传中, 1-已完成')
+    image = models.ForeignKey(ProductImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='商品图片')
+    expires_at = models.DateTimeField(verbose_name='过期时间')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        db_table = 'upload_sessions'
+        verbose_name = '上传会话'
+        verbose_name_plural = '上传会话'
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.id} - {self.filename}"
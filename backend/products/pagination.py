@@ -0,0 +1,173 @@
+"""
+商品列表分页
+
+- StandardResultsSetPagination：页码分页（COUNT + LIMIT/OFFSET）
+- KeysetPagination：游标（keyset）分页，按排序键定位，深翻页耗时不变，总数可选
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    """标准分页"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    游标分页
+
+    ordering 为排序字段元组（如 ('-sort_order', '-created_at', '-id')），
+    最后一个字段必须唯一（一般为 id），保证游标位置稳定。
+    游标为 base64 编码的 JSON：排序字段、定位值、翻页方向。
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'with_count'
+
+    invalid_cursor_message = '无效的分页游标'
+
+    def paginate_queryset(self, queryset, request, view=None, ordering=('-id',)):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = tuple(ordering)
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+
+        position, reverse = self.decode_cursor(request)
+        self.has_cursor = position is not None
+
+        # 总数可选：只有显式要求时才执行 COUNT
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+
+        order = self._reversed(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*order)
+        if position is not None:
+            queryset = queryset.filter(self._keyset_filter(order, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = self.has_cursor
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.has_cursor
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+            if size > 0:
+                return min(size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_paginated_response_data(self, data):
+        return {
+            'results': data,
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    # 游标编解码
+
+    def _signature(self):
+        return ','.join(self.ordering)
+
+    def encode_cursor(self, item, reverse):
+        values = [self._dump_value(self._get_value(item, field.lstrip('-'))) for field in self.ordering]
+        payload = json.dumps({'o': self._signature(), 'v': values, 'r': int(reverse)}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+        url = remove_query_param(self.base_url, self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        """返回 (定位值列表, 是否向前翻页)；无游标时返回 (None, False)"""
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+            if payload['o'] != self._signature() or len(payload['v']) != len(self.ordering):
+                raise ValueError
+            position = [
+                self._load_value(field.lstrip('-'), value)
+                for field, value in zip(self.ordering, payload['v'])
+            ]
+            return position, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _get_value(self, item, name):
+        if isinstance(item, dict):
+            return item[name]
+        return getattr(item, name)
+
+    def _dump_value(self, value):
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    def _load_value(self, name, value):
+        field = self.model._meta.get_field(name)
+        try:
+            return field.to_python(value)
+        except ValidationError:
+            raise ValueError(name)
+
+    # 排序与过滤
+
+    @staticmethod
+    def _reversed(ordering):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    @staticmethod
+    def _keyset_filter(ordering, position):
+        """
+        生成 keyset 条件，如 (a DESC, b ASC, id ASC) 从 (x, y, z) 之后：
+        a < x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
@@ -0,0 +1,182 @@
+"""
+商品搜索（倒排索引）
+
+索引覆盖商品名称、副标题和分类名称：
+- 中日韩文字按单字 + 二元组（bigram）切分，无需分词词典
+- 字母数字按单词切分，并索引不短于 MIN_PREFIX_LENGTH 的单词前缀，支持边输入边搜索；
+  更短的前缀（如 a、ip）几乎命中所有商品，分组统计时要聚合大半个倒排表，
+  因此不建索引，短查询词只匹配完整单词
+查询时要求所有查询词项都命中，按字段权重之和排序。
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Product, ProductSearchTerm
+
+# 字段权重：名称 > 分类 > 副标题
+FIELD_WEIGHTS = (
+    ('name', 3),
+    ('category_name', 2),
+    ('subtitle', 1),
+)
+
+MAX_TERM_LENGTH = 32
+MIN_PREFIX_LENGTH = 3
+MAX_QUERY_TERMS = 16
+
+_CJK = (
+    '\u3040-\u30ff'  # 日文假名
+    '\u3400-\u4dbf'  # 中日韩统一表意文字扩展A
+    '\u4e00-\u9fff'  # 中日韩统一表意文字
+    '\uac00-\ud7af'  # 韩文音节
+    '\uf900-\ufaff'  # 中日韩兼容表意文字
+)
+_TOKEN_RE = re.compile(f'[0-9a-z]+|[{_CJK}]+')
+_CJK_RE = re.compile(f'[{_CJK}]')
+
+
+def _runs(text):
+    """规范化文本（全角转半角、小写）并切分为字母数字串和中日韩文字串"""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKC', text).lower()
+    return _TOKEN_RE.findall(text)
+
+
+def index_terms(text):
+    """生成索引词项"""
+    terms = set()
+    for run in _runs(text):
+        if _CJK_RE.match(run):
+            terms.update(run)
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            word = run[:MAX_TERM_LENGTH]
+            terms.add(word)
+            terms.update(word[:i] for i in range(MIN_PREFIX_LENGTH, len(word)))
+    return terms
+
+
+def query_terms(keyword):
+    """生成查询词项（与索引词项切分规则对应）"""
+    terms = []
+    for run in _runs(keyword):
+        if _CJK_RE.match(run):
+            if len(run) == 1:
+                candidates = [run]
+            else:
+                candidates = [run[i:i + 2] for i in range(len(run) - 1)]
+        else:
+            candidates = [run[:MAX_TERM_LENGTH]]
+        for term in candidates:
+            if term not in terms:
+                terms.append(term)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def build_product_terms(product, category_name=None):
+    """计算单个商品的词项及权重"""
+    if category_name is None:
+        category_name = product.category.name if product.category_id else ''
+    values = {
+        'name': product.name,
+        'subtitle': product.subtitle,
+        'category_name': category_name,
+    }
+    weights = {}
+    for field, weight in FIELD_WEIGHTS:
+        for term in index_terms(values[field]):
+            weights[term] = weights.get(term, 0) + weight
+    return weights
+
+
+def index_product(product):
+    """增量更新单个商品的索引"""
+    weights = build_product_terms(product)
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(product_id=product.id).delete()
+        ProductSearchTerm.objects.bulk_create([
+            ProductSearchTerm(term=term, product_id=product.id, weight=weight)
+            for term, weight in weights.items()
+        ])
+
+
+def index_products(products, batch_size=1000):
+    """批量重建一组商品的索引（商品需已 select_related('category')）"""
+    products = list(products)
+    if not products:
+        return 0
+    rows = []
+    for product in products:
+        weights = build_product_terms(product)
+        rows.extend(
+            ProductSearchTerm(term=term, product_id=product.id, weight=weight)
+            for term, weight in weights.items()
+        )
+    with transaction.atomic():
+        ProductSearchTerm.objects.filter(product_id__in=[p.id for p in products]).delete()
+        ProductSearchTerm.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def reindex_category(category_id, batch_size=500):
+    """分类名称变更后，重建该分类下所有商品的索引"""
+    queryset = Product.objects.filter(category_id=category_id).select_related('category').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        index_products(batch)
+        last_id = batch[-1].id
+
+
+def matched_terms(keyword):
+    """
+    返回 (词项列表, 命中商品查询集)
+
+    查询集为 values('product_id') 分组结果，带 score（权重和）注解，
+    只包含所有词项都命中的商品；关键词无有效词项时返回 (terms, None)。
+    """
+    terms = query_terms(keyword)
+    if not terms:
+        return terms, None
+    matches = (
+        ProductSearchTerm.objects
+        .filter(term__in=terms)
+        .values('product_id')
+        .annotate(score=Sum('weight'), hits=Count('term'))
+        .filter(hits=len(terms))
+    )
+    return terms, matches
+
+
+def filter_queryset(queryset, keyword):
+    """按关键词过滤商品查询集（不改变原有排序）"""
+    terms, matches = matched_terms(keyword)
+    if matches is None:
+        return queryset.none()
+    return queryset.filter(id__in=matches.values('product_id'))
+
+
+def search_products(queryset, keyword, limit=20):
+    """
+    按相关度搜索商品
+
+    先在倒排索引中取相关度最高的候选，再回表取商品；
+    queryset 用于限定范围（如只取上架商品）。
+    """
+    terms, matches = matched_terms(keyword)
+    if matches is None:
+        return []
+    candidates = (
+        matches
+        .filter(product__in=queryset.values('id'))
+        .order_by('-score', '-product_id')[:limit]
+    )
+    ranked_ids = [row['product_id'] for row in candidates]
+    products = queryset.select_related('category').in_bulk(ranked_ids)
+    return [products[pk] for pk in ranked_ids if pk in products]
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Category, Product, ProductImage
+from .models import Category, Product, ProductImage, UploadSession
+from . import stock
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -16,8 +17,33 @@ class ProductImageSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ProductImage
-        fields = ['id', 'image_url', 'sort_order', 'created_at']
-        read_only_fields = ['created_at']
+        fields = ['id', 'image_url', 'derivatives', 'width', 'height', 'file_size', 'image_format',
+                  'dominant_color', 'sort_order', 'created_at']
+        read_only_fields = ['derivatives', 'width', 'height', 'file_size', 'image_format', 'dominant_color',
+                            'created_at']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """断点续传上传会话序列化器"""
+    upload_id = serializers.CharField(source='id', read_only=True)
+    size = serializers.IntegerField(source='total_size', read_only=True)
+    offset = serializers.IntegerField(source='received', read_only=True)
+    image = ProductImageSerializer(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['upload_id', 'filename', 'size', 'offset', 'sort_order', 'status', 'image', 'expires_at']
+        read_only_fields = fields
+
+
+class StripedStockListSerializer(serializers.ListSerializer):
+    """批量序列化商品时，分桶商品的库存一次查询汇总各桶"""
+
+    def to_representation(self, data):
+        products = list(data.all() if hasattr(data, 'all') else data)
+        items = super().to_representation(products)
+        stock.set_totals([item for item, product in zip(items, products) if product.stock_stripes])
+        return items
 
 
 class ProductListSerializer(serializers.ModelSerializer):
@@ -27,9 +53,51 @@ class ProductListSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Product
-        fields = ['id', 'name', 'subtitle', 'main_image_url', 'price', 'original_price', 
-                  'stock', 'sales_count', 'status', 'category_id', 'category_name', 'created_at']
-        read_only_fields = ['created_at']
+        list_serializer_class = StripedStockListSerializer
+        fields = ['id', 'name', 'subtitle', 'main_image_url', 'main_image_derivatives', 'main_image_meta', 'price',
+                  'original_price', 'stock', 'sales_count', 'status', 'category_id', 'category_name', 'created_at']
+        read_only_fields = ['main_image_derivatives', 'main_image_meta', 'created_at']
+
+
+class ProductListRowSerializer:
+    """
+    商品列表快速序列化器
+
+    直接把商品列表投影（ProductListing）values() 查询得到的字典转换为响应数据，
+    不走 DRF 逐字段序列化流程；金额、时间字段复用 ProductListSerializer 的字段格式化，
+    保证输出与其完全一致。
+    """
+    columns = tuple(ProductListSerializer.Meta.fields)
+
+    def __init__(self):
+        fields = ProductListSerializer().fields
+        self.formatters = {
+            name: fields[name].to_representation
+            for name in ('price', 'original_price', 'created_at')
+        }
+
+    @classmethod
+    def lookups(cls, *extra):
+        """values() 需要查询的列（stock_stripes 用于汇总分桶库存，extra 用于分页排序键等附加列）"""
+        return list(cls.columns) + ['stock_stripes'] + list(extra)
+
+    def to_representation(self, rows):
+        formatters = self.formatters
+        results = []
+        striped = []
+        for row in rows:
+            item = {}
+            for name in self.columns:
+                value = row[name]
+                if value is not None and name in formatters:
+                    value = formatters[name](value)
+                item[name] = value
+            if row['stock_stripes']:
+                striped.append(item)
+            results.append(item)
+        # 分桶（热点）商品的库存按桶实时汇总（仅本页有分桶商品时查询一次）
+        stock.set_totals(striped)
+        return results
 
 
 class ProductDetailSerializer(serializers.ModelSerializer):
@@ -39,10 +107,11 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Product
-        fields = ['id', 'category', 'name', 'subtitle', 'main_image_url', 'detail', 
-                  'price', 'original_price', 'stock', 'sales_count', 'view_count', 
+        fields = ['id', 'category', 'name', 'subtitle', 'main_image_url', 'main_image_meta', 'detail', 
+                  'price', 'original_price', 'stock', 'stock_stripes', 'sales_count', 'view_count', 
                   'status', 'sort_order', 'images', 'created_at', 'updated_at']
-        read_only_fields = ['sales_count', 'view_count', 'created_at', 'updated_at']
+        read_only_fields = ['main_image_meta', 'stock_stripes', 'sales_count', 'view_count', 'created_at',
+                            'updated_at']
 
 
 class ProductCreateSerializer(serializers.ModelSerializer):
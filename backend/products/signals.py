@@ -0,0 +1,177 @@
+"""
+商品相关信号处理（维护搜索索引、列表投影、缓存等派生数据）
+
+Product / Category 的 save() 在事务中执行，post_save 中的数据库写入与主表一起提交；
+缓存失效在保存时和事务提交后各执行一次，避免提交前被旧数据重新填充。
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Category, Product, ProductImage, ProductListing
+from . import closure, listing, search
+from .facets import facet_index
+from .cache import category_tree_cache, invalidate_product_details
+
+# 影响搜索索引的商品字段
+SEARCH_FIELDS = {'name', 'subtitle', 'category', 'category_id'}
+# 影响分类树商品数的商品字段
+CATEGORY_COUNT_FIELDS = {'status', 'category', 'category_id'}
+# 影响分面计数的商品字段
+FACET_FIELDS = {'status', 'category', 'category_id', 'price', 'stock'}
+# 影响列表投影的商品字段
+LISTING_FIELDS = {'category', 'category_id', *ProductListing.PRODUCT_FIELDS}
+
+
+def _invalidate(func, *args):
+    """立即执行一次缓存失效，并在事务提交后再执行一次"""
+    func(*args)
+    transaction.on_commit(partial(func, *args))
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, update_fields=None, raw=False, **kwargs):
+    """商品保存后增量更新搜索索引（仅更新浏览量等字段时跳过）"""
+    if raw:
+        return
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    search.index_product(instance)
+
+
+@receiver(post_save, sender=Product)
+def update_product_listing(sender, instance, update_fields=None, raw=False, **kwargs):
+    """商品保存后同步列表投影（与商品在同一事务中）"""
+    if raw:
+        return
+    if update_fields is not None and not LISTING_FIELDS.intersection(update_fields):
+        return
+    listing.sync_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def delete_product_listing(sender, instance, **kwargs):
+    listing.delete_product(instance.id)
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_state(sender, instance, raw=False, **kwargs):
+    """记录分类保存前的名称和父分类，用于判断是否需要更新派生数据"""
+    if raw or not instance.pk:
+        return
+    previous = Category.objects.filter(pk=instance.pk).values('name', 'parent_id').first()
+    if previous:
+        instance._previous_name = previous['name']
+        instance._previous_parent_id = previous['parent_id']
+
+
+@receiver(post_save, sender=Category)
+def update_category_derived_data(sender, instance, created=False, raw=False, **kwargs):
+    """分类名称变更后重建该分类下商品的索引，并更新列表投影中的分类名称"""
+    if raw or created:
+        return
+    if getattr(instance, '_previous_name', instance.name) == instance.name:
+        return
+    search.reindex_category(instance.id)
+    listing.sync_category_name(instance.id, instance.name)
+
+
+@receiver(post_save, sender=Category)
+def update_category_closure(sender, instance, created=False, raw=False, **kwargs):
+    """新建分类时增量插入闭包行，父分类变化时重建闭包表"""
+    if raw:
+        return
+    if created:
+        closure.add_category(instance)
+    elif getattr(instance, '_previous_parent_id', instance.parent_id) != instance.parent_id:
+        closure.rebuild()
+
+
+@receiver(post_delete, sender=Category)
+def delete_category_closure(sender, instance, **kwargs):
+    closure.rebuild()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, raw=False, **kwargs):
+    """分类变更后使分类树缓存失效"""
+    if raw:
+        return
+    _invalidate(category_tree_cache.invalidate)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_category_product_counts(sender, update_fields=None, raw=False, **kwargs):
+    """商品新增、删除、上下架或换分类后使分类树缓存失效（商品数变化）"""
+    if raw:
+        return
+    if update_fields is not None and not CATEGORY_COUNT_FIELDS.intersection(update_fields):
+        return
+    _invalidate(category_tree_cache.invalidate)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_detail(sender, instance, raw=False, **kwargs):
+    """商品变更后删除详情缓存"""
+    if raw:
+        return
+    _invalidate(invalidate_product_details, [instance.id])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_detail_images(sender, instance, raw=False, **kwargs):
+    """商品图片变更后删除所属商品的详情缓存"""
+    if raw:
+        return
+    _invalidate(invalidate_product_details, [instance.product_id])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_product_details(sender, instance, raw=False, **kwargs):
+    """分类变更后删除该分类下商品的详情缓存（详情中嵌套了分类信息）"""
+    if raw:
+        return
+    product_ids = Product.objects.filter(category_id=instance.id).values_list('id', flat=True)
+    _invalidate(invalidate_product_details, list(product_ids))
+
+
+def _facet_state(values):
+    if values is None:
+        return None
+    return facet_index.state_of(values['status'], values['category_id'], values['price'], values['stock'])
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_facet_state(sender, instance, update_fields=None, raw=False, **kwargs):
+    """记录商品保存前的分面键"""
+    if raw or not instance.pk:
+        return
+    if update_fields is not None and not FACET_FIELDS.intersection(update_fields):
+        return
+    values = Product.objects.filter(pk=instance.pk).values('status', 'category_id', 'price', 'stock').first()
+    instance._previous_facet_state = _facet_state(values)
+
+
+@receiver(post_save, sender=Product)
+def update_product_facets(sender, instance, created=False, update_fields=None, raw=False, **kwargs):
+    """商品保存后增量更新分面计数（事务提交后生效）"""
+    if raw:
+        return
+    if update_fields is not None and not FACET_FIELDS.intersection(update_fields):
+        return
+    old_state = None if created else getattr(instance, '_previous_facet_state', None)
+    new_state = facet_index.state_of(instance.status, instance.category_id, instance.price, instance.stock)
+    transaction.on_commit(partial(facet_index.apply, old_state, new_state))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_facets(sender, instance, **kwargs):
+    old_state = facet_index.state_of(instance.status, instance.category_id, instance.price, instance.stock)
+    transaction.on_commit(partial(facet_index.apply, old_state, None))
@@ -0,0 +1,181 @@
+"""
+热点商品库存分桶（秒杀等高并发下单）
+
+普通商品下单时条件扣减 products.stock，同一商品的并发下单在这一行的行锁上排队。
+stock_stripes = N（N > 0）的商品把库存分散到 N 行 stock_buckets：
+- 下单时随机选择一个库存足够的桶条件扣减（UPDATE ... WHERE stock >= 数量），
+  不同订单落在不同的桶上，可以并行提交，吞吐量随桶数增长
+- 同一事务内对同一商品的桶按 slot 升序加锁，与重新平衡的加锁顺序一致，不会死锁
+- 没有单个桶足够时锁定全部桶，从多个桶扣减并把剩余库存重新平均分配；
+  扣减使某个桶见底时，提交后同样重新平衡
+- 分桶商品的 products.stock / 列表投影 stock 不随下单更新（避免热点行），
+  详情、列表读取时按桶汇总（totals）；两处的值只是近似值，由 sync_stock_buckets 命令定期回写
+  （分面计数、后台列表在两次回写之间可能滞后）
+- 修改分桶商品的库存需通过 configure（stripe_stock --stock，或后台编辑页，保存时自动调用）
+"""
+import random
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .models import Product, ProductListing, StockBucket
+
+# 随机选桶扣减失败（被并发订单抢先）时的重试次数
+MAX_ATTEMPTS = 3
+
+
+def _spread(total, stripes):
+    """把 total 平均分配到 stripes 个桶，返回各桶数量"""
+    base, extra = divmod(total, stripes)
+    return [base + (1 if slot < extra else 0) for slot in range(stripes)]
+
+
+def _set_buckets(product_id, amounts):
+    """按 slot 批量设置桶库存（一条 UPDATE）"""
+    StockBucket.objects.filter(product_id=product_id).update(stock=Case(
+        *[When(slot=slot, then=Value(amount)) for slot, amount in enumerate(amounts)],
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+
+
+def totals(product_ids):
+    """分桶商品的实时库存 {商品ID: 各桶之和}（一次查询）"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    rows = (
+        StockBucket.objects.filter(product_id__in=product_ids)
+        .values('product_id')
+        .annotate(total=Sum('stock'))
+        .order_by()
+    )
+    return {row['product_id']: row['total'] for row in rows}
+
+
+def set_totals(items):
+    """把分桶商品数据字典（含 id、stock）中的 stock 替换为各桶实时汇总（一次查询）"""
+    if items:
+        found = totals(item['id'] for item in items)
+        for item in items:
+            item['stock'] = found.get(item['id'], 0)
+    return items
+
+
+def apply_totals(items):
+    """商品数据字典（含 stock_stripes）中分桶商品的 stock 替换为实时汇总，返回 items"""
+    set_totals([item for item in items if item.get('stock_stripes')])
+    return items
+
+
+@transaction.atomic
+def configure(product_id, stripes, stock=None):
+    """
+    设置商品的库存分桶数（0 表示关闭分桶），返回当前总库存
+
+    已有库存（商品 stock 或原有各桶之和）按新的桶数平均分配；
+    stock 不为 None 时改为该库存（分桶商品修改库存需通过这里，直接修改 products.stock 无效）。
+    """
+    product = Product.objects.select_for_update().get(pk=product_id)
+    buckets = list(StockBucket.objects.select_for_update().filter(product_id=product_id).order_by('slot'))
+    if stock is not None:
+        total = stock
+    elif product.stock_stripes:
+        total = sum(bucket.stock for bucket in buckets)
+    else:
+        total = product.stock
+
+    StockBucket.objects.filter(product_id=product_id).delete()
+    if stripes:
+        StockBucket.objects.bulk_create([
+            StockBucket(product_id=product_id, slot=slot, stock=amount)
+            for slot, amount in enumerate(_spread(total, stripes))
+        ])
+    product.stock = total
+    product.stock_stripes = stripes
+    # 经过 save() 同步列表投影、分面和缓存
+    product.save(update_fields=['stock', 'stock_stripes'])
+    return total
+
+
+def take(product_id, quantity):
+    """
+    从分桶商品扣减库存（需在下单事务中调用），返回是否成功
+
+    返回 True 后若当前桶已见底，提交后重新平衡。
+    """
+    locked = -1  # 本事务已加锁的最大 slot，之后只尝试更大的 slot
+    for _ in range(MAX_ATTEMPTS):
+        # 非加锁读：库存足够的桶
+        candidates = list(
+            StockBucket.objects.filter(product_id=product_id, stock__gte=quantity, slot__gt=locked)
+            .values_list('slot', 'stock')
+        )
+        if not candidates:
+            break
+        slot, stock = random.choice(candidates)
+        updated = StockBucket.objects.filter(product_id=product_id, slot=slot, stock__gte=quantity).update(
+            stock=F('stock') - quantity
+        )
+        if updated:
+            if stock - quantity <= 0:
+                transaction.on_commit(lambda: rebalance(product_id))
+            return True
+        locked = slot
+
+    if locked >= 0:
+        # 已持有部分桶的锁，不能再按 slot 从小到大锁定全部桶
+        return False
+    return _take_across(product_id, quantity)
+
+
+def _take_across(product_id, quantity):
+    """没有单个桶足够时：锁定全部桶，总量足够则扣减并重新平均分配"""
+    buckets = list(
+        StockBucket.objects.select_for_update().filter(product_id=product_id).order_by('slot')
+        .values_list('slot', 'stock')
+    )
+    total = sum(stock for _, stock in buckets)
+    if not buckets or total < quantity:
+        return False
+    _set_buckets(product_id, _spread(total - quantity, len(buckets)))
+    return True
+
+
+def give_back(product_id, quantity, stripes):
+    """回补分桶商品的库存（取消订单时），数量平均加到各桶"""
+    StockBucket.objects.filter(product_id=product_id).update(stock=F('stock') + Case(
+        *[When(slot=slot, then=Value(amount)) for slot, amount in enumerate(_spread(quantity, stripes))],
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+
+
+@transaction.atomic
+def rebalance(product_id):
+    """把商品的库存在各桶之间重新平均分配"""
+    buckets = list(
+        StockBucket.objects.select_for_update().filter(product_id=product_id).order_by('slot')
+        .values_list('stock', flat=True)
+    )
+    amounts = _spread(sum(buckets), len(buckets)) if buckets else []
+    if amounts != buckets:
+        _set_buckets(product_id, amounts)
+
+
+def sync_totals():
+    """把分桶商品的汇总库存回写到商品和列表投影（批量 UPDATE），返回商品数
+
+    详情、列表读取时已按桶实时汇总，无需删除详情缓存。
+    """
+    found = totals(Product.objects.filter(stock_stripes__gt=0).values_list('id', flat=True))
+    if not found:
+        return 0
+    stock = Case(
+        *[When(id=product_id, then=Value(total)) for product_id, total in found.items()],
+        output_field=IntegerField(),
+    )
+    with transaction.atomic():
+        Product.objects.filter(id__in=list(found)).update(stock=stock)
+        ProductListing.objects.filter(id__in=list(found)).update(stock=stock)
+    return len(found)
@@ -0,0 +1,139 @@
+"""
+内容寻址媒体存储
+
+上传的图片按内容的 SHA-256 命名，存放在 MEDIA_ROOT/cas/<前2位>/<3-4位>/<哈希><扩展名>：
+- 边写临时文件边计算哈希，不需要二次读取
+- 相同内容只存一份，已存在时直接丢弃临时文件
+- 文件内容与 URL 一一对应、永不改变，可以使用一年的强缓存（immutable）
+"""
+import hashlib
+import os
+import tempfile
+from collections import namedtuple
+
+from django.conf import settings
+
+CAS_DIR = 'cas'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# url：媒体 URL；created：是否为本次新写入（内容此前不存在）
+StoredContent = namedtuple('StoredContent', ['url', 'created'])
+
+
+def _cas_root():
+    return os.path.join(settings.MEDIA_ROOT, CAS_DIR)
+
+
+def relative_path(digest, ext):
+    """哈希 -> 相对 MEDIA_ROOT 的路径"""
+    return f'{CAS_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+
+def is_content_addressed(path):
+    """判断媒体路径（相对 MEDIA_ROOT 或媒体 URL）是否为内容寻址文件"""
+    if path.startswith(settings.MEDIA_URL):
+        path = path[len(settings.MEDIA_URL):]
+    return path.startswith(f'{CAS_DIR}/')
+
+
+def is_immutable(path):
+    """内容寻址文件及其衍生图（derivatives/cas/...）内容永不改变，可使用强缓存"""
+    if path.startswith(settings.MEDIA_URL):
+        path = path[len(settings.MEDIA_URL):]
+    return is_content_addressed(path) or path.startswith(f'derivatives/{CAS_DIR}/')
+
+
+def _place(source_path, digest, ext):
+    """把已写完的文件移动到内容寻址位置（source_path 需与 MEDIA_ROOT 在同一文件系统）"""
+    relative = relative_path(digest, ext.lower())
+    final_path = os.path.join(settings.MEDIA_ROOT, relative)
+    if os.path.exists(final_path):
+        # 内容已存在，跳过写入；更新修改时间，使媒体垃圾回收在宽限期内不处理该文件
+        os.unlink(source_path)
+        os.utime(final_path)
+        return StoredContent(f'{settings.MEDIA_URL}{relative}', False)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.chmod(source_path, 0o644)
+    os.replace(source_path, final_path)
+    return StoredContent(f'{settings.MEDIA_URL}{relative}', True)
+
+
+def store_file(path, ext):
+    """把 MEDIA_ROOT 下已完成的暂存文件（如断点续传的分片合并结果）移入内容寻址存储"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return _place(path, digest.hexdigest(), ext)
+
+
+class ContentWriter:
+    """
+    流式写入一个内容寻址文件
+
+        writer = ContentWriter('.jpg')
+        writer.write(chunk)  # 可多次调用
+        url = writer.commit()  # 或出错时 writer.abort()
+    """
+
+    def __init__(self, ext):
+        self.ext = ext.lower()
+        self.size = 0
+        self.created = False
+        self._hash = hashlib.sha256()
+        tmp_dir = os.path.join(_cas_root(), 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        # 临时文件与目标在同一文件系统，提交时可原子重命名
+        fd, self._tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        """完成写入，返回媒体 URL"""
+        self._file.close()
+        stored = _place(self._tmp_path, self._hash.hexdigest(), self.ext)
+        self.created = stored.created
+        return stored.url
+
+    def abort(self):
+        """放弃写入，删除临时文件"""
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+
+def store_upload(uploaded_file):
+    """保存 Django 上传文件，返回 StoredContent（扩展名取自原文件名）"""
+    # ImageUploadHandler 接收时已写入存储（StoredImageFile），无需再复制
+    if getattr(uploaded_file, 'url', None):
+        return StoredContent(uploaded_file.url, uploaded_file.created)
+    writer = ContentWriter(os.path.splitext(uploaded_file.name)[1])
+    try:
+        for chunk in uploaded_file.chunks():
+            writer.write(chunk)
+    except Exception:
+        writer.abort()
+        raise
+    url = writer.commit()
+    return StoredContent(url, writer.created)
+
+
+def save_upload(uploaded_file):
+    """保存 Django 上传文件，返回媒体 URL"""
+    return store_upload(uploaded_file).url
+
+
+def delete(url):
+    """删除内容寻址文件（调用方需确认已无引用），返回是否删除"""
+    if not is_content_addressed(url):
+        return False
+    path = os.path.join(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):])
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        return False
+    return True
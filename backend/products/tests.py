@@ -1,3 +1,1219 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User as AdminUser
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+
+from ecommerce.counters import CounterBuffer, discard_all
+from ecommerce.media import serve_media
+from . import cache as product_cache, closure, imaging, media, media_gc, search, storage, uploads
+from .admin import ProductImageForm
+from .counters import view_count_buffer
+from .facets import facet_index
+from .models import Category, CategoryClosure, Product, ProductImage, ProductListing, ProductSearchTerm
+from .serializers import ProductListSerializer, ProductListRowSerializer
+from .uploadhandlers import HEADER_MAX_BYTES, upload_errors
+from .views import ProductViewSet
+
+
+def _noise_image(fmt, size, mode='RGB', **options):
+    """随机像素图片（几乎不可压缩，用于生成较大的文件）"""
+    image = Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+class CounterIsolatedTestCase(TestCase):
+    """
+    每个测试结束后丢弃计数写缓冲中未写入的增量
+
+    缓冲是进程全局的，商品 ID 会在测试之间复用，残留的增量会累加到其他测试的商品上。
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(discard_all)
+
+
+class MediaRootTestCase(CounterIsolatedTestCase):
+    """使用临时 MEDIA_ROOT 的测试"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ProductListQueryTests(CounterIsolatedTestCase):
+    """商品列表查询次数与输出格式"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=f'分类{i}') for i in range(3)]
+        for i in range(30):
+            Product.objects.create(
+                category=categories[i % 3],
+                name=f'商品{i}',
+                subtitle=f'副标题{i}' if i % 2 else None,
+                price=Decimal('19.90') + i,
+                original_price=Decimal('29.90') if i % 2 else None,
+                stock=i,
+                sort_order=i % 4,
+            )
+
+    def test_list_query_count_independent_of_page_size(self):
+        # 页码分页：COUNT + 一次列表投影查询
+        for page_size in (1, 10, 30):
+            with self.assertNumQueries(2):
+                response = self.client.get('/api/v1/products/', {'page_size': page_size})
+            self.assertEqual(len(response.json()['data']['results']), page_size)
+
+    def test_cursor_list_query_count(self):
+        for page_size in (1, 10, 30):
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/v1/products/', {'pagination': 'cursor', 'page_size': page_size})
+            self.assertEqual(len(response.json()['data']['results']), page_size)
+
+    def test_fast_path_matches_serializer_output(self):
+        products = Product.objects.filter(status=1).order_by('-sort_order', '-created_at', '-id')
+        rows = ProductListing.objects.filter(status=1).order_by('-sort_order', '-created_at', '-id').values(
+            *ProductListRowSerializer.lookups()
+        )
+        expected = JSONRenderer().render(ProductListSerializer(products, many=True).data)
+        actual = JSONRenderer().render(ProductListRowSerializer().to_representation(rows))
+        self.assertEqual(actual, expected)
+
+
+class KeysetPaginationTests(CounterIsolatedTestCase):
+    """游标分页：各排序方式在排序列有重复值时前后翻页不跳过、不重复"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = [Category.objects.create(name=f'分类{i}') for i in range(2)]
+        base = timezone.now().replace(microsecond=0)
+        for i in range(23):
+            product = Product.objects.create(
+                category=cls.categories[i % 2],
+                name=f'商品{i}',
+                price=Decimal('10.00') + i % 3,
+                stock=1,
+                status=0 if i == 7 else 1,
+                sort_order=i % 2,
+            )
+            # 创建时间只取三个值，与排序值、价格一起制造大量并列
+            created_at = base - timedelta(minutes=i % 3)
+            Product.objects.filter(id=product.id).update(created_at=created_at)
+            ProductListing.objects.filter(id=product.id).update(created_at=created_at)
+
+    def _get(self, url=None, **params):
+        if url is None:
+            response = self.client.get('/api/v1/products/', {'pagination': 'cursor', 'page_size': 4, **params})
+        else:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['data']
+
+    def _expected(self, price_order=None, **filters):
+        ordering = ProductViewSet.KEYSET_ORDERINGS[price_order]
+        return list(ProductListing.objects.filter(status=1, **filters).order_by(*ordering).values_list('id', flat=True))
+
+    def _walk(self, **params):
+        """向后翻到最后一页，再从最后一页向前翻回第一页，返回两次得到的 id 序列"""
+        pages = [self._get(**params)]
+        while pages[-1]['next']:
+            self.assertLess(len(pages), 20, '翻页没有结束')
+            pages.append(self._get(pages[-1]['next']))
+        forward = [row['id'] for page in pages for row in page['results']]
+
+        backward_pages = [pages[-1]]
+        while backward_pages[-1]['previous']:
+            self.assertLess(len(backward_pages), 20, '翻页没有结束')
+            backward_pages.append(self._get(backward_pages[-1]['previous']))
+        backward = [row['id'] for page in reversed(backward_pages) for row in page['results']]
+        self.assertIsNone(backward_pages[-1]['previous'])
+        return forward, backward
+
+    def test_walk_each_ordering(self):
+        for price_order in (None, 'asc', 'desc'):
+            with self.subTest(price_order=price_order):
+                params = {'price_order': price_order} if price_order else {}
+                forward, backward = self._walk(**params)
+                self.assertEqual(forward, self._expected(price_order))
+                self.assertEqual(backward, forward)
+
+    def test_walk_with_category_filter(self):
+        category = self.categories[1]
+        for price_order in (None, 'asc', 'desc'):
+            with self.subTest(price_order=price_order):
+                params = {'category_id': category.id}
+                if price_order:
+                    params['price_order'] = price_order
+                forward, backward = self._walk(**params)
+                self.assertEqual(forward, self._expected(price_order, category_id=category.id))
+                self.assertEqual(backward, forward)
+
+    def test_cursor_from_other_ordering_rejected(self):
+        next_url = self._get()['next']
+        cursor = next_url.split('cursor=')[1].split('&')[0]
+        response = self.client.get('/api/v1/products/', {'cursor': cursor, 'price_order': 'asc'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/api/v1/products/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ImageUploadHandlerTests(MediaRootTestCase):
+    """图片字段流式上传：格式、尺寸识别与逐个文件放弃"""
+
+    def _parse(self, data):
+        request = RequestFactory().post('/', data)
+        request.POST  # 触发解析
+        return request
+
+    def test_large_webp_sizes_read_from_header(self):
+        cases = [
+            ('VP8L', _noise_image('WEBP', (700, 700), lossless=True), (700, 700)),
+            ('VP8 ', _noise_image('WEBP', (1500, 1000), quality=95), (1500, 1000)),
+            ('VP8X', _noise_image('WEBP', (900, 600), mode='RGBA', quality=95), (900, 600)),
+        ]
+        for chunk, content, size in cases:
+            with self.subTest(chunk=chunk):
+                self.assertEqual(content[12:16], chunk.encode())
+                self.assertGreater(len(content), HEADER_MAX_BYTES)
+                request = self._parse({'image': SimpleUploadedFile('a.webp', content, 'image/webp')})
+                self.assertEqual(upload_errors(request), {})
+                uploaded = request.FILES['image']
+                self.assertEqual((uploaded.width, uploaded.height, uploaded.image_format), (*size, 'WEBP'))
+                with open(uploaded.path, 'rb') as f:
+                    self.assertEqual(f.read(), content)
+
+    def test_truncated_image_skips_only_that_file(self):
+        request = self._parse({
+            'image': SimpleUploadedFile('a.png', b'\x89PNG\r\n', 'image/png'),
+            'main_image': SimpleUploadedFile('b.png', _noise_image('PNG', (4, 4)), 'image/png'),
+            'name': '商品',
+        })
+        self.assertEqual(request.POST['name'], '商品')
+        self.assertNotIn('image', request.FILES)
+        self.assertEqual(request.FILES['main_image'].width, 4)
+        self.assertEqual(upload_errors(request), {'image': '无法识别的图片文件'})
+
+    def test_non_image_file_uses_default_handler(self):
+        request = self._parse({
+            'image': SimpleUploadedFile('a.png', b'\x89PNG', 'image/png'),
+            'attachment': SimpleUploadedFile('a.txt', b'hello', 'text/plain'),
+        })
+        self.assertEqual(list(request.FILES), ['attachment'])
+        self.assertEqual(request.FILES['attachment'].read(), b'hello')
+
+
+class SearchTests(CounterIsolatedTestCase):
+    """商品搜索：切分规则、相关度排序、随商品 / 分类变更增量更新索引"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = Category.objects.create(name='手机')
+        cls.cases = Category.objects.create(name='配件')
+        cls.iphone = Product.objects.create(category=cls.phones, name='iPhone 15 手机', subtitle='官方正品', price=Decimal('5999.00'))
+        cls.case = Product.objects.create(category=cls.cases, name='透明保护壳', subtitle='适用 iPhone 15 手机', price=Decimal('29.00'))
+
+    def _search(self, keyword):
+        response = self.client.get('/api/v1/products/search/', {'keyword': keyword})
+        return [item['name'] for item in response.json()['data']]
+
+    def test_index_terms(self):
+        terms = search.index_terms('iPhone15 Pro 手机壳')
+        self.assertTrue({'iphone15', 'iph', 'ipho', 'pro', '手', '手机', '机壳', '壳'} <= terms)
+        # 过短的前缀不建索引，完整的短单词照常索引
+        self.assertFalse({'i', 'ip'} & terms)
+        self.assertIn('5g', search.index_terms('5G 手机'))
+
+    def test_query_terms(self):
+        self.assertEqual(search.query_terms('手机壳'), ['手机', '机壳'])
+        self.assertEqual(search.query_terms('手'), ['手'])
+        # 全角转半角、大写转小写
+        self.assertEqual(search.query_terms('ＩＰＨＯＮＥ　15'), ['iphone', '15'])
+
+    def test_ranking_by_field_weight(self):
+        # 名称命中（权重 3）排在副标题命中（权重 1）之前
+        self.assertEqual(self._search('iphone 手机'), ['iPhone 15 手机', '透明保护壳'])
+        self.assertEqual(self._search('ipho'), ['iPhone 15 手机', '透明保护壳'])
+        self.assertEqual(self._search('保护壳'), ['透明保护壳'])
+        self.assertEqual(self._search('ip'), [])
+
+    def test_index_follows_product_and_category_changes(self):
+        self.case.name = '磁吸手机壳'
+        self.case.save()
+        self.assertEqual(self._search('磁吸'), ['磁吸手机壳'])
+        self.assertEqual(self._search('保护壳'), [])
+
+        self.cases.name = '数码配件'
+        self.cases.save()
+        self.assertEqual(self._search('数码'), ['磁吸手机壳'])
+
+        self.case.delete()
+        self.assertFalse(ProductSearchTerm.objects.filter(product_id=self.case.id).exists())
+        self.assertEqual(self._search('手机'), ['iPhone 15 手机'])
+
+    def test_list_search_param(self):
+        response = self.client.get('/api/v1/products/', {'search': '透明'})
+        self.assertEqual([item['name'] for item in response.json()['data']['results']], ['透明保护壳'])
+
+
+class ProductDetailCacheTests(MediaRootTestCase):
+    """商品详情缓存：命中不查库，变更和计数刷新后失效"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.category = Category.objects.create(name='手机')
+        self.product = Product.objects.create(category=self.category, name='手机A', price=Decimal('99.00'), stock=5)
+        self.url = f'/api/v1/products/{self.product.id}/'
+
+    def _detail(self):
+        return self.client.get(self.url).json()['data']
+
+    def test_cache_hit_without_queries(self):
+        self._detail()
+        with self.assertNumQueries(0):
+            self.assertEqual(self._detail()['name'], '手机A')
+
+    def test_view_count_does_not_drop_after_flush(self):
+        self.assertEqual(self._detail()['view_count'], 1)
+        view_count_buffer.flush()
+        self.assertIsNone(product_cache.get_product_detail(self.product.id))
+        self.assertEqual(self._detail()['view_count'], 2)
+        self.assertEqual(self._detail()['view_count'], 3)
+
+    def test_product_and_category_changes_invalidate(self):
+        self._detail()
+        self.product.price = Decimal('88.00')
+        self.product.save()
+        self.assertEqual(self._detail()['price'], '88.00')
+
+        self.category.name = '智能手机'
+        self.category.save()
+        self.assertEqual(self._detail()['category']['name'], '智能手机')
+
+    def test_image_form_invalidates(self):
+        self._detail()
+        form = ProductImageForm(
+            data={'sort_order': 0, 'image_url': 'pending'},
+            files={'image_file': SimpleUploadedFile('a.png', _noise_image('PNG', (8, 8)), 'image/png')},
+            instance=ProductImage(product=self.product),
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        image = form.save()
+        data = self._detail()
+        self.assertEqual([item['image_url'] for item in data['images']], [image.image_url])
+        self.assertEqual(data['main_image_url'], image.image_url)
+
+    def test_admin_save_invalidates(self):
+        self._detail()
+        admin_user = AdminUser.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin_user)
+        response = self.client.post(f'/admin/products/product/{self.product.id}/change/', {
+            'category': self.category.id, 'name': '手机B', 'subtitle': '', 'detail': '',
+            'price': '99.00', 'original_price': '', 'stock': 5, 'status': 1, 'sort_order': 0,
+            'main_image_url': '',
+            'images-TOTAL_FORMS': 0, 'images-INITIAL_FORMS': 0, 'images-MIN_NUM_FORMS': 0, 'images-MAX_NUM_FORMS': 1000,
+        })
+        self.assertEqual(response.status_code, 302, getattr(response, 'context', None) and response.context['adminform'].form.errors)
+        self.client.logout()
+        self.assertEqual(self._detail()['name'], '手机B')
+
+
+class UploadSessionTests(MediaRootTestCase):
+    """断点续传：分片位置校验、校验失败不写入、完成后保存为商品图片"""
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            category=Category.objects.create(name='手机'), name='手机A', price=Decimal('99.00')
+        )
+        self.content = _noise_image('PNG', (64, 64))
+        response = self.client.post(
+            f'/api/v1/products/{self.product.id}/upload_sessions/',
+            {'filename': 'a.png', 'size': len(self.content)},
+        )
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = response.json()['data']['upload_id']
+        self.url = f'/api/v1/products/{self.product.id}/upload_sessions/{self.upload_id}/'
+
+    def _put(self, start, end, checksum=None, body=None):
+        data = self.content[start:end + 1] if body is None else body
+        return self.client.put(
+            self.url, data, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(self.content)}',
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(data).hexdigest(),
+        )
+
+    def _staged_size(self):
+        return os.path.getsize(uploads.staging_path(self.upload_id))
+
+    def test_offset_mismatch_returns_current_offset(self):
+        self.assertEqual(self._put(0, 99).json()['data']['offset'], 100)
+        for start in (0, 200):
+            response = self._put(start, start + 99)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()['data'], {'offset': 100})
+        self.assertEqual(self._staged_size(), 100)
+
+    def test_checksum_failure_keeps_offset(self):
+        self._put(0, 99)
+        response = self._put(100, 199, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['data'], {'offset': 100})
+        self.assertEqual(self._staged_size(), 100)
+        # 请求体比 Content-Range 短
+        response = self._put(100, 199, body=self.content[100:150])
+        self.assertEqual(response.json()['message'], '分片数据不完整')
+        self.assertEqual(self._staged_size(), 100)
+        self.assertEqual(self._put(100, 199).json()['data']['offset'], 200)
+
+    def test_missing_body(self):
+        response = self.client.put(
+            self.url, HTTP_CONTENT_RANGE=f'bytes 0-99/{len(self.content)}', HTTP_X_CHUNK_SHA256='0' * 64,
+        )
+        self.assertEqual(response.status_code, 411)
+
+    def test_complete(self):
+        complete_url = f'{self.url}complete/'
+        self._put(0, 99)
+        response = self.client.post(complete_url)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['data'], {'offset': 100})
+
+        self._put(100, len(self.content) - 1)
+        response = self.client.post(complete_url)
+        self.assertEqual(response.status_code, 201)
+        image = ProductImage.objects.get(product=self.product)
+        self.assertEqual(response.json()['data']['image_url'], image.image_url)
+        with open(os.path.join(self.media_root, image.image_url[len('/uploads/'):]), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.main_image_url, image.image_url)
+
+        # 重复完成返回同一张图片
+        response = self.client.post(complete_url)
+        self.assertEqual(response.json()['data']['id'], image.id)
+        self.assertEqual(ProductImage.objects.count(), 1)
+
+        # 图片被删除后重复完成返回 410
+        image.delete()
+        response = self.client.post(complete_url)
+        self.assertEqual(response.status_code, 410)
+        self.assertIsNone(response.json()['data'])
+
+    def test_sweep_orphan_staging_files(self):
+        self._put(0, 99)
+        old = time.time() - settings.UPLOAD_SESSION_TTL - 60
+        orphans = []
+        for name in ('orphan1', 'orphan2', 'orphan3'):
+            path = os.path.join(uploads.staging_root(), f'{name}.part')
+            with open(path, 'wb') as f:
+                f.write(b'x' * 10)
+            orphans.append(path)
+        for path in orphans + [uploads.staging_path(self.upload_id)]:
+            os.utime(path, (old, old))
+
+        # 过期会话查询 + 每批一次暂存文件的会话查询
+        with self.assertNumQueries(3):
+            self.assertEqual(uploads.sweep(batch_size=2), (0, 30))
+        for path in orphans:
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(self._staged_size(), 100)
+
+
+class DerivativeTests(MediaRootTestCase):
+    """衍生图：原子写入，后台管理更换主图时不保留旧图的衍生图和元数据"""
+
+    SIZES = {'thumbnail': 16, 'medium': 32}
+    FORMATS = ['webp', 'jpeg']
+
+    def _source(self):
+        path = os.path.join(self.media_root, 'source.png')
+        with open(path, 'wb') as f:
+            f.write(_noise_image('PNG', (64, 48), mode='RGBA'))
+        return path
+
+    def test_generate_derivatives(self):
+        output_dir = os.path.join(self.media_root, 'derivatives', 'source')
+        result = imaging.generate_derivatives(self._source(), output_dir, self.SIZES, self.FORMATS)
+        self.assertEqual(result, imaging.derivative_filenames(self.SIZES, self.FORMATS))
+        self.assertEqual(
+            sorted(os.listdir(output_dir)),
+            ['medium.jpg', 'medium.webp', 'thumbnail.jpg', 'thumbnail.webp'],
+        )
+        with Image.open(os.path.join(output_dir, 'medium.jpg')) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (32, 24)))
+
+    def test_failed_write_keeps_existing_file(self):
+        output_dir = os.path.join(self.media_root, 'derivatives', 'source')
+        os.makedirs(output_dir)
+        existing = os.path.join(output_dir, 'thumbnail.webp')
+        with open(existing, 'wb') as f:
+            f.write(b'old')
+
+        def broken_save(image, fp, *args, **kwargs):
+            fp.write(b'partial')
+            raise OSError('disk full')
+
+        with mock.patch.object(Image.Image, 'save', broken_save), self.assertRaises(OSError):
+            imaging.generate_derivatives(self._source(), output_dir, self.SIZES, self.FORMATS)
+        self.assertEqual(os.listdir(output_dir), ['thumbnail.webp'])
+        with open(existing, 'rb') as f:
+            self.assertEqual(f.read(), b'old')
+
+    def test_admin_main_image_change_resets_media(self):
+        category = Category.objects.create(name='手机')
+        product = Product.objects.create(
+            category=category, name='手机A', price=Decimal('99.00'), main_image_url='/uploads/cas/aa/bb/old.png',
+            main_image_derivatives={'thumbnail': {'webp': '/uploads/derivatives/cas/aa/bb/old/thumbnail.webp'}},
+            main_image_meta={'width': 10, 'height': 10},
+        )
+        other = Product.objects.create(category=category, name='手机B', price=Decimal('99.00'))
+        derivatives = {'thumbnail': {'webp': '/uploads/derivatives/cas/cc/dd/new/thumbnail.webp'}}
+        ProductImage.objects.create(
+            product=other, image_url='/uploads/cas/cc/dd/new.png', derivatives=derivatives,
+            width=20, height=30, file_size=100, image_format='png', dominant_color='#ffffff',
+        )
+        self.client.force_login(AdminUser.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+
+        def change_main_image(url):
+            response = self.client.post(f'/admin/products/product/{product.id}/change/', {
+                'category': category.id, 'name': '手机A', 'subtitle': '', 'detail': '',
+                'price': '99.00', 'original_price': '', 'stock': 0, 'status': 1, 'sort_order': 0,
+                'main_image_url': url,
+                'images-TOTAL_FORMS': 0, 'images-INITIAL_FORMS': 0, 'images-MIN_NUM_FORMS': 0, 'images-MAX_NUM_FORMS': 1000,
+            })
+            self.assertEqual(response.status_code, 302)
+            return Product.objects.get(id=product.id), ProductListing.objects.get(id=product.id)
+
+        # 已有同一图片的衍生图时沿用
+        for row in change_main_image('/uploads/cas/cc/dd/new.png'):
+            self.assertEqual(row.main_image_derivatives, derivatives)
+            self.assertEqual(row.main_image_meta['height'], 30)
+        # 没有时清空，等待后台任务重新生成
+        for row in change_main_image('/uploads/cas/ee/ff/other.png'):
+            self.assertEqual((row.main_image_derivatives, row.main_image_meta), ({}, {}))
+
+
+class ImageProcessingResultTests(MediaRootTestCase):
+    """后台处理结果：元数据提取、写入使用该图片的记录、回调线程中的数据库连接"""
+
+    def setUp(self):
+        super().setUp()
+        self.url = '/uploads/cas/aa/bb/photo.jpg'
+        path = media.url_to_path(self.url)
+        os.makedirs(os.path.dirname(path))
+        # 红色 40x20 图片，EXIF 方向 6（显示时顺时针旋转 90°）
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        Image.new('RGB', (40, 20), (255, 0, 0)).save(path, 'JPEG', exif=exif)
+        self.path = path
+
+    def test_extract_metadata(self):
+        meta = imaging.extract_metadata(self.path)
+        self.assertEqual(
+            {key: meta[key] for key in ('width', 'height', 'file_size', 'image_format')},
+            {'width': 20, 'height': 40, 'file_size': os.path.getsize(self.path), 'image_format': 'jpeg'},
+        )
+        self.assertRegex(meta['dominant_color'], r'^#[0-9a-f]{6}$')
+        self.assertGreater(int(meta['dominant_color'][1:3], 16), 200)
+        self.assertIsNone(imaging.extract_metadata(__file__, strict=False))
+
+    def _result(self):
+        return {'derivatives': {}, 'meta': imaging.extract_metadata(self.path)}
+
+    def test_record_processed(self):
+        product = Product.objects.create(
+            category=Category.objects.create(name='手机'), name='手机A', price=Decimal('99.00'), main_image_url=self.url
+        )
+        image = ProductImage.objects.create(product=product, image_url=self.url)
+        self.assertEqual(media.record_processed(self.url, self._result()), {product.id})
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (20, 40))
+        self.assertEqual(ProductListing.objects.get(id=product.id).main_image_meta, image.metadata())
+
+    def test_record_processed_for_deleted_image(self):
+        # 处理期间图片已被删除：不报错，不写入
+        self.assertEqual(media.record_processed(self.url, self._result()), set())
+
+    def test_done_callback_closes_connections(self):
+        future = mock.Mock()
+        future.result.return_value = self._result()
+        with mock.patch.object(media, '_slots') as slots, \
+                mock.patch.object(media, 'close_old_connections') as close_old_connections, \
+                mock.patch.object(media, 'record_processed', side_effect=RuntimeError) as record_processed, \
+                self.assertLogs('products.media', 'ERROR'):
+            media._on_done(self.url, future)
+        slots.release.assert_called_once()
+        record_processed.assert_called_once_with(self.url, future.result.return_value)
+        self.assertEqual(close_old_connections.call_count, 2)
+
+
+class CategoryTreeCacheTests(CounterIsolatedTestCase):
+    """分类树缓存：稳定时不查库、ETag 条件请求、分类和商品上下架变化后失效"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        product_cache.category_tree_cache.invalidate()
+        self.phones = Category.objects.create(name='手机')
+        self.smart = Category.objects.create(name='智能手机', parent_id=self.phones.id)
+        self.product = Product.objects.create(category=self.smart, name='手机A', price=Decimal('99.00'))
+
+    def _tree(self, **headers):
+        return self.client.get('/api/v1/categories/tree/', **headers)
+
+    def test_tree_served_from_cache(self):
+        response = self._tree()
+        tree = response.json()['data']
+        self.assertEqual([(node['name'], node['product_count']) for node in tree], [('手机', 1)])
+        self.assertEqual([child['name'] for child in tree[0]['children']], ['智能手机'])
+
+        with self.assertNumQueries(0):
+            cached = self._tree()
+        self.assertEqual(cached.json()['data'], tree)
+        with self.assertNumQueries(0):
+            not_modified = self._tree(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_category_changes_invalidate(self):
+        etag = self._tree()['ETag']
+        self.smart.name = '5G 手机'
+        self.smart.save()
+        response = self._tree(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['children'][0]['name'], '5G 手机')
+
+        tablets = Category.objects.create(name='平板', parent_id=self.phones.id)
+        self.assertEqual(len(self._tree().json()['data'][0]['children']), 2)
+        tablets.delete()
+        self.assertEqual([child['name'] for child in self._tree().json()['data'][0]['children']], ['5G 手机'])
+
+        self.smart.is_show = 0
+        self.smart.save()
+        self.assertEqual(self._tree().json()['data'][0]['children'], [])
+        self.assertEqual([item['name'] for item in self.client.get('/api/v1/categories/').json()['data']], ['手机'])
+
+    def test_product_status_change_updates_counts(self):
+        self._tree()
+        self.product.status = 0
+        self.product.save(update_fields=['status'])
+        self.assertEqual(self._tree().json()['data'][0]['product_count'], 0)
+
+        # 只更新浏览量等字段时不失效
+        version = product_cache.category_tree_cache.get()['version']
+        self.product.view_count = 10
+        self.product.save(update_fields=['view_count'])
+        self.assertEqual(product_cache.category_tree_cache.get()['version'], version)
+
+
+class CounterBufferTests(CounterIsolatedTestCase):
+    """计数器写缓冲：累加不访问数据库，刷新时一次批量 UPDATE，失败时保留增量"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        category = Category.objects.create(name='手机')
+        self.products = [
+            Product.objects.create(category=category, name=f'商品{i}', price=Decimal('9.90'), view_count=10)
+            for i in range(3)
+        ]
+        self.buffer = CounterBuffer(Product, 'view_count', flush_interval=3600, max_delta=10 ** 6)
+
+    def _counts(self):
+        return list(Product.objects.order_by('id').values_list('view_count', flat=True))
+
+    def test_incr_and_flush(self):
+        first, second, _ = self.products
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.buffer.incr(first.id)
+            self.buffer.incr(second.id, 5)
+        self.assertEqual((self.buffer.pending(first.id), self.buffer.pending(second.id)), (3, 5))
+        self.assertEqual(self._counts(), [10, 10, 10])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self._counts(), [13, 15, 10])
+        self.assertEqual(self.buffer.pending(first.id), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.buffer.flush(), 0)
+
+    def test_flush_in_batches(self):
+        self.buffer.batch_size = 2
+        for product in self.products:
+            self.buffer.incr(product.id)
+        with self.assertNumQueries(2):
+            self.buffer.flush()
+        self.assertEqual(self._counts(), [11, 11, 11])
+
+    def test_failed_flush_keeps_deltas(self):
+        product = self.products[0]
+        self.buffer.incr(product.id, 2)
+        with mock.patch.object(self.buffer, '_apply', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.buffer.flush()
+        self.buffer.incr(product.id)
+        self.assertEqual(self.buffer.pending(product.id), 3)
+        self.buffer.flush()
+        self.assertEqual(self._counts()[0], 13)
+
+    def test_background_flush_disabled_in_tests(self):
+        self.buffer.incr(self.products[0].id)
+        self.assertIsNone(self.buffer._thread)
+        with override_settings(COUNTER_BACKGROUND_FLUSH=True):
+            buffer = CounterBuffer(Product, 'view_count', flush_interval=3600)
+            buffer.incr(self.products[0].id)
+        self.assertTrue(buffer._thread.daemon)
+        buffer.discard()
+
+    def test_on_flush_receives_written_ids(self):
+        flushed = []
+        buffer = CounterBuffer(Product, 'view_count', flush_interval=3600, on_flush=flushed.extend)
+        buffer.incr(self.products[1].id)
+        buffer.flush()
+        self.assertEqual(flushed, [self.products[1].id])
+
+    def test_retrieve_buffers_view_count(self):
+        product = self.products[0]
+        for expected in (11, 12):
+            self.assertEqual(self.client.get(f'/api/v1/products/{product.id}/').json()['data']['view_count'], expected)
+        product.refresh_from_db()
+        self.assertEqual(product.view_count, 10)
+        view_count_buffer.flush()
+        product.refresh_from_db()
+        self.assertEqual(product.view_count, 12)
+
+
+class ProductBatchTests(CounterIsolatedTestCase):
+    """批量查询：按请求顺序返回、数量上限、不增加浏览量"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='手机')
+        cls.products = [
+            Product.objects.create(category=category, name=f'商品{i}', price=Decimal('9.90'), status=0 if i == 3 else 1)
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def _batch(self, ids):
+        return self.client.get('/api/v1/products/batch/', {'ids': ','.join(str(pk) for pk in ids)})
+
+    def test_results_follow_request_order(self):
+        first, second, third, off_shelf = self.products
+        ids = [third.id, first.id, 999999, third.id, off_shelf.id, second.id]
+        data = self._batch(ids).json()['data']
+        self.assertEqual([item['id'] for item in data['results']], [third.id, first.id, second.id])
+        self.assertEqual(data['missing'], [999999, off_shelf.id])
+        self.assertEqual(view_count_buffer.pending(first.id), 0)
+
+        # 再次查询时找到的商品命中详情缓存，只有不存在 / 已下架的商品查询数据库
+        with self.assertNumQueries(1):
+            cached = self._batch(ids).json()['data']
+        self.assertEqual(cached, data)
+
+    def test_id_cap(self):
+        max_ids = ProductViewSet.BATCH_MAX_IDS
+        self.assertEqual(self._batch(range(1, max_ids + 1)).status_code, 200)
+        response = self._batch(range(1, max_ids + 2))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], f'一次最多查询 {max_ids} 个商品')
+        # 重复的 ID 去重后计数
+        self.assertEqual(self._batch([self.products[0].id] * (max_ids + 1)).status_code, 200)
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get('/api/v1/products/batch/', {'ids': '1,a'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/products/batch/').status_code, 400)
+
+
+class CategoryClosureTests(CounterIsolatedTestCase):
+    """闭包表：子分类筛选、移动 / 删除分类后重建"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.digital = Category.objects.create(name='数码')
+        self.phones = Category.objects.create(name='手机', parent_id=self.digital.id)
+        self.smart = Category.objects.create(name='智能手机', parent_id=self.phones.id)
+        self.appliances = Category.objects.create(name='家电')
+        self.product = Product.objects.create(category=self.smart, name='手机A', price=Decimal('99.00'))
+
+    def _names(self, category, include_descendants=True):
+        params = {'category_id': category.id}
+        if include_descendants:
+            params['include_descendants'] = 1
+        response = self.client.get('/api/v1/products/', params)
+        return [item['name'] for item in response.json()['data']['results']]
+
+    def _descendants(self, category):
+        return set(closure.descendant_ids(category.id).values_list('descendant_id', flat=True))
+
+    def test_build_rows(self):
+        rows = closure.build_rows({1: 0, 2: 1, 3: 2})
+        self.assertEqual(
+            sorted((row.ancestor_id, row.descendant_id, row.depth) for row in rows),
+            [(1, 1, 0), (1, 2, 1), (1, 3, 2), (2, 2, 0), (2, 3, 1), (3, 3, 0)],
+        )
+
+    def test_subtree_filter(self):
+        self.assertEqual(self._descendants(self.digital), {self.digital.id, self.phones.id, self.smart.id})
+        self.assertEqual(self._names(self.digital), ['手机A'])
+        self.assertEqual(self._names(self.digital, include_descendants=False), [])
+        self.assertEqual(self._names(self.smart, include_descendants=False), ['手机A'])
+
+    def test_subtree_after_move(self):
+        self.phones.parent_id = self.appliances.id
+        self.phones.save()
+        self.assertEqual(self._descendants(self.digital), {self.digital.id})
+        self.assertEqual(self._descendants(self.appliances), {self.appliances.id, self.phones.id, self.smart.id})
+        self.assertEqual(self._names(self.digital), [])
+        self.assertEqual(self._names(self.appliances), ['手机A'])
+
+        # 新建的分类接在移动后的位置下
+        tablets = Category.objects.create(name='平板', parent_id=self.phones.id)
+        self.assertIn(tablets.id, self._descendants(self.appliances))
+
+    def test_delete_rebuilds(self):
+        self.smart.parent_id = self.digital.id
+        self.smart.save()
+        self.phones.delete()
+        self.assertFalse(CategoryClosure.objects.filter(descendant_id=self.phones.id).exists())
+        self.assertEqual(self._descendants(self.digital), {self.digital.id, self.smart.id})
+
+
+@override_settings(PRODUCT_FACET_PRICE_BUCKETS=[0, 100, 500])
+class FacetTests(CounterIsolatedTestCase):
+    """分面计数：父分类汇总、价格区间、库存，商品变更和分类移动后更新"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        facet_index.invalidate()
+        self.addCleanup(facet_index.invalidate)
+        self.digital = Category.objects.create(name='数码')
+        self.phones = Category.objects.create(name='手机', parent_id=self.digital.id)
+        self.appliances = Category.objects.create(name='家电')
+        self.cheap = Product.objects.create(category=self.phones, name='手机A', price=Decimal('99.00'), stock=3)
+        self.premium = Product.objects.create(category=self.phones, name='手机B', price=Decimal('999.00'), stock=0)
+        Product.objects.create(category=self.appliances, name='冰箱', price=Decimal('300.00'), stock=1)
+        Product.objects.create(category=self.appliances, name='下架商品', price=Decimal('300.00'), stock=1, status=0)
+
+    def _facets(self, **params):
+        return self.client.get('/api/v1/products/facets/', params).json()['data']
+
+    def _category_counts(self, data):
+        return {item['category_id']: item['count'] for item in data['categories']}
+
+    def test_summary(self):
+        data = self._facets()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(
+            self._category_counts(data),
+            {self.digital.id: 2, self.phones.id: 2, self.appliances.id: 1},
+        )
+        self.assertEqual([item['count'] for item in data['price_ranges']], [1, 1, 1])
+        self.assertEqual(data['stock'], {'in_stock': 2, 'out_of_stock': 1})
+
+        data = self._facets(category_id=self.digital.id, include_descendants=1)
+        self.assertEqual([item['count'] for item in data['price_ranges']], [1, 0, 1])
+        self.assertEqual(self._facets(category_id=self.digital.id)['stock'], {'in_stock': 0, 'out_of_stock': 0})
+
+    def test_incremental_updates(self):
+        self._facets()
+        # 增量更新在事务提交后生效
+        with self.captureOnCommitCallbacks(execute=True):
+            self.premium.stock = 5
+            self.premium.save()
+            self.cheap.status = 0
+            self.cheap.save()
+        data = self._facets()
+        self.assertEqual(data['stock'], {'in_stock': 2, 'out_of_stock': 0})
+        self.assertEqual(self._category_counts(data)[self.digital.id], 1)
+
+    def test_rollup_after_category_move(self):
+        self._facets()
+        self.phones.parent_id = self.appliances.id
+        self.phones.save()
+        counts = self._category_counts(self._facets())
+        self.assertEqual((counts[self.digital.id], counts[self.appliances.id]), (0, 3))
+        data = self._facets(category_id=self.appliances.id, include_descendants=1)
+        self.assertEqual(data['stock'], {'in_stock': 2, 'out_of_stock': 1})
+
+
+    def test_rollup_three_levels(self):
+        android = Category.objects.create(name='安卓手机', parent_id=self.phones.id)
+        Product.objects.create(category=android, name='手机C', price=Decimal('199.00'), stock=2)
+        counts = self._category_counts(self._facets())
+        self.assertEqual(
+            (counts[self.digital.id], counts[self.phones.id], counts[android.id]),
+            (3, 3, 1),
+        )
+        # 与包含子分类的商品列表一致
+        for category in (self.digital, self.phones, android):
+            response = self.client.get('/api/v1/products/', {'category_id': category.id, 'include_descendants': 1})
+            self.assertEqual(response.json()['data']['count'], counts[category.id])
+
+
+class MediaViewTests(MediaRootTestCase):
+    """媒体文件服务：Range、条件请求、缓存头、越界路径"""
+
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/uploads/{storage.relative_path("ab" * 32, ".png")}'
+        self.path = media.url_to_path(self.url)
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        with open(os.path.join(self.media_root, 'logo.png'), 'wb') as f:
+            f.write(b'logo')
+
+    def _get(self, url=None, **headers):
+        return self.client.get(url or self.url, **headers)
+
+    def test_full_response(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['ETag'], f'"{"ab" * 32}"')
+        self.assertEqual(response['Cache-Control'], storage.IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        # 非内容寻址文件使用普通缓存时间
+        with self.settings(MEDIA_CACHE_MAX_AGE=60):
+            self.assertEqual(self._get('/uploads/logo.png')['Cache-Control'], 'public, max-age=60')
+
+    def test_range(self):
+        cases = [('bytes=2-5', 2, 5), ('bytes=1020-', 1020, 1023), ('bytes=-3', 1021, 1023), ('bytes=1000-5000', 1000, 1023)]
+        for header, start, end in cases:
+            with self.subTest(header=header):
+                response = self._get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{len(self.content)}')
+                self.assertEqual(b''.join(response.streaming_content), self.content[start:end + 1])
+
+        for header in ('bytes=1024-', 'bytes=5-2', 'bytes=-0'):
+            with self.subTest(header=header):
+                response = self._get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+        # 多段 Range、If-Range 不匹配时返回完整文件
+        self.assertEqual(self._get(HTTP_RANGE='bytes=0-1,4-5').status_code, 200)
+        self.assertEqual(self._get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"other"').status_code, 200)
+
+    def test_conditional_get(self):
+        response = self._get()
+        not_modified = self._get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(self._get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self._get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_hidden_and_outside_paths(self):
+        os.makedirs(os.path.join(self.media_root, '.upload_sessions'))
+        os.makedirs(os.path.join(self.media_root, 'cas', 'tmp'))
+        for name in ('.upload_sessions/a.part', 'cas/tmp/a.part', '.gc_state.json'):
+            with open(os.path.join(self.media_root, name), 'w') as f:
+                f.write('x')
+        outside = os.path.join(os.path.dirname(self.media_root), f'{os.path.basename(self.media_root)}-secret.txt')
+        with open(outside, 'w') as f:
+            f.write('secret')
+        self.addCleanup(os.unlink, outside)
+
+        request = RequestFactory().get('/')
+        for path in (
+            '.upload_sessions/a.part', 'cas/tmp/a.part', '.gc_state.json', 'cas',
+            f'../{os.path.basename(outside)}', f'cas/../../{os.path.basename(outside)}', outside, 'missing.png',
+        ):
+            with self.subTest(path=path), self.assertRaises(Http404):
+                serve_media(request, path)
+        self.assertEqual(self._get(f'/uploads/%2e%2e/{os.path.basename(outside)}').status_code, 404)
+
+    @override_settings(MEDIA_SERVE_OFFLOAD='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-uploads/')
+    def test_accel_redirect(self):
+        response = self._get()
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-uploads/{self.url[len("/uploads/"):]}')
+        self.assertEqual(response.content, b'')
+
+
+class ContentAddressedStorageTests(MediaRootTestCase):
+    """内容寻址存储：相同内容只存一份，创建商品时重复的图片共用同一文件"""
+
+    def _cas_files(self):
+        """内容寻址存储中的文件名（不含上传临时目录）"""
+        root = os.path.join(self.media_root, 'cas')
+        return sorted(
+            name for path, _, files in os.walk(root) if os.path.basename(path) != 'tmp' for name in files
+        )
+
+    def test_store_upload_dedup(self):
+        content = _noise_image('PNG', (8, 8))
+        first = storage.store_upload(SimpleUploadedFile('a.PNG', content))
+        second = storage.store_upload(SimpleUploadedFile('b.png', content))
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(first, storage.StoredContent(f'/uploads/cas/{digest[:2]}/{digest[2:4]}/{digest}.png', True))
+        self.assertEqual(second, storage.StoredContent(first.url, False))
+        self.assertEqual(len(self._cas_files()), 1)
+        # 临时文件已移走或删除
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'cas', 'tmp')), [])
+
+    def test_create_product_with_duplicate_images(self):
+        category = Category.objects.create(name='手机')
+        main = _noise_image('PNG', (8, 8))
+        other = _noise_image('PNG', (8, 8))
+        response = self.client.post('/api/v1/products/', {
+            'category_id': category.id, 'name': '手机A', 'price': '99.00',
+            'main_image': SimpleUploadedFile('main.png', main, 'image/png'),
+            'images': [
+                SimpleUploadedFile('a.png', other, 'image/png'),
+                SimpleUploadedFile('b.png', main, 'image/png'),
+            ],
+        })
+        self.assertEqual(response.status_code, 201, response.content)
+        data = response.json()['data']
+        urls = [image['image_url'] for image in data['images']]
+        self.assertEqual(len(urls), 3)
+        self.assertEqual(data['main_image_url'], urls[0])
+        self.assertEqual(urls[0], urls[2])
+        self.assertEqual(len(self._cas_files()), 2)
+
+    def test_failed_create_discards_new_files(self):
+        category = Category.objects.create(name='手机')
+        existing = storage.store_upload(SimpleUploadedFile('old.png', _noise_image('PNG', (8, 8))))
+        Product.objects.create(category=category, name='旧商品', price=Decimal('1.00'), main_image_url=existing.url)
+        with open(media.url_to_path(existing.url), 'rb') as f:
+            existing_content = f.read()
+
+        response = self.client.post('/api/v1/products/', {
+            'category_id': category.id, 'name': '手机A', 'price': '99.00',
+            'images': [
+                SimpleUploadedFile('a.png', _noise_image('PNG', (8, 8)), 'image/png'),
+                SimpleUploadedFile('b.png', existing_content, 'image/png'),
+                SimpleUploadedFile('c.bmp', _noise_image('PNG', (8, 8)), 'image/png'),
+            ],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.filter(name='手机A').exists())
+        # 只保留仍被引用的旧文件
+        self.assertEqual(self._cas_files(), [os.path.basename(existing.url)])
+
+    def test_invalid_create_discards_parsed_files(self):
+        category = Category.objects.create(name='手机')
+        # 缺少价格，序列化器校验失败时图片已在解析请求体时写入存储
+        response = self.client.post('/api/v1/products/', {
+            'category_id': category.id, 'name': '手机A',
+            'main_image': SimpleUploadedFile('main.png', _noise_image('PNG', (8, 8)), 'image/png'),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._cas_files(), [])
+
+    def test_rejected_upload_image_discards_parsed_file(self):
+        category = Category.objects.create(name='手机')
+        product = Product.objects.create(category=category, name='手机A', price=Decimal('1.00'))
+        response = self.client.post(f'/api/v1/products/{product.id}/upload_image/', {
+            'image': SimpleUploadedFile('a.bmp', _noise_image('PNG', (8, 8)), 'image/png'),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self._cas_files(), [])
+
+    def test_admin_form_error_discards_parsed_file(self):
+        category = Category.objects.create(name='手机')
+        self.client.force_login(AdminUser.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        # 缺少商品名称，表单重新渲染
+        response = self.client.post('/admin/products/product/add/', {
+            'category': category.id, 'name': '', 'subtitle': '', 'detail': '',
+            'price': '99.00', 'original_price': '', 'stock': 0, 'status': 1, 'sort_order': 0,
+            'main_image_url': '',
+            'main_image_file': SimpleUploadedFile('main.png', _noise_image('PNG', (8, 8)), 'image/png'),
+            'images-TOTAL_FORMS': 0, 'images-INITIAL_FORMS': 0, 'images-MIN_NUM_FORMS': 0, 'images-MAX_NUM_FORMS': 1000,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['adminform'].form.errors)
+        self.assertEqual(self._cas_files(), [])
+
+
+class MediaGarbageCollectorTests(MediaRootTestCase):
+    """媒体垃圾回收：无引用文件先隔离，宽限期后删除，期间又被引用的文件恢复"""
+
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='手机')
+        self.kept = self._file('cas/aa/aa/kept.png')
+        self.orphan = self._file('cas/bb/bb/orphan.png')
+        self.orphan_thumbnail = self._file('derivatives/cas/bb/bb/orphan/thumbnail.webp')
+        self.kept_thumbnail = self._file('derivatives/cas/aa/aa/kept/thumbnail.webp')
+        self.product = Product.objects.create(
+            category=self.category, name='手机A', price=Decimal('1.00'), main_image_url='/uploads/cas/aa/aa/kept.png'
+        )
+
+    def _file(self, relative, age=7200):
+        path = os.path.join(self.media_root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x')
+        os.utime(path, (time.time() - age,) * 2)
+        return path
+
+    def _collect(self, **options):
+        return media_gc.collect(grace_hours=1, **options)
+
+    def _age_quarantine(self):
+        """把隔离批次改为宽限期之前创建"""
+        root = os.path.join(self.media_root, media_gc.QUARANTINE_DIR)
+        for name in os.listdir(root):
+            os.rename(os.path.join(root, name), os.path.join(root, str(int(name) - 7200)))
+
+    def test_quarantine_then_purge(self):
+        fresh = self._file('cas/cc/cc/fresh.png', age=0)
+        stats = self._collect()
+        self.assertEqual((stats['scanned'], stats['quarantined'], stats['finished']), (5, 2, True))
+        for path in (self.kept, self.kept_thumbnail, fresh):
+            self.assertTrue(os.path.exists(path))
+        for path in (self.orphan, self.orphan_thumbnail):
+            self.assertFalse(os.path.exists(path))
+        # 宽限期内隔离的文件不删除
+        self.assertEqual(self._collect()['purged'], 0)
+
+        self._age_quarantine()
+        stats = self._collect()
+        self.assertEqual((stats['purged'], stats['reclaimed_bytes'], stats['restored']), (2, 2, 0))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, media_gc.QUARANTINE_DIR)), [])
+
+    def test_restore_when_referenced_again(self):
+        self._collect()
+        ProductImage.objects.create(product=self.product, image_url='/uploads/cas/bb/bb/orphan.png')
+        self._age_quarantine()
+        stats = self._collect()
+        self.assertEqual((stats['purged'], stats['restored']), (0, 2))
+        self.assertTrue(os.path.exists(self.orphan))
+        self.assertTrue(os.path.exists(self.orphan_thumbnail))
+
+    def test_dry_run_and_resume(self):
+        stats = self._collect(dry_run=True)
+        self.assertEqual(stats['quarantined'], 2)
+        self.assertTrue(os.path.exists(self.orphan))
+
+        # 每轮扫描 2 个文件，从上次的位置继续
+        scanned = []
+        for _ in range(3):
+            stats = self._collect(max_files=2, batch_size=1)
+            scanned.append(stats['scanned'])
+        self.assertEqual(scanned, [2, 2, 0])
+        self.assertTrue(stats['finished'])
+        self.assertFalse(os.path.exists(self.orphan))
+
+
+    def test_skip_file_touched_by_upload_during_check(self):
+        real_unreferenced = media_gc.unreferenced
+
+        def unreferenced(relatives):
+            result = real_unreferenced(relatives)
+            # 引用检查期间上传了相同内容（存储更新已有文件的修改时间）
+            os.utime(self.orphan)
+            return result
+
+        with mock.patch.object(media_gc, 'unreferenced', unreferenced):
+            stats = self._collect()
+        self.assertEqual(stats['quarantined'], 1)
+        self.assertTrue(os.path.exists(self.orphan))
+        self.assertFalse(os.path.exists(self.orphan_thumbnail))
+
+    def test_restore_file_touched_while_moving(self):
+        real_stale_size = media_gc._stale_size
+        touched = []
+
+        def stale_size(path, grace_seconds):
+            size = real_stale_size(path, grace_seconds)
+            # 重新检查之后、移入隔离目录之前上传了相同内容
+            if path == self.orphan and not touched:
+                touched.append(path)
+                os.utime(path)
+            return size
+
+        with mock.patch.object(media_gc, '_stale_size', stale_size):
+            stats = self._collect()
+        self.assertEqual(stats['quarantined'], 1)
+        self.assertTrue(os.path.exists(self.orphan))
+
+
+class ConcurrentStoreTests(MediaRootTestCase):
+    """多图并发保存：按输入顺序返回，任一失败时删除本批新写入且无引用的文件"""
+
+    def _files(self, count):
+        return [SimpleUploadedFile(f'{i}.png', _noise_image('PNG', (8, 8))) for i in range(count)]
+
+    def _exists(self, url):
+        return os.path.exists(media.url_to_path(url))
+
+    def test_results_in_input_order(self):
+        files = self._files(6)
+        threads = set()
+
+        def validate(uploaded_file):
+            threads.add(threading.current_thread().name)
+
+        stored = media.store_uploads(files, validate=validate)
+        expected = [storage.store_upload(SimpleUploadedFile('x.png', f.open().read())).url for f in files]
+        self.assertEqual([item.url for item in stored], expected)
+        self.assertTrue(all(item.created for item in stored))
+        # 多张图片在上传线程池中处理
+        self.assertTrue(all(name.startswith('image-upload') for name in threads))
+
+    def test_failure_discards_new_unreferenced_files(self):
+        referenced = storage.store_upload(self._files(1)[0])
+        Product.objects.create(
+            category=Category.objects.create(name='手机'), name='手机A', price=Decimal('1.00'),
+            main_image_url=referenced.url,
+        )
+        with open(media.url_to_path(referenced.url), 'rb') as f:
+            duplicate = SimpleUploadedFile('dup.png', f.read())
+        files = self._files(3) + [duplicate]
+        new_paths = [storage.relative_path(hashlib.sha256(f.open().read()).hexdigest(), '.png') for f in files[:3]]
+
+        def validate(uploaded_file):
+            if uploaded_file.name == '1.png':
+                raise ValueError('图片无效')
+
+        with self.assertRaisesMessage(ValueError, '图片无效'):
+            media.store_uploads(files, validate=validate)
+        self.assertTrue(self._exists(referenced.url))
+        for relative in new_paths:
+            self.assertFalse(os.path.exists(os.path.join(self.media_root, relative)))
+
+    def test_metadata_in_serializer(self):
+        image = ProductImage.objects.create(
+            product=Product.objects.create(category=Category.objects.create(name='手机'), name='手机A', price=Decimal('1.00')),
+            image_url='/uploads/a.png', width=20, height=10, file_size=100, image_format='png', dominant_color='#ff0000',
+        )
+        data = self.client.get(f'/api/v1/products/{image.product_id}/').json()['data']['images'][0]
+        self.assertEqual(
+            {key: data[key] for key in ProductImage.META_FIELDS},
+            {'width': 20, 'height': 10, 'file_size': 100, 'image_format': 'png', 'dominant_color': '#ff0000'},
+        )
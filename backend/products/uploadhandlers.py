@@ -0,0 +1,263 @@
+"""
+商品图片上传处理器
+
+图片字段的上传数据不经过内存缓冲或临时文件，边接收边写入内容寻址存储：
+- 根据前几个字节（魔数）识别图片格式，非图片立即放弃
+- 用 Pillow 增量解析文件头得到宽高（WebP 直接读取 RIFF 头中的 VP8 / VP8L / VP8X 块），像素数超限立即放弃
+- 累计大小超过上限立即放弃，已写入的临时文件随之删除
+放弃的文件不会出现在 request.FILES 中，原因记录在 request.upload_errors，其余字段照常解析。
+非图片字段交给后续的默认处理器（本模块中的 MemoryFileUploadHandler / TemporaryFileUploadHandler）。
+"""
+import os
+
+from django.conf import settings
+from django.core.files import uploadhandler
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers
+from PIL import ImageFile
+
+from .storage import ContentWriter
+
+# 图片字段名（管理后台内联表单的字段名带前缀，如 images-0-image_file）
+IMAGE_FIELDS = {'image', 'images', 'main_image', 'image_file', 'main_image_file'}
+
+# 魔数 -> (格式, 扩展名)
+SIGNATURES = [
+    (b'\xff\xd8\xff', ('JPEG', '.jpg')),
+    (b'\x89PNG\r\n\x1a\n', ('PNG', '.png')),
+    (b'GIF87a', ('GIF', '.gif')),
+    (b'GIF89a', ('GIF', '.gif')),
+]
+
+HEADER_MIN_BYTES = 12
+# 读取这么多字节仍解析不出宽高（如 JPEG 的 EXIF 过大）则视为无效图片
+HEADER_MAX_BYTES = 512 * 1024
+# RIFF 头（12 字节）+ 首个块头（8 字节）+ 块内宽高字段
+WEBP_HEADER_BYTES = 30
+
+
+def sniff_format(head):
+    """根据文件头识别图片格式，返回 (格式, 扩展名) 或 None"""
+    for signature, result in SIGNATURES:
+        if head.startswith(signature):
+            return result
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP', '.webp'
+    return None
+
+
+def webp_size(head):
+    """
+    从 WebP 文件头读取 (宽, 高)，字节数不够时返回 None，无法识别时抛出 ValueError
+
+    Pillow 的 WebP 解码器要拿到完整文件才给出尺寸，这里按 RIFF 结构直接解析首个块：
+    VP8（有损）、VP8L（无损）、VP8X（扩展格式，含动画、透明通道）。
+    """
+    if len(head) < 20:
+        return None
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        if len(head) < 30:
+            return None
+        if head[23:26] != b'\x9d\x01\x2a':
+            raise ValueError('VP8 起始码错误')
+        return int.from_bytes(head[26:28], 'little') & 0x3fff, int.from_bytes(head[28:30], 'little') & 0x3fff
+    if chunk == b'VP8L':
+        if len(head) < 25:
+            return None
+        if head[20] != 0x2f:
+            raise ValueError('VP8L 签名错误')
+        bits = int.from_bytes(head[21:25], 'little')
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b'VP8X':
+        if len(head) < 30:
+            return None
+        return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+    raise ValueError('未知的 WebP 块')
+
+
+def upload_errors(request):
+    """本次请求中被放弃的图片上传：{字段名: 原因}"""
+    return getattr(request, 'upload_errors', {})
+
+
+class StoredImageFile(UploadedFile):
+    """已写入内容寻址存储的上传图片（storage.save_upload 直接使用其 url，不再复制）"""
+
+    def __init__(self, url, path, created, name, size, content_type, charset, width, height, image_format):
+        super().__init__(file=None, name=name, content_type=content_type, size=size, charset=charset)
+        self.url = url
+        self.created = created
+        self.path = path
+        self.width = width
+        self.height = height
+        self.image_format = image_format
+
+    def temporary_file_path(self):
+        # 供 forms.ImageField 校验时直接打开已保存的文件
+        return self.path
+
+    def open(self, mode='rb'):
+        self.file = open(self.path, mode)
+        return self
+
+    def chunks(self, chunk_size=None):
+        with open(self.path, 'rb') as f:
+            while chunk := f.read(chunk_size or self.DEFAULT_CHUNK_SIZE):
+                yield chunk
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """图片字段的流式上传处理器（需排在 FILE_UPLOAD_HANDLERS 首位）"""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        self.max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+        self._reset()
+
+    def _reset(self):
+        self.active = False
+        self.writer = None
+        self.head = b''
+        self.parser = None
+        self.prefix = b''
+        self.image_format = None
+        self.width = self.height = None
+
+    def new_file(self, field_name, *args, **kwargs):
+        self._abort()
+        super().new_file(field_name, *args, **kwargs)
+        if field_name.rsplit('-', 1)[-1] not in IMAGE_FIELDS:
+            return
+        self.active = True
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+
+        if start + len(raw_data) > self.max_size:
+            self._reject(f'图片文件大小不能超过{self.max_size // (1024 * 1024)}MB')
+
+        if self.writer is None:
+            # 凑够魔数长度后再创建存储文件
+            self.head += raw_data
+            if len(self.head) < HEADER_MIN_BYTES:
+                return None
+            sniffed = sniff_format(self.head)
+            if sniffed is None:
+                self._reject('不支持的图片格式，支持格式：jpg, jpeg, png, gif, webp')
+            self.image_format, ext = sniffed
+            if self.image_format != 'WEBP':
+                self.parser = ImageFile.Parser()
+            self.writer = ContentWriter(ext)
+            raw_data, self.head = self.head, b''
+
+        if self.width is None:
+            self._parse_header(raw_data, start)
+        self.writer.write(raw_data)
+        return None
+
+    def _parse_header(self, data, start):
+        if self.parser is None:
+            # WebP：累积文件头，直接读取宽高
+            self.prefix = (self.prefix + data)[:WEBP_HEADER_BYTES]
+            try:
+                size = webp_size(self.prefix)
+            except ValueError:
+                self._reject('图片文件已损坏')
+            if size is None:
+                return
+        else:
+            try:
+                self.parser.feed(data)
+            except Exception:
+                self._reject('图片文件已损坏')
+            image = self.parser.image
+            if image is None:
+                if start + len(data) >= HEADER_MAX_BYTES:
+                    self._reject('无法识别的图片文件')
+                return
+            size = image.size
+        self.width, self.height = size
+        self.parser = None
+        self.prefix = b''
+        if self.width * self.height > self.max_pixels:
+            self._reject('图片尺寸过大')
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        if self.writer is None or self.width is None:
+            # 文件过短或被截断：只放弃这个文件（此时已不能抛出 SkipFile），后续字段继续解析
+            self._record_error('无法识别的图片文件')
+            self._abort()
+            return None
+        url = self.writer.commit()
+        stored = StoredImageFile(
+            url=url,
+            path=os.path.join(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):]),
+            created=self.writer.created,
+            name=self.file_name,
+            size=file_size,
+            content_type=self.content_type,
+            charset=self.charset,
+            width=self.width,
+            height=self.height,
+            image_format=self.image_format,
+        )
+        self._reset()
+        return stored
+
+    def upload_interrupted(self):
+        self._abort()
+
+    def _record_error(self, message):
+        if self.request is not None:
+            if not hasattr(self.request, 'upload_errors'):
+                self.request.upload_errors = {}
+            self.request.upload_errors.setdefault(self.field_name, message)
+
+    def _reject(self, message):
+        """放弃当前文件：删除已写入部分，记录原因，跳过剩余数据"""
+        self._record_error(message)
+        self._abort()
+        raise SkipFile()
+
+    def _abort(self):
+        if self.writer is not None:
+            self.writer.abort()
+        self._reset()
+
+
+class _CurrentFileOnly:
+    """
+    只在本处理器接收了当前文件时返回文件
+
+    图片字段由 ImageUploadHandler 独占（StopFutureHandlers），被放弃时 file_complete 返回 None，
+    Django 会继续询问后续处理器；默认处理器此时会返回上一个文件或因没有文件而出错。
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.receiving = True
+        super().new_file(*args, **kwargs)
+
+    def file_complete(self, file_size):
+        if not getattr(self, 'receiving', False):
+            return None
+        self.receiving = False
+        return super().file_complete(file_size)
+
+
+class MemoryFileUploadHandler(_CurrentFileOnly, uploadhandler.MemoryFileUploadHandler):
+    """小文件读入内存（非图片字段）"""
+
+
+class TemporaryFileUploadHandler(_CurrentFileOnly, uploadhandler.TemporaryFileUploadHandler):
+    """大文件写入临时文件（非图片字段）"""
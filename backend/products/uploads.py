@@ -0,0 +1,277 @@
+"""
+断点续传上传（大图片、弱网环境）
+
+协议（均在 /api/v1/products/{id}/ 下）：
+1. POST   upload_sessions/                       {filename, size, sort_order} 创建会话，返回 upload_id
+2. PUT    upload_sessions/{upload_id}/           请求体为分片数据，
+          Content-Range: bytes <start>-<end>/<size>，X-Chunk-SHA256: 分片的 SHA-256
+3. GET    upload_sessions/{upload_id}/           查询已接收字节数 offset，断线后从 offset 继续上传
+4. POST   upload_sessions/{upload_id}/complete/  校验并保存为商品图片（可安全重试）
+   DELETE upload_sessions/{upload_id}/           放弃上传
+
+分片先在事务外从请求体读入临时缓冲（超过 1MB 时落盘）并校验 SHA-256，慢速客户端不会占用数据库连接和会话行锁；
+校验通过后再锁定会话、确认位置，追加到暂存文件 MEDIA_ROOT/.upload_sessions/<upload_id>.part。
+完成时整文件移入内容寻址存储（同一文件系统内重命名）。
+过期会话由 sweep_upload_sessions 命令清理。
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import media, storage
+from .models import ProductImage, UploadSession
+from .uploadhandlers import sniff_format
+
+STAGING_DIR = '.upload_sessions'
+ALLOWED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+# 分片读取缓冲超过该大小时写入临时文件
+CHUNK_SPOOL_SIZE = 1024 * 1024
+
+
+class UploadSessionError(Exception):
+    """上传会话错误（status_code 为 HTTP 状态码，data 为附带的响应数据）"""
+
+    def __init__(self, message, status_code=400, data=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.data = data
+
+
+def staging_root():
+    return os.path.join(settings.MEDIA_ROOT, STAGING_DIR)
+
+
+def staging_path(upload_id):
+    return os.path.join(staging_root(), f'{upload_id}.part')
+
+
+def _expires_at():
+    return timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+
+def create_session(product, filename, size, sort_order=0):
+    """创建上传会话和空的暂存文件"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise UploadSessionError(f'不支持的图片格式，支持格式：{", ".join(ALLOWED_EXTENSIONS)}')
+    if size <= 0:
+        raise UploadSessionError('文件大小无效')
+    max_size = settings.UPLOAD_SESSION_MAX_SIZE
+    if size > max_size:
+        raise UploadSessionError(f'图片文件大小不能超过{max_size // (1024 * 1024)}MB')
+
+    session = UploadSession.objects.create(
+        id=uuid.uuid4().hex,
+        product=product,
+        filename=filename,
+        total_size=size,
+        sort_order=sort_order,
+        expires_at=_expires_at(),
+    )
+    os.makedirs(staging_root(), exist_ok=True)
+    open(staging_path(session.id), 'wb').close()
+    return session
+
+
+def get_session(product, upload_id):
+    try:
+        return UploadSession.objects.get(id=upload_id, product=product, expires_at__gt=timezone.now())
+    except UploadSession.DoesNotExist:
+        raise UploadSessionError('上传会话不存在或已过期', status_code=404)
+
+
+def parse_content_range(header):
+    """解析 Content-Range: bytes start-end/total，返回 (start, end, total)"""
+    match = CONTENT_RANGE_RE.match((header or '').strip())
+    if not match:
+        raise UploadSessionError('请提供 Content-Range 请求头（bytes start-end/size）')
+    start, end, total = (int(value) for value in match.groups())
+    if end < start:
+        raise UploadSessionError('Content-Range 无效')
+    return start, end, total
+
+
+def _check_position(session, start, end, total):
+    """检查分片是否接在已接收数据之后"""
+    if session.status != UploadSession.STATUS_UPLOADING:
+        raise UploadSessionError('上传已完成', status_code=409, data={'offset': session.received})
+    if total != session.total_size or end >= session.total_size:
+        raise UploadSessionError('Content-Range 与文件大小不一致')
+    if start != session.received:
+        raise UploadSessionError('分片位置不正确', status_code=409, data={'offset': session.received})
+
+
+def _read_chunk(stream, length, checksum, offset):
+    """从请求体读取一个分片到临时缓冲并校验 SHA-256，返回定位到开头的缓冲"""
+    buffer = tempfile.SpooledTemporaryFile(max_size=CHUNK_SPOOL_SIZE, dir=staging_root())
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        while written < length:
+            data = stream.read(min(64 * 1024, length - written))
+            if not data:
+                break
+            digest.update(data)
+            buffer.write(data)
+            written += len(data)
+        if written != length or digest.hexdigest() != checksum.strip().lower():
+            message = '分片数据不完整' if written != length else '分片校验失败'
+            raise UploadSessionError(message, data={'offset': offset})
+    except BaseException:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+
+def append_chunk(session, content_range, checksum, stream):
+    """
+    把一个分片追加到暂存文件，返回更新后的会话
+
+    分片必须从当前 offset 开始（否则返回 409 和当前 offset，客户端据此续传）；
+    请求体在事务外读取并校验，与 checksum 不一致或不完整时不写入暂存文件。
+    """
+    start, end, total = parse_content_range(content_range)
+    length = end - start + 1
+    if not checksum:
+        raise UploadSessionError('请提供分片校验和（X-Chunk-SHA256）')
+    if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+        raise UploadSessionError(f'分片大小不能超过{settings.UPLOAD_CHUNK_MAX_SIZE // 1024}KB')
+    if stream is None:
+        raise UploadSessionError('请提供分片数据', status_code=411)
+    # 先按未加锁读取的会话检查位置，明显错误时不必读取请求体
+    _check_position(session, start, end, total)
+
+    with _read_chunk(stream, length, checksum, session.received) as chunk:
+        with transaction.atomic():
+            # 锁定会话并重新检查位置（并发上传同一分片时只有一个成功），同一会话的分片串行写入
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            _check_position(session, start, end, total)
+            with open(staging_path(session.id), 'r+b') as f:
+                # 丢弃上次中断时已写入但未确认的数据
+                f.truncate(start)
+                f.seek(start)
+                shutil.copyfileobj(chunk, f, 64 * 1024)
+                f.flush()
+                os.fsync(f.fileno())
+
+            session.received = start + length
+            session.expires_at = _expires_at()
+            session.save(update_fields=['received', 'expires_at', 'updated_at'])
+    return session
+
+
+def _validate_image(path):
+    """校验暂存文件是否为支持的图片，返回存储扩展名"""
+    with open(path, 'rb') as f:
+        sniffed = sniff_format(f.read(16))
+    if sniffed is None:
+        raise UploadSessionError('不支持的图片格式，支持格式：jpg, jpeg, png, gif, webp')
+    try:
+        # 只解析文件头
+        with Image.open(path) as image:
+            width, height = image.size
+    except Exception:
+        raise UploadSessionError('图片文件已损坏')
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise UploadSessionError('图片尺寸过大')
+    return sniffed[1]
+
+
+def complete_session(session):
+    """校验并把暂存文件保存为商品图片；已完成的会话直接返回之前创建的图片（图片已被删除时返回 410）"""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().select_related('product', 'image').get(pk=session.pk)
+        if session.status == UploadSession.STATUS_COMPLETED:
+            if session.image is None:
+                raise UploadSessionError('上传已完成，但图片已被删除', status_code=410)
+            return session.image
+        if session.received != session.total_size:
+            raise UploadSessionError('文件尚未上传完成', status_code=409, data={'offset': session.received})
+
+        path = staging_path(session.id)
+        ext = _validate_image(path)
+        stored = storage.store_file(path, ext)
+        try:
+            # 保存点：写入失败时只回滚图片记录，会话锁仍然保持
+            with transaction.atomic():
+                product = session.product
+                product_image = ProductImage.objects.create(
+                    product=product,
+                    image_url=stored.url,
+                    sort_order=session.sort_order,
+                )
+                # 如果是第一张图片，设置为商品主图
+                if not product.main_image_url:
+                    product.main_image_url = stored.url
+                    product.save(update_fields=['main_image_url'])
+
+                session.status = UploadSession.STATUS_COMPLETED
+                session.image = product_image
+                session.save(update_fields=['status', 'image', 'updated_at'])
+        except Exception:
+            # 恢复暂存文件，客户端可以重试 complete 而无需重新上传
+            shutil.copyfile(media.url_to_path(stored.url), path)
+            media.discard_unreferenced([stored.url])
+            raise
+
+        # 事务提交后在后台生成缩略图等衍生图
+        media.schedule_derivatives(stored.url)
+    return product_image
+
+
+def abort_session(session):
+    """放弃上传，删除暂存文件和会话"""
+    _remove(staging_path(session.id))
+    session.delete()
+
+
+def _remove(path):
+    try:
+        size = os.path.getsize(path)
+        os.unlink(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def sweep(batch_size=500):
+    """清理过期会话及其暂存文件、没有会话的残留暂存文件，返回 (会话数, 释放字节数)"""
+    now = timezone.now()
+    sessions = reclaimed = 0
+    while True:
+        expired = list(UploadSession.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not expired:
+            break
+        for upload_id in expired:
+            reclaimed += _remove(staging_path(upload_id))
+        sessions += UploadSession.objects.filter(id__in=expired).delete()[0]
+
+    root = staging_root()
+    if os.path.isdir(root):
+        cutoff = now.timestamp() - settings.UPLOAD_SESSION_TTL
+        stale = {
+            entry.name.removesuffix('.part'): entry.path
+            for entry in os.scandir(root)
+            if entry.is_file() and entry.stat().st_mtime < cutoff
+        }
+        # 每批一次查询判断哪些暂存文件仍有会话
+        upload_ids = list(stale)
+        for start in range(0, len(upload_ids), batch_size):
+            chunk = upload_ids[start:start + batch_size]
+            live = set(UploadSession.objects.filter(id__in=chunk).values_list('id', flat=True))
+            for upload_id in chunk:
+                if upload_id not in live:
+                    reclaimed += _remove(stale[upload_id])
+    return sessions, reclaimed
@@ -1,21 +1,18 @@
 from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.db.models import Q
-from django.conf import settings
+from django.db import transaction
 import os
-from datetime import datetime
-from .models import Category, Product, ProductImage
-from .serializers import CategorySerializer, ProductListSerializer, ProductDetailSerializer, ProductImageSerializer, ProductCreateSerializer
-
-
-class StandardResultsSetPagination(PageNumberPagination):
-    """标准分页"""
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+from .models import Category, Product, ProductImage, ProductListing
+from .serializers import CategorySerializer, ProductListSerializer, ProductListRowSerializer, ProductDetailSerializer, ProductImageSerializer, ProductCreateSerializer, UploadSessionSerializer
+from .pagination import StandardResultsSetPagination, KeysetPagination
+from .cache import category_tree_cache
+from . import cache as product_cache
+from .counters import view_count_buffer
+from .facets import facet_index
+from .uploadhandlers import upload_errors
+from . import closure, media, stock, storage, uploads, search as product_search
 
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -23,51 +20,30 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.filter(is_show=1).order_by('sort_order', 'id')
     serializer_class = CategorySerializer
     
+    def _cached_response(self, request, data, etag):
+        """返回缓存数据，客户端 ETag 未变化时返回 304"""
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response({
+                'code': 200,
+                'message': 'success',
+                'data': data,
+                'timestamp': None
+            })
+        response['ETag'] = etag
+        return response
+    
     def list(self, request, *args, **kwargs):
-        """分类列表（统一返回格式）"""
-        queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            'code': 200,
-            'message': 'success',
-            'data': serializer.data,
-            'timestamp': None
-        })
+        """分类列表（统一返回格式，读取分类缓存）"""
+        snapshot = category_tree_cache.get()
+        return self._cached_response(request, snapshot['list'], snapshot['list_etag'])
     
     @action(detail=False, methods=['get'])
     def tree(self, request):
-        """获取分类树（最多二级）"""
-        categories = self.queryset.all()
-        
-        # 构建分类树
-        tree = []
-        parent_map = {}
-        
-        # 第一遍：创建所有分类的映射
-        for cat in categories:
-            parent_map[cat.id] = {
-                'id': cat.id,
-                'name': cat.name,
-                'image_url': cat.image_url,
-                'children': []
-            }
-        
-        # 第二遍：构建树结构
-        for cat in categories:
-            if cat.parent_id == 0:
-                # 顶级分类
-                tree.append(parent_map[cat.id])
-            else:
-                # 子分类
-                if cat.parent_id in parent_map:
-                    parent_map[cat.parent_id]['children'].append(parent_map[cat.id])
-        
-        return Response({
-            'code': 200,
-            'message': 'success',
-            'data': tree,
-            'timestamp': None
-        })
+        """获取分类树（最多二级，节点带上架商品数，读取分类缓存）"""
+        snapshot = category_tree_cache.get()
+        return self._cached_response(request, snapshot['tree'], snapshot['tree_etag'])
 
 
 class ProductViewSet(viewsets.ModelViewSet):
@@ -75,16 +51,36 @@ class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all().order_by('-sort_order', '-created_at')
     pagination_class = StandardResultsSetPagination
     
+    # 游标分页的排序键（末位 id 保证唯一）
+    KEYSET_ORDERINGS = {
+        None: ('-sort_order', '-created_at', '-id'),
+        'asc': ('price', 'id'),
+        'desc': ('-price', '-id'),
+    }
+    
+    # 批量查询一次最多的商品数
+    BATCH_MAX_IDS = 200
+    
     def get_queryset(self):
         """根据action返回不同的查询集"""
-        if self.action == 'list' or self.action == 'retrieve' or self.action == 'search':
-            # 列表和详情只显示上架商品
+        if self.action == 'retrieve' or self.action == 'batch':
+            # 详情：分类和图片一次取回（一次关联查询 + 一次图片预取）
+            return (
+                Product.objects.filter(status=1)
+                .select_related('category')
+                .prefetch_related('images')
+            )
+        if self.action == 'list':
+            # 列表读取列表投影（只显示上架商品）
+            return ProductListing.objects.filter(status=1).order_by('-sort_order', '-created_at')
+        if self.action == 'search':
+            # 搜索只显示上架商品
             return Product.objects.filter(status=1).order_by('-sort_order', '-created_at')
         # 创建、更新、删除时显示所有商品
         return Product.objects.all().order_by('-sort_order', '-created_at')
     
     def get_serializer_class(self):
-        if self.action == 'retrieve':
+        if self.action == 'retrieve' or self.action == 'batch':
             return ProductDetailSerializer
         elif self.action == 'create' or self.action == 'update' or self.action == 'partial_update':
             return ProductCreateSerializer
@@ -96,11 +92,22 @@ class ProductViewSet(viewsets.ModelViewSet):
             return [MultiPartParser, FormParser]
         return super().get_parser_classes()
     
+    @media.discard_uploads_on_failure
     def create(self, request, *args, **kwargs):
         """创建商品（支持同时上传图片）"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
+        # 上传时已被拒绝的图片（格式、尺寸或大小不符）
+        errors = upload_errors(request)
+        if errors:
+            return Response({
+                'code': 400,
+                'message': next(iter(errors.values())),
+                'data': None,
+                'timestamp': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
         # 获取分类ID
         category_id = serializer.validated_data.pop('category_id')
         try:
@@ -113,33 +120,45 @@ class ProductViewSet(viewsets.ModelViewSet):
                 'timestamp': None
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # 创建商品
-        product = Product.objects.create(
-            category=category,
-            **serializer.validated_data
-        )
-        
-        # 处理图片上传
-        uploaded_images = []
-        
-        # 处理主图（main_image）
+        # 并发校验、保存图片文件（主图 main_image + 多张图片 images[]），任一失败时删除已写入的文件
         main_image = request.FILES.get('main_image')
-        if main_image:
-            image_url = self._save_image(product, main_image, is_main=True)
-            product.main_image_url = image_url
-            product.save(update_fields=['main_image_url'])
-            uploaded_images.append(image_url)
+        image_files = ([main_image] if main_image else []) + request.FILES.getlist('images')
+        stored = media.store_uploads(image_files, validate=self._validate_image)
+        image_urls = [item.url for item in stored]
         
-        # 处理多张图片（images[]）
-        images = request.FILES.getlist('images')
-        for idx, image_file in enumerate(images):
-            image_url = self._save_image(product, image_file, sort_order=idx)
-            uploaded_images.append(image_url)
+        if main_image:
+            main_image_url = image_urls[0]
+        elif not image_urls:
+            # 没有上传图片但提供了main_image_url，直接使用
+            main_image_url = request.data.get('main_image_url') or None
+        else:
+            main_image_url = None
         
-        # 如果没有上传图片但提供了main_image_url，直接使用
-        if not uploaded_images and request.data.get('main_image_url'):
-            product.main_image_url = request.data.get('main_image_url')
-            product.save(update_fields=['main_image_url'])
+        try:
+            with transaction.atomic():
+                # 创建商品
+                product = Product.objects.create(
+                    category=category,
+                    main_image_url=main_image_url,
+                    **serializer.validated_data
+                )
+                
+                # 一次插入全部商品图片记录（主图 sort_order 为 0，images[] 按上传顺序）
+                gallery_urls = image_urls[1:] if main_image else image_urls
+                image_rows = [
+                    ProductImage(product=product, image_url=image_url, sort_order=idx)
+                    for idx, image_url in enumerate(gallery_urls)
+                ]
+                if main_image:
+                    image_rows.insert(0, ProductImage(product=product, image_url=main_image_url, sort_order=0))
+                ProductImage.objects.bulk_create(image_rows)
+                
+                # 事务提交后在后台生成缩略图等衍生图
+                for image_url in image_urls:
+                    media.schedule_derivatives(image_url)
+        except Exception:
+            media.discard_unreferenced(item.url for item in stored if item.created)
+            raise
         
         # 返回商品详情
         detail_serializer = ProductDetailSerializer(product)
@@ -150,8 +169,9 @@ class ProductViewSet(viewsets.ModelViewSet):
             'timestamp': None
         }, status=status.HTTP_201_CREATED)
     
-    def _save_image(self, product, image_file, is_main=False, sort_order=0):
-        """保存图片的辅助方法"""
+    @staticmethod
+    def _validate_image(image_file):
+        """校验上传图片的格式和大小"""
         # 验证文件类型
         allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
         file_ext = os.path.splitext(image_file.name)[1].lower()
@@ -162,44 +182,24 @@ class ProductViewSet(viewsets.ModelViewSet):
         max_size = 5 * 1024 * 1024  # 5MB
         if image_file.size > max_size:
             raise serializers.ValidationError('图片文件大小不能超过5MB')
-        
-        # 创建上传目录
-        upload_dir = os.path.join(settings.MEDIA_ROOT, 'products', str(product.id))
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # 生成文件名（使用时间戳避免重名）
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        filename = f"{timestamp}_{sort_order}{file_ext}"
-        file_path = os.path.join(upload_dir, filename)
-        
-        # 保存文件
-        with open(file_path, 'wb+') as destination:
-            for chunk in image_file.chunks():
-                destination.write(chunk)
-        
-        # 生成URL
-        image_url = f"{settings.MEDIA_URL}products/{product.id}/{filename}"
-        
-        # 创建商品图片记录
-        ProductImage.objects.create(
-            product=product,
-            image_url=image_url,
-            sort_order=sort_order
-        )
-        
-        return image_url
     
     def retrieve(self, request, *args, **kwargs):
-        """商品详情（增加浏览量）"""
-        instance = self.get_object()
-        instance.view_count += 1
-        instance.save(update_fields=['view_count'])
+        """商品详情（优先读取详情缓存；浏览量写入计数缓冲，由后台批量刷新）"""
+        pk = str(kwargs.get('pk', ''))
+        data = product_cache.get_product_detail(pk) if pk.isdigit() else None
+        if data is None:
+            instance = self.get_object()
+            data = self.get_serializer(instance).data
+            product_cache.set_product_detail(data)
         
-        serializer = self.get_serializer(instance)
+        # 分桶（热点）商品的库存不在缓存中，按桶实时汇总
+        data = stock.apply_totals([dict(data)])[0]
+        view_count_buffer.incr(data['id'])
+        data['view_count'] += view_count_buffer.pending(data['id'])
         return Response({
             'code': 200,
             'message': 'success',
-            'data': serializer.data,
+            'data': data,
             'timestamp': None
         })
     
@@ -207,30 +207,49 @@ class ProductViewSet(viewsets.ModelViewSet):
         """商品列表"""
         queryset = self.filter_queryset(self.get_queryset())
         
-        # 分类筛选
+        # 分类筛选（include_descendants=1 时包含所有子分类，通过闭包表一次关联查询）
         category_id = request.query_params.get('category_id', None)
         if category_id:
-            queryset = queryset.filter(category_id=category_id)
+            if request.query_params.get('include_descendants') in ('1', 'true'):
+                queryset = queryset.filter(category_id__in=closure.descendant_ids(category_id))
+            else:
+                queryset = queryset.filter(category_id=category_id)
         
-        # 搜索
+        # 搜索（倒排索引）
         search = request.query_params.get('search', None)
         if search:
-            queryset = queryset.filter(
-                Q(name__icontains=search) | Q(subtitle__icontains=search)
-            )
+            queryset = product_search.filter_queryset(queryset, search)
         
         # 价格排序
         price_order = request.query_params.get('price_order', None)
+        if price_order not in ('asc', 'desc'):
+            price_order = None
         if price_order == 'asc':
             queryset = queryset.order_by('price')
         elif price_order == 'desc':
             queryset = queryset.order_by('-price')
         
+        # 只查询列表字段（单表查询），并带上游标分页需要的排序列
+        queryset = queryset.values(*ProductListRowSerializer.lookups('sort_order'))
+        row_serializer = ProductListRowSerializer()
+        
+        # 游标分页（?pagination=cursor 或携带 cursor 参数时启用，不执行 COUNT 和 OFFSET）
+        if request.query_params.get('pagination') == 'cursor' or request.query_params.get('cursor'):
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(
+                queryset, request, view=self, ordering=self.KEYSET_ORDERINGS[price_order]
+            )
+            return Response({
+                'code': 200,
+                'message': 'success',
+                'data': paginator.get_paginated_response_data(row_serializer.to_representation(page)),
+                'timestamp': None
+            })
+        
         # 分页
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            paginated_response = self.get_paginated_response(serializer.data)
+            paginated_response = self.get_paginated_response(row_serializer.to_representation(page))
             # 包装分页响应，统一返回格式
             return Response({
                 'code': 200,
@@ -245,11 +264,10 @@ class ProductViewSet(viewsets.ModelViewSet):
             })
         
         # 无分页时直接返回数组
-        serializer = self.get_serializer(queryset, many=True)
         return Response({
             'code': 200,
             'message': 'success',
-            'data': serializer.data,
+            'data': row_serializer.to_representation(queryset),
             'timestamp': None
         })
     
@@ -265,11 +283,10 @@ class ProductViewSet(viewsets.ModelViewSet):
                 'timestamp': None
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        queryset = self.queryset.filter(
-            Q(name__icontains=keyword) | Q(subtitle__icontains=keyword)
-        )[:20]  # 限制返回数量
+        # 按相关度排序，限制返回数量
+        products = product_search.search_products(self.get_queryset(), keyword, limit=20)
         
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = self.get_serializer(products, many=True)
         return Response({
             'code': 200,
             'message': 'success',
@@ -277,7 +294,85 @@ class ProductViewSet(viewsets.ModelViewSet):
             'timestamp': None
         })
     
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """批量获取商品详情（按请求顺序返回，不增加浏览量）"""
+        raw_ids = request.query_params.get('ids', '')
+        try:
+            ids = [int(value) for value in raw_ids.split(',') if value.strip()]
+        except ValueError:
+            return Response({
+                'code': 400,
+                'message': '商品ID格式错误',
+                'data': None,
+                'timestamp': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        ids = list(dict.fromkeys(ids))  # 去重并保持顺序
+        if not ids:
+            return Response({
+                'code': 400,
+                'message': '请提供商品ID',
+                'data': None,
+                'timestamp': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.BATCH_MAX_IDS:
+            return Response({
+                'code': 400,
+                'message': f'一次最多查询 {self.BATCH_MAX_IDS} 个商品',
+                'data': None,
+                'timestamp': None
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # 先读详情缓存，未命中的一次查询取回并回填缓存
+        found = product_cache.get_product_details(ids)
+        missing_ids = [pk for pk in ids if pk not in found]
+        if missing_ids:
+            products = self.get_queryset().filter(id__in=missing_ids)
+            fetched = self.get_serializer(products, many=True).data
+            product_cache.set_product_details(fetched)
+            found.update((item['id'], item) for item in fetched)
+        stock.apply_totals(list(found.values()))
+        
+        return Response({
+            'code': 200,
+            'message': 'success',
+            'data': {
+                'results': [found[pk] for pk in ids if pk in found],
+                'missing': [pk for pk in ids if pk not in found],
+            },
+            'timestamp': None
+        })
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """筛选分面计数（分类、价格区间、有货/缺货），直接读取内存计数"""
+        category_ids = None
+        category_id = request.query_params.get('category_id')
+        if category_id:
+            try:
+                category_ids = [int(category_id)]
+                if request.query_params.get('include_descendants') in ('1', 'true'):
+                    # 子分类取自分类缓存中的闭包数据，不访问数据库
+                    descendants = category_tree_cache.get()['descendants']
+                    category_ids = descendants.get(category_ids[0], category_ids)
+            except ValueError:
+                return Response({
+                    'code': 400,
+                    'message': '分类ID格式错误',
+                    'data': None,
+                    'timestamp': None
+                }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'code': 200,
+            'message': 'success',
+            'data': facet_index.summary(category_ids),
+            'timestamp': None
+        })
+    
     @action(detail=True, methods=['post'], parser_classes=[MultiPartParser, FormParser])
+    @media.discard_uploads_on_failure
     def upload_image(self, request, pk=None):
         """上传商品图片"""
         try:
@@ -287,7 +382,7 @@ class ProductViewSet(viewsets.ModelViewSet):
             if not image_file:
                 return Response({
                     'code': 400,
-                    'message': '请提供图片文件',
+                    'message': upload_errors(request).get('image', '请提供图片文件'),
                     'data': None,
                     'timestamp': None
                 }, status=status.HTTP_400_BAD_REQUEST)
@@ -313,22 +408,8 @@ class ProductViewSet(viewsets.ModelViewSet):
                     'timestamp': None
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # 创建上传目录
-            upload_dir = os.path.join(settings.MEDIA_ROOT, 'products', str(product.id))
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # 生成文件名（使用时间戳避免重名）
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"{timestamp}{file_ext}"
-            file_path = os.path.join(upload_dir, filename)
-            
-            # 保存文件
-            with open(file_path, 'wb+') as destination:
-                for chunk in image_file.chunks():
-                    destination.write(chunk)
-            
-            # 生成URL
-            image_url = f"{settings.MEDIA_URL}products/{product.id}/{filename}"
+            # 保存文件（按内容哈希命名，相同图片只存一份）
+            image_url = storage.save_upload(image_file)
             
             # 获取排序顺序（默认为已有图片数量）
             sort_order = request.data.get('sort_order', product.images.count())
@@ -345,6 +426,9 @@ class ProductViewSet(viewsets.ModelViewSet):
                 product.main_image_url = image_url
                 product.save(update_fields=['main_image_url'])
             
+            # 后台生成缩略图等衍生图
+            media.schedule_derivatives(image_url)
+            
             serializer = ProductImageSerializer(product_image)
             return Response({
                 'code': 200,
@@ -386,7 +470,9 @@ class ProductViewSet(viewsets.ModelViewSet):
             try:
                 product_image = ProductImage.objects.get(id=image_id, product=product)
                 product.main_image_url = product_image.image_url
-                product.save(update_fields=['main_image_url'])
+                product.main_image_derivatives = product_image.derivatives
+                product.main_image_meta = product_image.metadata()
+                product.save(update_fields=['main_image_url', 'main_image_derivatives', 'main_image_meta'])
                 
                 serializer = ProductDetailSerializer(product)
                 return Response({
@@ -417,142 +503,105 @@ class ProductViewSet(viewsets.ModelViewSet):
                 'timestamp': None
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    @action(detail=True, methods=['post'], parser_classes=[MultiPartParser, FormParser])
-    def upload_image(self, request, pk=None):
-        """上传商品图片"""
+    def _upload_session_error(self, e):
+        return Response({
+            'code': e.status_code,
+            'message': e.message,
+            'data': e.data,
+            'timestamp': None
+        }, status=e.status_code)
+    
+    @action(detail=True, methods=['post'], url_path='upload_sessions')
+    def create_upload_session(self, request, pk=None):
+        """创建断点续传上传会话（大图片分片上传）"""
         try:
             product = self.get_object()
-            image_file = request.FILES.get('image')
-            
-            if not image_file:
-                return Response({
-                    'code': 400,
-                    'message': '请提供图片文件',
-                    'data': None,
-                    'timestamp': None
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # 验证文件类型
-            allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
-            file_ext = os.path.splitext(image_file.name)[1].lower()
-            if file_ext not in allowed_extensions:
-                return Response({
-                    'code': 400,
-                    'message': f'不支持的图片格式，支持格式：{", ".join(allowed_extensions)}',
-                    'data': None,
-                    'timestamp': None
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # 验证文件大小（最大5MB）
-            max_size = 5 * 1024 * 1024  # 5MB
-            if image_file.size > max_size:
+            try:
+                size = int(request.data.get('size', 0))
+                sort_order = int(request.data.get('sort_order', product.images.count()))
+            except (TypeError, ValueError):
                 return Response({
                     'code': 400,
-                    'message': '图片文件大小不能超过5MB',
+                    'message': '文件大小或排序参数无效',
                     'data': None,
                     'timestamp': None
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # 创建上传目录
-            upload_dir = os.path.join(settings.MEDIA_ROOT, 'products', str(product.id))
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # 生成文件名（使用时间戳避免重名）
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"{timestamp}{file_ext}"
-            file_path = os.path.join(upload_dir, filename)
-            
-            # 保存文件
-            with open(file_path, 'wb+') as destination:
-                for chunk in image_file.chunks():
-                    destination.write(chunk)
-            
-            # 生成URL
-            image_url = f"{settings.MEDIA_URL}products/{product.id}/{filename}"
-            
-            # 获取排序顺序（默认为已有图片数量）
-            sort_order = request.data.get('sort_order', product.images.count())
-            
-            # 创建商品图片记录
-            product_image = ProductImage.objects.create(
-                product=product,
-                image_url=image_url,
-                sort_order=sort_order
-            )
-            
-            # 如果是第一张图片，设置为商品主图
-            if not product.main_image_url:
-                product.main_image_url = image_url
-                product.save(update_fields=['main_image_url'])
-            
-            serializer = ProductImageSerializer(product_image)
+            session = uploads.create_session(product, request.data.get('filename'), size, sort_order)
             return Response({
                 'code': 200,
-                'message': '图片上传成功',
-                'data': serializer.data,
+                'message': '上传会话已创建',
+                'data': UploadSessionSerializer(session).data,
                 'timestamp': None
             }, status=status.HTTP_201_CREATED)
-            
-        except Product.DoesNotExist:
-            return Response({
-                'code': 404,
-                'message': '商品不存在',
-                'data': None,
-                'timestamp': None
-            }, status=status.HTTP_404_NOT_FOUND)
+        except uploads.UploadSessionError as e:
+            return self._upload_session_error(e)
         except Exception as e:
             return Response({
                 'code': 500,
-                'message': f'上传失败: {str(e)}',
+                'message': f'创建上传会话失败: {str(e)}',
                 'data': None,
                 'timestamp': None
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    @action(detail=True, methods=['patch', 'put'])
-    def set_main_image(self, request, pk=None):
-        """设置商品主图"""
+    @action(detail=True, methods=['get', 'put', 'delete'], url_path=r'upload_sessions/(?P<upload_id>[0-9a-f]{32})')
+    def upload_session(self, request, pk=None, upload_id=None):
+        """
+        断点续传上传会话
+        GET：查询已接收字节数 offset；PUT：上传一个分片（Content-Range + X-Chunk-SHA256）；DELETE：放弃上传
+        """
         try:
-            product = self.get_object()
-            image_id = request.data.get('image_id')
-            
-            if not image_id:
-                return Response({
-                    'code': 400,
-                    'message': '请提供图片ID',
-                    'data': None,
-                    'timestamp': None
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            try:
-                product_image = ProductImage.objects.get(id=image_id, product=product)
-                product.main_image_url = product_image.image_url
-                product.save(update_fields=['main_image_url'])
-                
-                serializer = ProductDetailSerializer(product)
+            session = uploads.get_session(self.get_object(), upload_id)
+            if request.method == 'DELETE':
+                uploads.abort_session(session)
                 return Response({
                     'code': 200,
-                    'message': '主图设置成功',
-                    'data': serializer.data,
-                    'timestamp': None
-                })
-            except ProductImage.DoesNotExist:
-                return Response({
-                    'code': 404,
-                    'message': '图片不存在',
+                    'message': '上传已取消',
                     'data': None,
                     'timestamp': None
-                }, status=status.HTTP_404_NOT_FOUND)
-        except Product.DoesNotExist:
+                })
+            if request.method == 'PUT':
+                # 请求体从输入流分块读取（无请求体时 stream 为 None），不整体读入内存
+                session = uploads.append_chunk(
+                    session,
+                    request.META.get('HTTP_CONTENT_RANGE'),
+                    request.META.get('HTTP_X_CHUNK_SHA256'),
+                    request.stream,
+                )
             return Response({
-                'code': 404,
-                'message': '商品不存在',
+                'code': 200,
+                'message': 'success',
+                'data': UploadSessionSerializer(session).data,
+                'timestamp': None
+            })
+        except uploads.UploadSessionError as e:
+            return self._upload_session_error(e)
+        except Exception as e:
+            return Response({
+                'code': 500,
+                'message': f'上传失败: {str(e)}',
                 'data': None,
                 'timestamp': None
-            }, status=status.HTTP_404_NOT_FOUND)
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=True, methods=['post'], url_path=r'upload_sessions/(?P<upload_id>[0-9a-f]{32})/complete')
+    def complete_upload_session(self, request, pk=None, upload_id=None):
+        """完成断点续传上传，保存为商品图片（重复调用返回同一图片）"""
+        try:
+            session = uploads.get_session(self.get_object(), upload_id)
+            product_image = uploads.complete_session(session)
+            return Response({
+                'code': 200,
+                'message': '图片上传成功',
+                'data': ProductImageSerializer(product_image).data,
+                'timestamp': None
+            }, status=status.HTTP_201_CREATED)
+        except uploads.UploadSessionError as e:
+            return self._upload_session_error(e)
         except Exception as e:
             return Response({
                 'code': 500,
-                'message': f'设置失败: {str(e)}',
+                'message': f'上传失败: {str(e)}',
                 'data': None,
                 'timestamp': None
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)